@@ -0,0 +1,103 @@
+"""
+Benchmark of the per-epoch overhead of checkpointing the training state every epoch: asynchronous
+checkpointing with Trainer(checkpoint_path=...) against a synchronous torch.save of the same state
+at the end of every epoch, relative to training without checkpoints.
+
+The time a save blocks the training loop is reported separately from the change in epoch time: the
+background write of asynchronous checkpoints only overlaps with training given a spare cpu core.
+
+The workload is a wide MLP solution map of a static dataset trained with Adam, so that the
+checkpoint (parameters, best model, and two Adam moments) is large relative to an epoch.
+
+    python benchmarks/checkpoint_overhead.py -nhidden 2048 -epochs 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.callbacks import Callback
+from neuromancer.component import Function
+from neuromancer.constraint import Loss
+from neuromancer.dataset import StaticDataset, split_static_data
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer
+
+
+class EpochTimer(Callback):
+    """Records the wall time of every epoch, optionally saving the training state synchronously."""
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+
+    def begin_train(self, trainer):
+        self.times, self.save_time, self.start = [], 0.0, time.perf_counter()
+
+    def end_epoch(self, trainer, output):
+        if self.path is not None:
+            start = time.perf_counter()
+            torch.save(trainer.state_dict(), self.path)
+            self.save_time += time.perf_counter() - start
+        now = time.perf_counter()
+        self.times.append(now - self.start)
+        self.start = now
+
+
+def train(mode, args, savedir):
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    x = rng.standard_normal((args.nsim, args.nx))
+    samples = {"x": x, "y": np.tanh(x @ rng.standard_normal((args.nx, args.ny)))}
+    loaders = []
+    for name, data in zip(["train", "dev", "test"], split_static_data(samples)):
+        dataset = StaticDataset(data, name=name)
+        loaders.append(DataLoader(dataset, batch_size=args.batch_size, shuffle=name == "train",
+                                  collate_fn=dataset.collate_fn))
+    net = torch.nn.Sequential(
+        torch.nn.Linear(args.nx, args.nhidden), torch.nn.ReLU(),
+        torch.nn.Linear(args.nhidden, args.nhidden), torch.nn.ReLU(),
+        torch.nn.Linear(args.nhidden, args.ny),
+    )
+    problem = Problem([Loss(["yhat_net", "y"], torch.nn.functional.mse_loss, name="loss")], [],
+                      [Function(net, ["x"], ["yhat"], name="net")])
+    path = os.path.join(savedir, f"{mode}.pth")
+    timer = EpochTimer(path if mode == "sync" else None)
+    trainer = Trainer(
+        problem, *loaders, torch.optim.Adam(problem.parameters(), lr=1e-4),
+        logger=BasicLogger(savedir=savedir, verbosity=10 ** 9, stdout=[]), callback=timer,
+        epochs=args.epochs, patience=args.epochs, train_metric="train_loss", dev_metric="dev_loss",
+        test_metric="test_loss", eval_metric="mean_dev_loss",
+        checkpoint_path=path if mode == "async" else None,
+    )
+    trainer.train()
+    if mode == "async":
+        blocking = trainer.checkpointer.blocking_time / trainer.checkpointer.nsaves
+    else:
+        blocking = timer.save_time / args.epochs if mode == "sync" else 0.0
+    size = os.path.getsize(path) / 2 ** 20 if mode != "none" else 0.0
+    return np.median(timer.times[1:]), blocking, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nsim", type=int, default=6000, help="Number of samples.")
+    parser.add_argument("-nx", type=int, default=32, help="Input dimension.")
+    parser.add_argument("-ny", type=int, default=8, help="Output dimension.")
+    parser.add_argument("-nhidden", type=int, default=2048, help="Hidden layer width.")
+    parser.add_argument("-batch_size", type=int, default=128, help="Minibatch size.")
+    parser.add_argument("-epochs", type=int, default=10, help="Training epochs.")
+    parser.add_argument("-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as savedir:
+        results = {mode: train(mode, args, savedir) for mode in ["none", "sync", "async"]}
+    base = results["none"][0]
+    print(f"checkpoint size: {results['async'][2]:.1f} MiB")
+    print(f"{'mode':>6} {'epoch (s)':>10} {'overhead (s)':>13} {'overhead (%)':>13} {'save in loop (s)':>17}")
+    for mode, (t, blocking, _) in results.items():
+        print(f"{mode:>6} {t:>10.3f} {t - base:>13.3f} {100 * (t - base) / base:>12.1f}% {blocking:>17.4f}")
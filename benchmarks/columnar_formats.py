@@ -0,0 +1,80 @@
+"""
+Benchmark of read_file load time and peak memory for CSV, Parquet, Feather, and HDF5 files holding
+the same data. The files also contain unused columns, which the columnar readers skip.
+
+Each load runs in a fresh process so that peak resident memory can be measured in isolation.
+
+    python benchmarks/columnar_formats.py -nrows 1000000 -unused 20
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def write_files(directory, nrows, ncols, nunused, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {v: rng.standard_normal((nrows, n)) for v, n in zip("yud", ncols)}
+    columns = {f"{v}{i}": x[:, i] for v, x in data.items() for i in range(x.shape[1])}
+    columns.update({f"unused{i}": rng.standard_normal(nrows) for i in range(nunused)})
+    frame = pd.DataFrame(columns)
+
+    paths = {ext: os.path.join(directory, "data" + ext) for ext in [".csv", ".parquet", ".feather", ".h5"]}
+    frame.to_csv(paths[".csv"], index=False)
+    frame.to_parquet(paths[".parquet"])
+    frame.to_feather(paths[".feather"])
+    import h5py
+    with h5py.File(paths[".h5"], "w") as f:
+        for v, x in data.items():
+            f[v] = x
+        f["unused"] = np.stack([columns[f"unused{i}"] for i in range(nunused)], axis=1)
+    return paths
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process. ru_maxrss survives fork and exec on Linux, so the
+    high-water mark of the process image (VmHWM) is preferred where available."""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load(path):
+    """Runs in a child process: load a file and report wall time and peak memory increase."""
+    from neuromancer.dataset import read_file
+    import h5py, pyarrow.parquet  # exclude library load from the measurement
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    read_file(path)
+    elapsed = time.perf_counter() - start
+    print(elapsed, peak_rss_mb() - baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nrows", type=int, default=1000000, help="Number of rows.")
+    parser.add_argument("-ncols", type=int, nargs=3, default=[8, 4, 2], help="Number of y, u, d columns.")
+    parser.add_argument("-unused", type=int, default=20, help="Number of columns not read by NeuroMANCER.")
+    parser.add_argument("-load", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load is not None:
+        load(args.load)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_files(tmp, args.nrows, args.ncols, args.unused)
+        print(f"{args.nrows} rows, {sum(args.ncols)} used and {args.unused} unused columns")
+        print(f"{'format':>9} {'file (MB)':>10} {'load (s)':>9} {'peak memory (MB)':>17}")
+        for ext, path in paths.items():
+            out = subprocess.run([sys.executable, __file__, "-load", path], capture_output=True, text=True, check=True)
+            elapsed, peak = map(float, out.stdout.split()[-2:])
+            print(f"{ext[1:]:>9} {os.path.getsize(path) / 2 ** 20:>10.1f} {elapsed:>9.3f} {peak:>17.1f}")
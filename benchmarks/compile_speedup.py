@@ -0,0 +1,60 @@
+"""
+Benchmark of training steps per second of a Problem in eager mode and with Problem(torch_compile=...)
+on the system identification and differentiable predictive control workloads of mixed_precision.py.
+
+A step is a forward pass, backward pass, and Adam update on one training batch. Compilation and
+the eager validation call happen during warmup steps, whose time is reported separately.
+
+    python benchmarks/compile_speedup.py -steps 200 -backend inductor
+"""
+import argparse
+import time
+
+import torch
+
+from mixed_precision import WORKLOADS
+
+
+def steps_per_second(problem, batch, args):
+    optimizer = torch.optim.Adam(problem.parameters(), lr=1e-3)
+    key = f"{batch['name']}_loss"
+
+    def step():
+        optimizer.zero_grad()
+        problem(batch)[key].backward()
+        optimizer.step()
+
+    start = time.perf_counter()
+    for _ in range(args.warmup):
+        step()
+    warmup = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    return args.steps / (time.perf_counter() - start), warmup
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("-nsim", type=int, default=20000, help="Number of time steps or samples.")
+    parser.add_argument("-nsteps", type=int, default=16, help="Rollout horizon.")
+    parser.add_argument("-nhidden", type=int, default=64, help="Hidden layer width.")
+    parser.add_argument("-batch_size", type=int, default=64, help="Minibatch size.")
+    parser.add_argument("-steps", type=int, default=200, help="Timed training steps.")
+    parser.add_argument("-warmup", type=int, default=3, help="Untimed steps for validation and compilation.")
+    parser.add_argument("-backend", default="inductor", help="torch.compile backend.")
+    parser.add_argument("-mode", default=None, help="torch.compile mode, e.g. reduce-overhead.")
+    parser.add_argument("-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'workload':>10} {'eager (steps/s)':>16} {'compiled (steps/s)':>19} {'speedup':>8} {'compile (s)':>12}")
+    for workload in args.workloads:
+        results = []
+        for torch_compile in [False, {"backend": args.backend, "mode": args.mode}]:
+            torch.manual_seed(args.seed)
+            problem, loaders = WORKLOADS[workload](args)
+            problem.torch_compile = torch_compile
+            results.append(steps_per_second(problem, next(iter(loaders[0])), args))
+        (eager, _), (compiled, warmup) = results
+        print(f"{workload:>10} {eager:>16.1f} {compiled:>19.1f} {compiled / eager:>7.2f}x {warmup:>12.1f}")
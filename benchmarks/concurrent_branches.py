@@ -0,0 +1,83 @@
+"""
+Benchmark of a multi-branch Problem executed sequentially and with Problem(concurrent=...).
+
+The Problem has -nbranches independent branches, e.g. several estimators or policies, each an MLP from
+its own input to its own output with an objective on it, and a final component joining all branch
+outputs, so that the branches form one level of the computation graph and run concurrently.
+Intra-op threads are set with -threads so that the branches compete for the same cores as they would
+next to other work; concurrency pays off when single branches do not saturate the cores.
+
+    python benchmarks/concurrent_branches.py -nbranches 4 -workers 3 -threads 1
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from neuromancer.component import Function
+from neuromancer.constraint import Objective, Variable
+from neuromancer.problem import Problem
+
+
+def mlp(nx, nhidden, nlayers):
+    layers = [torch.nn.Linear(nx, nhidden), torch.nn.ReLU()]
+    for _ in range(nlayers - 1):
+        layers += [torch.nn.Linear(nhidden, nhidden), torch.nn.ReLU()]
+    return torch.nn.Sequential(*layers, torch.nn.Linear(nhidden, 1))
+
+
+def branches(args, concurrent):
+    torch.manual_seed(0)
+    components, objectives = [], []
+    for i in range(args.nbranches):
+        components.append(Function(mlp(args.nx, args.nhidden, args.nlayers), [f"x{i}"], ["y"], name=f"b{i}"))
+        objectives.append(Objective(Variable(f"y_b{i}") ** 2, name=f"loss_{i}"))
+    outputs = [f"y_b{i}" for i in range(args.nbranches)]
+    components.append(Function(lambda *y: torch.cat(y, -1).mean(-1), outputs, ["y"], name="join"))
+    objectives.append(Objective(Variable("y_join") ** 2, name="join_loss"))
+    return Problem(objectives, [], components, concurrent=concurrent)
+
+
+def time_steps(problem, data, args, backward):
+    def step():
+        output = problem(data)
+        if backward:
+            output["train_loss"].backward()
+
+    for _ in range(3):
+        step()
+    times = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+        times.append(1e3 * (time.perf_counter() - start) / args.steps)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nbranches", type=int, default=4, help="Number of independent branches.")
+    parser.add_argument("-nx", type=int, default=64, help="Input width of every branch.")
+    parser.add_argument("-nhidden", type=int, default=512, help="Hidden layer width.")
+    parser.add_argument("-nlayers", type=int, default=3, help="Number of hidden layers.")
+    parser.add_argument("-batch_size", type=int, default=1024)
+    parser.add_argument("-workers", type=int, default=None, help="Worker threads, by default nbranches - 1.")
+    parser.add_argument("-threads", type=int, default=None, help="Intra-op threads, by default unchanged.")
+    parser.add_argument("-steps", type=int, default=20, help="Timed steps per repeat.")
+    parser.add_argument("-repeats", type=int, default=3, help="Repeats, of which the fastest is reported.")
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    workers = args.workers or max(args.nbranches - 1, 1)
+
+    data = {f"x{i}": torch.randn(args.batch_size, args.nx) for i in range(args.nbranches)}
+    data["name"] = "train"
+    print(f"{os.cpu_count()} cpus, {torch.get_num_threads()} intra-op threads, {workers} workers")
+    print(f"{'pass':>18} {'sequential (ms)':>16} {'concurrent (ms)':>16} {'speedup':>8}")
+    for backward in [False, True]:
+        sequential = time_steps(branches(args, False), data, args, backward)
+        concurrent = time_steps(branches(args, workers), data, args, backward)
+        name = "forward+backward" if backward else "forward"
+        print(f"{name:>18} {sequential:>16.2f} {concurrent:>16.2f} {sequential / concurrent:>7.2f}x")
@@ -0,0 +1,59 @@
+"""
+Benchmark of minibatch loading throughput for SequenceDataset.
+
+Compares the per-sample path (__getitem__ for every sample followed by default_collate and a
+transpose of every key) with the batch-level path (a single gather in __getitems__).
+
+    python benchmarks/dataset_batching.py -nsim 100000 -nsteps 32 -batch_size 64
+"""
+import argparse
+import time
+
+import numpy as np
+from torch.utils.data import DataLoader, Dataset
+
+from neuromancer.dataset import SequenceDataset
+
+
+class PerSampleDataset(Dataset):
+    """Hides __getitems__ so that DataLoader falls back to per-sample fetching."""
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.collate_fn = dataset.collate_fn
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, i):
+        return self.dataset[i]
+
+
+def samples_per_second(dataset, batch_size, epochs):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, collate_fn=dataset.collate_fn)
+    start = time.perf_counter()
+    nsamples = 0
+    for _ in range(epochs):
+        for batch in loader:
+            nsamples += batch["Yp"].shape[1]
+    return nsamples / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nsim", type=int, default=100000, help="Number of time steps in dataset.")
+    parser.add_argument("-nsteps", type=int, default=32, help="Prediction horizon.")
+    parser.add_argument("-batch_size", type=int, nargs="+", default=[16, 64, 256], help="Minibatch sizes.")
+    parser.add_argument("-moving_horizon", action="store_true", help="Use stride 1 windows.")
+    parser.add_argument("-epochs", type=int, default=1, help="Passes over the dataset per measurement.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = {k: rng.standard_normal((args.nsim, d)) for k, d in {"Y": 4, "X": 8, "U": 2, "D": 2}.items()}
+    dataset = SequenceDataset(data, nsteps=args.nsteps, moving_horizon=args.moving_horizon)
+    print(dataset)
+
+    print(f"{'batch_size':>10} {'per-sample (samples/s)':>24} {'batched (samples/s)':>21} {'speedup':>8}")
+    for batch_size in args.batch_size:
+        slow = samples_per_second(PerSampleDataset(dataset), batch_size, args.epochs)
+        fast = samples_per_second(dataset, batch_size, args.epochs)
+        print(f"{batch_size:>10} {slow:>24.0f} {fast:>21.0f} {fast / slow:>7.1f}x")
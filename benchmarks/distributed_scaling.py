@@ -0,0 +1,91 @@
+"""
+Benchmark of DistributedTrainer scaling with the number of local gloo processes.
+
+A one-step-ahead system identification model (an MLP mapping stacked states and inputs to the next
+state) is trained for a fixed number of epochs on a fixed dataset, so the per-process shard shrinks
+as processes are added (strong scaling). Each process uses a single intra-op thread.
+
+    python benchmarks/distributed_scaling.py -nsamples 200000 -batch_size 512 -workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from neuromancer.component import Function
+from neuromancer.constraint import Loss
+from neuromancer.dataset import StaticDataset
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import DistributedTrainer, get_distributed_dataloader
+
+
+def get_datasets(nsamples, nx, nu, seed=0):
+    rng = np.random.default_rng(seed)
+    A = rng.standard_normal((nx + nu, nx)) / np.sqrt(nx + nu)
+    datasets = []
+    for name in ["train", "dev", "test"]:
+        n = nsamples if name == "train" else nsamples // 10
+        xu = rng.standard_normal((n, nx + nu))
+        datasets.append(StaticDataset({"xu": xu, "xnext": np.tanh(xu @ A)}, name=name))
+    return datasets
+
+
+def run(rank, world_size, init_file, args, result_file):
+    torch.set_num_threads(1)
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    datasets = get_datasets(args.nsamples, args.nx, args.nu)
+    loaders = [get_distributed_dataloader(d, batch_size=args.batch_size // world_size) for d in datasets]
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Linear(args.nx + args.nu, args.nhidden), torch.nn.GELU(),
+        torch.nn.Linear(args.nhidden, args.nhidden), torch.nn.GELU(),
+        torch.nn.Linear(args.nhidden, args.nx),
+    )
+    model = Function(model, ["xu"], ["xhat"], name="ssm")
+    problem = Problem([Loss(["xhat_ssm", "xnext"], torch.nn.functional.mse_loss, name="fit")], [], [model])
+    with tempfile.TemporaryDirectory() as savedir:
+        trainer = DistributedTrainer(
+            problem, *loaders, torch.optim.Adam(problem.parameters(), lr=1e-3),
+            logger=BasicLogger(savedir=savedir, verbosity=10 ** 9, stdout=[]),
+            epochs=args.epochs, patience=args.epochs, train_metric="train_loss", dev_metric="dev_loss",
+            test_metric="test_loss", eval_metric="mean_dev_loss",
+        )
+        dist.barrier()
+        start = time.perf_counter()
+        trainer.train()
+        elapsed = time.perf_counter() - start
+    if rank == 0:
+        with open(result_file, "w") as f:
+            f.write(f"{elapsed} {trainer.best_devloss.item()}")
+    dist.destroy_process_group()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nsamples", type=int, default=200000, help="Number of training samples.")
+    parser.add_argument("-nx", type=int, default=16, help="Number of states.")
+    parser.add_argument("-nu", type=int, default=4, help="Number of inputs.")
+    parser.add_argument("-nhidden", type=int, default=128, help="Hidden layer width.")
+    parser.add_argument("-batch_size", type=int, default=512, help="Global batch size.")
+    parser.add_argument("-epochs", type=int, default=3, help="Training epochs.")
+    parser.add_argument("-workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Process counts to measure.")
+    args = parser.parse_args()
+
+    print(f"{args.nsamples} samples, global batch size {args.batch_size}, {os.cpu_count()} cpus")
+    print(f"{'workers':>8} {'train (s)':>10} {'samples/s':>10} {'speedup':>8} {'best dev loss':>14}")
+    serial = None
+    for workers in sorted(set(args.workers)):
+        with tempfile.TemporaryDirectory() as tmp:
+            result_file = os.path.join(tmp, "result")
+            mp.spawn(run, args=(workers, os.path.join(tmp, "init"), args, result_file), nprocs=workers)
+            with open(result_file) as f:
+                elapsed, devloss = map(float, f.read().split())
+        serial = serial or elapsed
+        throughput = args.epochs * args.nsamples / elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {throughput:>10.0f} {serial / elapsed:>7.2f}x {devloss:>14.5f}")
@@ -0,0 +1,80 @@
+"""
+Benchmark of EnsembleTrainer throughput against training the same ensemble members one after
+another with Trainer.
+
+Members are small MLP regression problems trained on the same minibatches for a fixed number of
+epochs, with early stopping disabled so both paths do the same amount of work.
+
+    python benchmarks/ensemble_training.py -members 10 30 100 -epochs 5
+"""
+import argparse
+import functools
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.component import Function
+from neuromancer.constraint import Loss
+from neuromancer.dataset import StaticDataset
+from neuromancer.ensemble import EnsembleTrainer
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer
+
+
+def get_loaders(nsamples, nx, ny, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    weight = rng.standard_normal((nx, ny))
+    loaders = []
+    for name in ["train", "dev", "test"]:
+        x = rng.standard_normal((nsamples, nx))
+        dataset = StaticDataset({"x": x, "y": np.tanh(x @ weight)}, name=name)
+        loaders.append(DataLoader(dataset, batch_size=batch_size, collate_fn=dataset.collate_fn))
+    return loaders
+
+
+def get_problem(nx, ny, nhidden, seed):
+    torch.manual_seed(seed)
+    net = torch.nn.Sequential(
+        torch.nn.Linear(nx, nhidden), torch.nn.Tanh(), torch.nn.Linear(nhidden, ny),
+    )
+    model = Function(net, ["x"], ["yhat"], name="model")
+    return Problem([Loss(["yhat_model", "y"], torch.nn.functional.mse_loss, name="fit")], [], [model])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-members", type=int, nargs="+", default=[10, 30, 100], help="Ensemble sizes.")
+    parser.add_argument("-nsamples", type=int, default=4096, help="Number of samples per split.")
+    parser.add_argument("-nx", type=int, default=8, help="Input dimension.")
+    parser.add_argument("-ny", type=int, default=4, help="Output dimension.")
+    parser.add_argument("-nhidden", type=int, default=32, help="Hidden layer width.")
+    parser.add_argument("-batch_size", type=int, default=64, help="Minibatch size.")
+    parser.add_argument("-epochs", type=int, default=5, help="Training epochs.")
+    args = parser.parse_args()
+
+    loaders = get_loaders(args.nsamples, args.nx, args.ny, args.batch_size)
+    kwargs = dict(epochs=args.epochs, patience=args.epochs, train_metric="train_loss", dev_metric="dev_loss",
+                  test_metric="test_loss", eval_metric="mean_dev_loss")
+    print(f"{'members':>8} {'serial (s)':>11} {'ensemble (s)':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = BasicLogger(savedir=tmp, verbosity=10 ** 9, stdout=[])
+        logger.log_parameters = logger.log_weights = lambda *args: None
+        for nmembers in args.members:
+            problems = [get_problem(args.nx, args.ny, args.nhidden, seed) for seed in range(nmembers)]
+            start = time.perf_counter()
+            for problem in problems:
+                optimizer = torch.optim.Adam(problem.parameters(), lr=1e-3)
+                Trainer(problem, *loaders, optimizer, logger=logger, **kwargs).train()
+            serial = time.perf_counter() - start
+
+            problems = [get_problem(args.nx, args.ny, args.nhidden, seed) for seed in range(nmembers)]
+            start = time.perf_counter()
+            EnsembleTrainer(
+                problems, *loaders, optimizer=functools.partial(torch.optim.Adam, lr=1e-3), logger=logger, **kwargs,
+            ).train()
+            ensemble = time.perf_counter() - start
+            print(f"{nmembers:>8} {serial:>11.2f} {ensemble:>13.2f} {serial / ensemble:>7.1f}x")
@@ -0,0 +1,166 @@
+"""
+Benchmark of time-to-target-loss for full-batch training of the parametric programming examples
+(mpQP_nm_1 and mpLP_nm_1) with Adam, L-BFGS, and a hybrid Adam -> L-BFGS schedule.
+
+The solution maps are MLPs wrapped in Function components. Every method trains for the same wall
+time budget; the target is the best final training loss reached by any method relaxed by -rtol,
+and the time and number of loss evaluations each method needs to first reach it are reported.
+
+    python benchmarks/lbfgs_time_to_target.py -budget 30 -rtol 0.01
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.callbacks import Callback, OptimizerSwitch
+from neuromancer.component import Function
+from neuromancer.constraint import Objective, Variable
+from neuromancer.dataset import StaticDataset, split_static_data
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer
+
+
+def mpqp(nsim, seed):
+    """minimize x^2 + y^2 subject to x + y - p >= 0"""
+    rng = np.random.default_rng(seed)
+    samples = {"p": rng.uniform(5.0, 15.0, size=(nsim, 1))}
+    sol = Variable("sol_sol_map")
+    x, y, p = sol[:, [0]], sol[:, [1]], Variable("p")
+    objectives = [Objective(x ** 2 + y ** 2, name="loss")]
+    constraints = [20.0 * (x + y - p >= 0)]
+    return samples, objectives, constraints
+
+
+def mplp(nsim, seed):
+    """minimize a1*x + a2*y subject to x + y - p1 >= 0, -2x + y + p2 >= 0, x - 2y + p3 >= 0"""
+    rng = np.random.default_rng(seed)
+    samples = {
+        "a1": rng.uniform(0.1, 1.5, size=(nsim, 1)),
+        "a2": rng.uniform(0.1, 2.0, size=(nsim, 1)),
+        **{p: rng.uniform(5.0, 10.0, size=(nsim, 1)) for p in ["p1", "p2", "p3"]},
+    }
+    sol = Variable("sol_sol_map")
+    x, y = sol[:, [0]], sol[:, [1]]
+    a1, a2, p1, p2, p3 = [Variable(k) for k in ["a1", "a2", "p1", "p2", "p3"]]
+    objectives = [Objective(a1 * x + a2 * y, name="loss")]
+    constraints = [
+        2.0 * (x + y - p1 >= 0),
+        2.0 * (-2 * x + y + p2 >= 0),
+        2.0 * (x - 2 * y + p3 >= 0),
+    ]
+    return samples, objectives, constraints
+
+
+PROBLEMS = {"mpQP": mpqp, "mpLP": mplp}
+
+
+class SolutionMap(torch.nn.Module):
+    """MLP from the stacked problem parameters to the decision variables."""
+    def __init__(self, nparams, nhidden):
+        super().__init__()
+        self.net = torch.nn.Sequential(
+            torch.nn.Linear(nparams, nhidden), torch.nn.Tanh(),
+            torch.nn.Linear(nhidden, nhidden), torch.nn.Tanh(),
+            torch.nn.Linear(nhidden, 2),
+        )
+
+    def forward(self, *params):
+        return self.net(torch.cat(params, dim=-1))
+
+
+class Recorder(Callback):
+    """Records the epoch mean training loss, cumulative loss evaluations, and wall time, and stops
+    training by exhausting patience once the time budget is used."""
+    def __init__(self, budget):
+        super().__init__()
+        self.budget, self.history = budget, []
+
+    def begin_train(self, trainer):
+        self.start, self.nevals = time.perf_counter(), 0
+        trainer.model.register_forward_pre_hook(self.count)
+
+    def count(self, module, inputs):
+        self.nevals += inputs[0]["name"] == "train"
+
+    def end_epoch(self, trainer, output):
+        elapsed = time.perf_counter() - self.start
+        self.history.append((elapsed, self.nevals, output["mean_train_loss"].item()))
+        if elapsed > self.budget:
+            trainer.badcount = trainer.patience + 1
+
+
+class CallbackList(Callback):
+    """Dispatches the begin_train and end_epoch waypoints to several callbacks."""
+    def __init__(self, *callbacks):
+        super().__init__()
+        self.callbacks = callbacks
+
+    def begin_train(self, trainer):
+        for c in self.callbacks:
+            c.begin_train(trainer)
+
+    def end_epoch(self, trainer, output):
+        for c in self.callbacks:
+            c.end_epoch(trainer, output)
+
+
+def train(name, method, args):
+    samples, objectives, constraints = PROBLEMS[name](args.nsim, args.seed)
+    loaders = []
+    for split, data in zip(["train", "dev", "test"], split_static_data(samples)):
+        dataset = StaticDataset(data, name=split)
+        loaders.append(DataLoader(dataset, batch_size=len(dataset), collate_fn=dataset.collate_fn))
+    torch.manual_seed(args.seed)
+    keys = list(samples)
+    sol_map = Function(SolutionMap(len(keys), args.nx_hidden), keys, ["sol"], name="sol_map")
+    problem = Problem(objectives, constraints, [sol_map])
+
+    lbfgs = lambda params: torch.optim.LBFGS(params, lr=1.0, max_iter=20, history_size=20,
+                                             line_search_fn="strong_wolfe")
+    recorder = Recorder(args.budget)
+    callback = recorder
+    if method == "lbfgs":
+        optimizer = lbfgs(problem.parameters())
+    else:
+        optimizer = torch.optim.Adam(problem.parameters(), lr=args.lr)
+        if method == "hybrid":
+            callback = CallbackList(recorder, OptimizerSwitch(lbfgs, epoch=args.switch_epoch))
+    with tempfile.TemporaryDirectory() as savedir:
+        logger = BasicLogger(savedir=savedir, verbosity=10 ** 9, stdout=[])
+        trainer = Trainer(
+            problem, *loaders, optimizer, logger=logger, callback=callback, epochs=10 ** 9,
+            patience=10 ** 9, train_metric="train_loss", dev_metric="dev_loss", test_metric="test_loss",
+            eval_metric="dev_loss",
+        )
+        trainer.train()
+    return recorder.history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-problems", nargs="+", default=list(PROBLEMS), choices=list(PROBLEMS))
+    parser.add_argument("-nsim", type=int, default=10000, help="Number of sampled parameters.")
+    parser.add_argument("-nx_hidden", type=int, default=40, help="Hidden layer width of the solution map.")
+    parser.add_argument("-lr", type=float, default=0.001, help="Adam step size.")
+    parser.add_argument("-switch_epoch", type=int, default=200, help="Epoch of the hybrid switch to L-BFGS.")
+    parser.add_argument("-budget", type=float, default=30.0, help="Training wall time per method in seconds.")
+    parser.add_argument("-rtol", type=float, default=0.01, help="Relative tolerance of the target loss.")
+    parser.add_argument("-seed", type=int, default=408)
+    args = parser.parse_args()
+
+    methods = ["adam", "lbfgs", "hybrid"]
+    for name in args.problems:
+        histories = {method: train(name, method, args) for method in methods}
+        best = min(h[-1][2] for h in histories.values())
+        target = best + args.rtol * abs(best)
+        print(f"{name}: target train loss {target:.5f}")
+        print(f"{'method':>8} {'final loss':>11} {'time (s)':>9} {'loss evals':>11}")
+        for method, history in histories.items():
+            hit = next(((t, n) for t, n, loss in history if loss <= target), None)
+            t, n = (f"{hit[0]:.2f}", str(hit[1])) if hit else ("-", "-")
+            print(f"{method:>8} {history[-1][2]:>11.5f} {t:>9} {n:>11}")
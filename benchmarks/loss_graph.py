@@ -0,0 +1,75 @@
+"""
+Benchmark of the loss evaluation of a Problem with hundreds of constraints on shared subexpressions, evaluating
+every term separately, with Problem(loss_graph=True), and with constraints evaluated in vectorized groups by
+Problem(loss_graph={"group_constraints": True}).
+
+Following the parametric programming examples, a linear solution map gives x from theta, and every row of
+A x <= b + E theta is a separate pair of box constraints, written as (x @ A.t())[:, [i]] <= ... as a user would.
+Evaluated term by term, x @ A.t() and theta @ E.t() are recomputed for every constraint; the loss graph computes
+them once per step, and grouping evaluates the penalties of all 2 * ncons constraints with one kernel each.
+
+    python benchmarks/loss_graph.py -ncons 200 -steps 50
+"""
+import argparse
+import time
+
+import torch
+
+from neuromancer.component import Function
+from neuromancer.constraint import Variable
+from neuromancer.problem import Problem
+
+
+def mp_problem(args, loss_graph):
+    torch.manual_seed(0)
+    A, E = torch.randn(args.ncons, args.nx), torch.randn(args.ncons, args.ntheta)
+    b = torch.rand(args.ncons)
+    sol_map = Function(torch.nn.Linear(args.ntheta, args.nx), ["theta"], ["x"], name="sol_map")
+    x, theta = Variable("x_sol_map"), Variable("theta")
+    objectives = [(x ** 2).minimize(name="obj")]
+    constraints = []
+    for i in range(args.ncons):
+        constraints.append((x @ A.t())[:, [i]] <= b[i].item() + (theta @ E.t())[:, [i]])
+        constraints.append((x @ A.t())[:, [i]] >= -b[i].item() - (theta @ E.t())[:, [i]])
+        constraints[-2].name, constraints[-1].name = f"upper_{i}", f"lower_{i}"
+    return Problem(objectives, constraints, [sol_map], loss_graph=loss_graph)
+
+
+def time_steps(problem, data, args, backward):
+    def step():
+        output = problem(data)
+        if backward:
+            output["train_loss"].backward()
+
+    for _ in range(3):
+        step()
+    times = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+        times.append(1e3 * (time.perf_counter() - start) / args.steps)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-ncons", type=int, default=200, help="Number of rows of A, each giving two constraints.")
+    parser.add_argument("-nx", type=int, default=20, help="Number of decision variables.")
+    parser.add_argument("-ntheta", type=int, default=10, help="Number of parameters.")
+    parser.add_argument("-batch_size", type=int, default=256)
+    parser.add_argument("-steps", type=int, default=50, help="Timed steps per repeat.")
+    parser.add_argument("-repeats", type=int, default=3, help="Repeats, of which the fastest is reported.")
+    args = parser.parse_args()
+
+    data = {"theta": torch.randn(args.batch_size, args.ntheta), "name": "train"}
+    problems = [mp_problem(args, False), mp_problem(args, True), mp_problem(args, {"group_constraints": True})]
+    outputs = [problem(data) for problem in problems]
+    assert all(torch.allclose(outputs[0]["train_loss"], out["train_loss"]) for out in outputs[1:])
+    graph = next(iter(problems[1]._loss_graphs.values()))
+    print(f"{2 * args.ncons} constraints: {len(outputs[0])} output keys, {graph.nslots} loss graph nodes")
+    print(f"{'pass':>18} {'terms (ms)':>11} {'loss graph (ms)':>16} {'grouped (ms)':>13} {'speedup':>8}")
+    for backward in [False, True]:
+        eager, fused, grouped = (time_steps(problem, data, args, backward) for problem in problems)
+        name = "forward+backward" if backward else "forward"
+        print(f"{name:>18} {eager:>11.2f} {fused:>16.2f} {grouped:>13.2f} {eager / grouped:>7.2f}x")
@@ -0,0 +1,96 @@
+"""
+Benchmark of peak memory and epoch time of full batch training with gradient accumulation over
+micro-batches, against full batch training without micro-batching.
+
+The workload is system identification of a neural state space model by N-step rollouts on a
+SequenceDataset with a single full batch. Every configuration runs in a fresh process, whose
+peak resident memory is reported (and peak allocated CUDA memory with -device cuda).
+
+    python benchmarks/micro_batching.py -micro_batch_sizes 0 1024 256 64
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.component import Function
+from neuromancer.constraint import Loss
+from neuromancer.dataset import SequenceDataset, split_sequence_data
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer
+
+
+class SSMRollout(torch.nn.Module):
+    """Residual neural state space model rolled out from the last observed state over future inputs."""
+    def __init__(self, nx, nu, nhidden):
+        super().__init__()
+        self.fx = torch.nn.Sequential(
+            torch.nn.Linear(nx + nu, nhidden), torch.nn.GELU(),
+            torch.nn.Linear(nhidden, nhidden), torch.nn.GELU(),
+            torch.nn.Linear(nhidden, nx),
+        )
+
+    def forward(self, Yp, Uf):
+        x, X = Yp[-1], []
+        for u in Uf:
+            x = x + self.fx(torch.cat([x, u], dim=-1))
+            X.append(x)
+        return torch.stack(X)
+
+
+def train(micro_batch_size, args, queue):
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    nx, nu = 8, 2
+    U = rng.uniform(-1, 1, size=(args.nsim, nu))
+    X = np.cumsum(0.1 * rng.standard_normal((args.nsim, nx)), axis=0)
+    loaders = []
+    for name, data in zip(["train", "dev", "test"], split_sequence_data({"Y": X, "U": U}, args.nsteps)):
+        dataset = SequenceDataset(data, nsteps=args.nsteps, name=name)
+        loaders.append(DataLoader(dataset, batch_size=len(dataset), collate_fn=dataset.collate_fn))
+    ssm = Function(SSMRollout(nx, nu, args.nhidden), ["Yp", "Uf"], ["yhat"], name="ssm")
+    problem = Problem([Loss(["Yf", "yhat_ssm"], torch.nn.functional.mse_loss, name="loss")], [], [ssm])
+    problem.to(args.device)
+    with tempfile.TemporaryDirectory() as savedir:
+        trainer = Trainer(
+            problem, *loaders, torch.optim.Adam(problem.parameters(), lr=1e-3),
+            logger=BasicLogger(savedir=savedir, verbosity=10 ** 9, stdout=[]), epochs=args.epochs,
+            patience=args.epochs, train_metric="nstep_train_loss", dev_metric="nstep_dev_loss",
+            test_metric="nstep_test_loss", eval_metric="mean_nstep_dev_loss", device=args.device,
+            micro_batch_size=micro_batch_size or None,
+        )
+        start = time.perf_counter()
+        trainer.train()
+        elapsed = (time.perf_counter() - start) / args.epochs
+    cuda_peak = torch.cuda.max_memory_allocated() / 2 ** 20 if args.device.startswith("cuda") else float("nan")
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    queue.put((elapsed, rss_peak, cuda_peak, trainer.best_devloss))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-micro_batch_sizes", nargs="+", type=int, default=[0, 1024, 256, 64],
+                        help="Micro-batch sizes to compare; 0 trains on the full batch.")
+    parser.add_argument("-nsim", type=int, default=300000, help="Number of time steps.")
+    parser.add_argument("-nsteps", type=int, default=32, help="Rollout horizon.")
+    parser.add_argument("-nhidden", type=int, default=256, help="Hidden layer width.")
+    parser.add_argument("-epochs", type=int, default=3, help="Training epochs.")
+    parser.add_argument("-device", default="cpu")
+    parser.add_argument("-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(f"{'micro batch':>12} {'epoch (s)':>10} {'peak rss (MiB)':>15} {'peak cuda (MiB)':>16} {'dev loss':>10}")
+    for size in args.micro_batch_sizes:
+        queue = ctx.Queue()
+        process = ctx.Process(target=train, args=(size, args, queue))
+        process.start()
+        elapsed, rss_peak, cuda_peak, devloss = queue.get()
+        process.join()
+        print(f"{size or 'full':>12} {elapsed:>10.3f} {rss_peak:>15.0f} {cuda_peak:>16.0f} {devloss:>10.5f}")
@@ -0,0 +1,160 @@
+"""
+Benchmark of Trainer epoch time with bfloat16 autocast against float32, and check that the final
+dev loss of bfloat16 training stays within a relative tolerance of float32 training.
+
+Two workloads mirror the examples: system identification of a neural state space model by N-step
+rollouts on a SequenceDataset, and differentiable predictive control (DPC) of a linear plant by a
+neural policy with input and state constraints. Both are built from Function components.
+
+    python benchmarks/mixed_precision.py -epochs 20 -rtol 0.1
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.callbacks import Callback
+from neuromancer.component import Function
+from neuromancer.constraint import Loss, Objective, Variable
+from neuromancer.dataset import SequenceDataset, StaticDataset, split_sequence_data, split_static_data
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer
+
+
+def mlp(insize, outsize, nhidden):
+    return torch.nn.Sequential(
+        torch.nn.Linear(insize, nhidden), torch.nn.GELU(),
+        torch.nn.Linear(nhidden, nhidden), torch.nn.GELU(),
+        torch.nn.Linear(nhidden, outsize),
+    )
+
+
+class SSMRollout(torch.nn.Module):
+    """Residual neural state space model rolled out from the last observed state over future inputs."""
+    def __init__(self, nx, nu, nhidden):
+        super().__init__()
+        self.fx = mlp(nx + nu, nx, nhidden)
+
+    def forward(self, Yp, Uf):
+        x, X = Yp[-1], []
+        for u in Uf:
+            x = x + self.fx(torch.cat([x, u], dim=-1))
+            X.append(x)
+        return torch.stack(X)
+
+
+class ClosedLoopRollout(torch.nn.Module):
+    """Neural control policy in closed loop with a known linear plant."""
+    def __init__(self, A, B, nsteps, nhidden):
+        super().__init__()
+        self.register_buffer("A", A)
+        self.register_buffer("B", B)
+        self.nsteps = nsteps
+        self.policy = mlp(2 * A.shape[0], B.shape[1], nhidden)
+
+    def forward(self, x0, r):
+        x, X, U = x0, [], []
+        for _ in range(self.nsteps):
+            u = self.policy(torch.cat([x, r], dim=-1))
+            x = x @ self.A.T + u @ self.B.T
+            X.append(x), U.append(u)
+        return torch.stack(X, dim=1), torch.stack(U, dim=1), r.unsqueeze(1).expand(-1, self.nsteps, -1)
+
+
+def system_id(args):
+    rng = np.random.default_rng(args.seed)
+    nx, nu = 8, 2
+    A = 0.9 * np.linalg.qr(rng.standard_normal((nx, nx)))[0]
+    B = 0.1 * rng.standard_normal((nx, nu))
+    U = rng.uniform(-1, 1, size=(args.nsim, nu))
+    X = np.zeros((args.nsim, nx))
+    for t in range(args.nsim - 1):
+        X[t + 1] = X[t] @ A.T + U[t] @ B.T + 0.1 * np.tanh(X[t])
+    loaders = []
+    for name, data in zip(["train", "dev", "test"], split_sequence_data({"Y": X, "U": U}, args.nsteps)):
+        dataset = SequenceDataset(data, nsteps=args.nsteps, name=name)
+        loaders.append(DataLoader(dataset, batch_size=args.batch_size, shuffle=name == "train",
+                                  collate_fn=dataset.collate_fn))
+    ssm = Function(SSMRollout(nx, nu, args.nhidden), ["Yp", "Uf"], ["yhat"], name="ssm")
+    problem = Problem([Loss(["Yf", "yhat_ssm"], torch.nn.functional.mse_loss, name="loss")], [], [ssm])
+    return problem, loaders
+
+
+def dpc(args):
+    rng = np.random.default_rng(args.seed)
+    nx, nu = 4, 2
+    A = torch.tensor(0.95 * np.linalg.qr(rng.standard_normal((nx, nx)))[0], dtype=torch.float32)
+    B = torch.tensor(0.2 * rng.standard_normal((nx, nu)), dtype=torch.float32)
+    samples = {"x0": rng.uniform(-2, 2, size=(args.nsim, nx)), "r": rng.uniform(-1, 1, size=(args.nsim, nx))}
+    loaders = []
+    for name, data in zip(["train", "dev", "test"], split_static_data(samples)):
+        dataset = StaticDataset(data, name=name)
+        loaders.append(DataLoader(dataset, batch_size=args.batch_size, shuffle=name == "train",
+                                  collate_fn=dataset.collate_fn))
+    rollout = Function(ClosedLoopRollout(A, B, args.nsteps, args.nhidden), ["x0", "r"], ["X", "U", "R"], name="cl")
+    x, u, r = Variable("X_cl"), Variable("U_cl"), Variable("R_cl")
+    objectives = [Objective((x - r) ** 2, name="loss"), Objective(u ** 2, weight=0.01, name="u_loss")]
+    constraints = [10.0 * (u <= 1.0), 10.0 * (u >= -1.0), 10.0 * (x <= 3.0), 10.0 * (x >= -3.0)]
+    return Problem(objectives, constraints, [rollout]), loaders
+
+
+WORKLOADS = {"system_id": system_id, "dpc": dpc}
+
+
+class EpochTimer(Callback):
+    def begin_train(self, trainer):
+        self.times, self.start = [], time.perf_counter()
+
+    def begin_epoch(self, trainer, output):
+        # begin_epoch is called after the training pass of an epoch
+        self.times.append(time.perf_counter() - self.start)
+
+    def end_epoch(self, trainer, output):
+        self.start = time.perf_counter()
+
+
+def train(workload, autocast_dtype, args):
+    torch.manual_seed(args.seed)
+    problem, loaders = WORKLOADS[workload](args)
+    prefix = "nstep_" if workload == "system_id" else ""
+    timer = EpochTimer()
+    with tempfile.TemporaryDirectory() as savedir:
+        trainer = Trainer(
+            problem, *loaders, torch.optim.Adam(problem.parameters(), lr=args.lr),
+            logger=BasicLogger(savedir=savedir, verbosity=10 ** 9, stdout=[]), callback=timer,
+            epochs=args.epochs, patience=args.epochs, train_metric=f"{prefix}train_loss",
+            dev_metric=f"{prefix}dev_loss", test_metric=f"{prefix}test_loss",
+            eval_metric=f"mean_{prefix}dev_loss", autocast_dtype=autocast_dtype,
+        )
+        trainer.train()
+        # compare in float32 so that only the training precision differs
+        trainer.autocast_dtype = None
+        output = trainer.test(trainer.best_model)
+    return np.median(timer.times[1:]), output[f"mean_{prefix}dev_loss"].item()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("-nsim", type=int, default=20000, help="Number of time steps or samples.")
+    parser.add_argument("-nsteps", type=int, default=16, help="Rollout horizon.")
+    parser.add_argument("-nhidden", type=int, default=256, help="Hidden layer width.")
+    parser.add_argument("-batch_size", type=int, default=256, help="Minibatch size.")
+    parser.add_argument("-epochs", type=int, default=10, help="Training epochs.")
+    parser.add_argument("-lr", type=float, default=1e-3, help="Adam step size.")
+    parser.add_argument("-rtol", type=float, default=0.1, help="Relative dev loss tolerance of bfloat16.")
+    parser.add_argument("-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'workload':>10} {'fp32 epoch (s)':>15} {'bf16 epoch (s)':>15} {'speedup':>8} "
+          f"{'fp32 dev loss':>14} {'bf16 dev loss':>14} {'within rtol':>12}")
+    for workload in args.workloads:
+        t32, loss32 = train(workload, None, args)
+        t16, loss16 = train(workload, torch.bfloat16, args)
+        ok = abs(loss16 - loss32) <= args.rtol * abs(loss32)
+        print(f"{workload:>10} {t32:>15.3f} {t16:>15.3f} {t32 / t16:>7.2f}x "
+              f"{loss32:>14.5f} {loss16:>14.5f} {str(ok):>12}")
@@ -0,0 +1,66 @@
+"""
+Microbenchmark of the per-step overhead of Problem execution with many small components, in eager
+mode and in plan mode (Problem(plan=True)).
+
+The Problem chains -ncomponents Function components, each a small linear map from the output of
+the previous one, with a constraint and an objective on every output, on a tiny batch so that the
+time of a step is dominated by Python overhead rather than arithmetic.
+
+    python benchmarks/problem_overhead.py -ncomponents 50 -steps 200
+"""
+import argparse
+import time
+
+import torch
+
+from neuromancer.component import Function
+from neuromancer.constraint import Objective, Variable
+from neuromancer.problem import Problem
+
+
+def chain(ncomponents, nx, plan):
+    torch.manual_seed(0)
+    components, objectives, constraints = [], [], []
+    key = "x"
+    for i in range(ncomponents):
+        components.append(Function(torch.nn.Linear(nx, nx), [key], ["x"], name=f"f{i}"))
+        key = f"x_f{i}"
+        x = Variable(key)
+        objectives.append(Objective(x ** 2, weight=0.01, name=f"reg_{i}"))
+        constraints.append(x <= 1.0)
+    return Problem(objectives, constraints, components, plan=plan)
+
+
+def time_steps(problem, data, steps, repeats, backward):
+    def step():
+        output = problem(data)
+        if backward:
+            output["train_loss"].backward()
+
+    for _ in range(3):
+        step()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(steps):
+            step()
+        times.append(1e6 * (time.perf_counter() - start) / steps)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-ncomponents", type=int, default=50, help="Number of chained components.")
+    parser.add_argument("-nx", type=int, default=4, help="Width of every component.")
+    parser.add_argument("-batch_size", type=int, default=2)
+    parser.add_argument("-steps", type=int, default=200, help="Timed steps per repeat.")
+    parser.add_argument("-repeats", type=int, default=5, help="Repeats, of which the fastest is reported.")
+    args = parser.parse_args()
+
+    data = {"x": torch.randn(args.batch_size, args.nx), "name": "train"}
+    print(f"{'pass':>18} {'eager (us/step)':>16} {'plan (us/step)':>15} {'speedup':>8}")
+    for backward in [False, True]:
+        eager = time_steps(chain(args.ncomponents, args.nx, False), data, args.steps, args.repeats, backward)
+        planned = time_steps(chain(args.ncomponents, args.nx, True), data, args.steps, args.repeats, backward)
+        name = "forward+backward" if backward else "forward"
+        print(f"{name:>18} {eager:>16.1f} {planned:>15.1f} {eager / planned:>7.2f}x")
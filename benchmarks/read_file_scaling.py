@@ -0,0 +1,54 @@
+"""
+Benchmark of wall-time scaling of read_file on a directory of CSV files with the number of worker
+processes, with arrays returned to the parent either by pickling or through shared memory.
+
+    python benchmarks/read_file_scaling.py -nfiles 1000 -nrows 2000 -workers 1 2 4 8 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from neuromancer.dataset import read_file
+
+
+def write_files(directory, nfiles, nrows, ncols, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = [f"{v}{i}" for v, n in zip("yud", ncols) for i in range(n)]
+    for i in range(nfiles):
+        pd.DataFrame(rng.standard_normal((nrows, len(columns))), columns=columns).to_csv(
+            os.path.join(directory, f"exp{i:05d}.csv"), index=False,
+        )
+
+
+def wall_time(directory, num_workers, shared_memory, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read_file(directory, num_workers=num_workers, shared_memory=shared_memory)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-nfiles", type=int, default=200, help="Number of files in the directory.")
+    parser.add_argument("-nrows", type=int, default=5000, help="Number of rows per file.")
+    parser.add_argument("-ncols", type=int, nargs=3, default=[8, 4, 2], help="Number of y, u, d columns.")
+    parser.add_argument("-workers", type=int, nargs="+", default=[1, 2, 4, 8, os.cpu_count()],
+                        help="Worker process counts to measure.")
+    parser.add_argument("-repeats", type=int, default=3, help="Measurements per setting; best is reported.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_files(tmp, args.nfiles, args.nrows, args.ncols)
+        print(f"{args.nfiles} files x {args.nrows} rows, {os.cpu_count()} cpus")
+        print(f"{'workers':>8} {'pickled (s)':>12} {'speedup':>8} {'shared memory (s)':>18} {'speedup':>8}")
+        serial = wall_time(tmp, 1, False, args.repeats)
+        for workers in sorted(set(args.workers)):
+            pickled = wall_time(tmp, workers, False, args.repeats)
+            shared = wall_time(tmp, workers, True, args.repeats) if workers > 1 else pickled
+            print(f"{workers:>8} {pickled:>12.3f} {serial / pickled:>7.2f}x {shared:>18.3f} {serial / shared:>7.2f}x")
@@ -40,6 +40,67 @@ class Callback:
     def end_test(self, trainer, output):
         pass
 
+    def state_dict(self):
+        """
+        State of the callback saved in the checkpoints of the Trainer.
+        """
+        return {}
+
+    def load_state_dict(self, trainer, state):
+        """
+        Restore the state of state_dict when trainer resumes from a checkpoint, before the model and
+        optimizer state are restored.
+        """
+        pass
+
+
+class OptimizerSwitch(Callback):
+    """
+    Replaces the optimizer of the Trainer during training, e.g. for a hybrid schedule of Adam
+    followed by L-BFGS once training has settled into a smooth basin:
+
+    >>> switch = OptimizerSwitch(lambda params: torch.optim.LBFGS(params, history_size=10), epoch=100)
+
+    The switch happens at the end of an epoch, either at a fixed epoch or once the relative
+    decrease of the epoch mean train_metric falls below a tolerance. A learning rate scheduler of the
+    trainer is bound to the replaced optimizer and is dropped at the switch. Resuming from a checkpoint
+    after the switch replaces the optimizer again before its state is restored.
+    """
+    def __init__(self, optimizer_fn, epoch=None, tol=None):
+        """
+        :param optimizer_fn: (callable) Takes the model parameters and returns the new torch Optimizer
+        :param epoch: (int) Switch at the end of this epoch
+        :param tol: (float) Switch once the relative decrease of mean train_metric between epochs is below tol
+        """
+        super().__init__()
+        assert epoch is not None or tol is not None, "OptimizerSwitch requires epoch or tol"
+        self.optimizer_fn, self.epoch, self.tol = optimizer_fn, epoch, tol
+        self.switched = False
+        self._last_loss = None
+
+    def end_epoch(self, trainer, output):
+        if self.switched:
+            return
+        loss = output[f'mean_{trainer.train_metric}'].item()
+        plateau = self.tol is not None and self._last_loss is not None \
+            and self._last_loss - loss < self.tol * abs(self._last_loss)
+        self._last_loss = loss
+        if plateau or (self.epoch is not None and trainer.current_epoch >= self.epoch):
+            self.switch(trainer)
+
+    def switch(self, trainer):
+        trainer.optimizer = self.optimizer_fn(trainer.model.parameters())
+        trainer.lr_scheduler = None
+        self.switched = True
+
+    def state_dict(self):
+        return {"switched": self.switched, "last_loss": self._last_loss}
+
+    def load_state_dict(self, trainer, state):
+        self._last_loss = state["last_loss"]
+        if state["switched"] and not self.switched:
+            self.switch(trainer)
+
 
 class SysIDCallback(Callback):
     """
@@ -0,0 +1,138 @@
+"""
+Non-blocking checkpointing of training state.
+
+A snapshot of the state is copied into buffers that are allocated on the first save and reused
+afterwards, and the buffers are serialized on a background thread while training continues.
+
+>>> checkpointer = AsyncCheckpointer("checkpoint.pth")
+>>> checkpointer.save({"model": model.state_dict(), "epoch": epoch})
+>>> checkpointer.wait()
+"""
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import numpy as np
+import torch
+
+
+def copy_state(state, buffers=None, device=None):
+    """
+    Copy a nested structure of dicts, lists, and tuples of tensors into buffers of the same
+    structure, reusing the buffer tensors in place where dtypes and shapes match. Leaves other than
+    tensors are deep copied.
+
+    :param state: (dict, list, tuple, torch.Tensor, or object) state to copy, e.g. a state_dict
+    :param buffers: (same type as state) result of a previous call, or None
+    :param device: (str) device of newly allocated buffers; defaults to the device of each tensor
+    :return: (same type as state) copy of state
+    """
+    if isinstance(state, torch.Tensor):
+        if isinstance(buffers, torch.Tensor) and buffers.dtype == state.dtype and buffers.shape == state.shape:
+            return buffers.copy_(state.detach())
+        return state.detach().to(device or state.device, copy=True)
+    if isinstance(state, dict):
+        buffers = buffers if isinstance(buffers, dict) else {}
+        return type(state)((k, copy_state(v, buffers.get(k), device)) for k, v in state.items())
+    if isinstance(state, (list, tuple)) and not hasattr(state, "_fields"):
+        buffers = buffers if isinstance(buffers, type(state)) and len(buffers) == len(state) else [None] * len(state)
+        return type(state)(copy_state(v, b, device) for v, b in zip(state, buffers))
+    return deepcopy(state)
+
+
+def get_rng_state():
+    """
+    :return: (dict) states of the python, numpy, torch, and cuda random number generators
+    """
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    """
+    :param state: (dict) random number generator states returned by get_rng_state
+    """
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"]:
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class AsyncCheckpointer:
+    """
+    Saves training state to a file without blocking training on serialization.
+
+    save() copies the state into cpu buffers, allocated on the first save, and returns while a
+    background thread writes the buffers to a temporary file which then atomically replaces path,
+    so that a crash leaves either the previous or the new checkpoint. A save waits for the previous
+    write to finish before reusing the buffers. The thread is started by the first save after
+    construction or close(), and close() or leaving a with block stops it.
+
+    >>> with AsyncCheckpointer("checkpoint.pth") as checkpointer:
+    >>>     checkpointer.save(state)
+    """
+    def __init__(self, path):
+        """
+
+        :param path: (str) File the checkpoint is written to
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.buffers = None
+        self.nsaves = 0
+        self.blocking_time = 0.0
+        self._executor = None
+        self._future = None
+
+    def save(self, state):
+        """
+        Snapshot state and write it to path in the background.
+
+        :param state: (dict) nested structure of tensors and picklable objects
+        """
+        start = time.perf_counter()
+        self.wait()
+        self.buffers = copy_state(state, self.buffers, device="cpu")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = self._executor.submit(self._write, self.buffers)
+        self.nsaves += 1
+        self.blocking_time += time.perf_counter() - start
+
+    def _write(self, buffers):
+        tmp = f"{self.path}.tmp"
+        torch.save(buffers, tmp)
+        os.replace(tmp, self.path)
+
+    def wait(self):
+        """
+        Block until the last checkpoint is written, raising any error of the write.
+        """
+        if self._future is not None:
+            future, self._future = self._future, None
+            future.result()
+
+    def close(self):
+        """
+        Finish the last write and stop the background thread.
+        """
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
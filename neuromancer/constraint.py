@@ -3,6 +3,7 @@ Definition of neuromancer.Constraint class used in conjunction with neuromancer.
 same behavior as a Loss but with intuitive syntax for defining via Variable objects.
 """
 from typing import Dict, List, Callable
+import operator
 
 import torch
 import torch.nn as nn
@@ -10,6 +11,22 @@ import torch.nn.functional as F
 from neuromancer.gradients import gradient
 
 
+def _upcast(*tensors):
+    """
+    Cast reduced precision floating point tensors to float32, so that loss reductions and
+    constraint penalties accumulate in full precision under bfloat16 or float16 autocast.
+
+    :param tensors: (torch.Tensor or numeric)
+    :return: (list) inputs with float16 and bfloat16 tensors cast to float32
+    """
+    return [t.float() if isinstance(t, torch.Tensor) and t.dtype in (torch.float16, torch.bfloat16) else t
+            for t in tensors]
+
+
+def _unique(keys):
+    return list(dict.fromkeys(keys))
+
+
 class Loss(nn.Module):
     """
     Drop in replacement for a Constraint object but relies on a list of dictionary keys and a callable function
@@ -40,13 +57,27 @@ class Loss(nn.Module):
         """
         return gradient(self.forward(variables)[self.name], variables[input_key])
 
+    @property
+    def input_keys(self):
+        """
+        Keys of the data dictionary read by the loss.
+        """
+        return list(self.variable_names)
+
+    @property
+    def output_keys(self):
+        """
+        Keys written to the data dictionary by the loss.
+        """
+        return [self.name]
+
     def forward(self, variables: Dict[str, torch.Tensor]) -> torch.Tensor:
         """
 
         :param variables: (dict, {str: torch.Tensor}) Should contain keys corresponding to self.variable_names
         :return: 0-dimensional torch.Tensor that can be cast as a floating point number
         """
-        return {self.name: self.weight*self.loss(*[variables[k] for k in self.variable_names])}
+        return {self.name: self.weight*self.loss(*_upcast(*[variables[k] for k in self.variable_names]))}
 
     def __repr__(self):
         return f"Loss: {self.name}({', '.join(self.variable_names)}) -> {self.loss} * {self.weight}"
@@ -72,6 +103,7 @@ class LT(nn.Module):
         :param right: torch.Tensor
         :return: zero dimensional torch.Tensor
         """
+        left, right = _upcast(left, right)
         if self.norm == 1:
             return torch.mean(F.relu(left - right))
         elif self.norm == 2:
@@ -99,6 +131,7 @@ class GT(nn.Module):
         :param right: torch.Tensor
         :return: zero dimensional torch.Tensor
         """
+        left, right = _upcast(left, right)
         if self.norm == 1:
             return torch.mean(F.relu(right - left))
         elif self.norm == 2:
@@ -125,6 +158,7 @@ class Eq(nn.Module):
         :param right: torch.Tensor
         :return: zero dimensional torch.Tensor
         """
+        left, right = _upcast(left, right)
         if self.norm == 1:
             return F.l1_loss(left, right)
         elif self.norm == 2:
@@ -159,6 +193,14 @@ class Objective(nn.Module):
     def variable_names(self):
         return [self.var.name]
 
+    @property
+    def input_keys(self):
+        return self.var.input_keys
+
+    @property
+    def output_keys(self):
+        return _unique(self.var.output_keys + [self.name])
+
     def grad(self, input_dict, input_key=None):
         """
          returns gradient of the loss w.r.t. input variables
@@ -175,7 +217,7 @@ class Objective(nn.Module):
         :param input_dict: (dict, {str: torch.Tensor}) Should contain keys corresponding to self.variable_names
         :return:  (dict, {str: 0-dimensional torch.Tensor}) tensor value can be cast as a floating point number
         """
-        return {self.name: self.weight*self.metric(self.var(input_dict))}
+        return {self.name: self.weight*self.metric(*_upcast(self.var(input_dict)))}
 
     def __repr__(self):
         return f"Objective: {self.name}({', '.join(self.variable_names)}) = {self.weight} * {self.metric}({', '.join(self.variable_names)})"
@@ -216,6 +258,14 @@ class Constraint(nn.Module):
     def variable_names(self):
         return [self.left.name, self.right.name]
 
+    @property
+    def input_keys(self):
+        return _unique(self.left.input_keys + self.right.input_keys)
+
+    @property
+    def output_keys(self):
+        return _unique(self.left.output_keys + self.right.output_keys + [self.name])
+
     def __xor__(self, norm):
         comparator = type(self.comparator)(norm=norm)
         return Constraint(self.left, self.right, comparator, weight=self.weight, name=self.name)
@@ -298,6 +348,31 @@ class Variable(nn.Module):
         if self.left is not None or self.right is not None:
             assert self.op is not None
 
+    @property
+    def input_keys(self):
+        """
+        Keys of the data dictionary read when evaluating the Variable: the keys of the leaves of its
+        expression tree which are not constants.
+        """
+        if self.value is not None:
+            return []
+        if self.op is not None:
+            return _unique(sum([v.input_keys for v in [self.left, self.right] if v is not None], []))
+        if self.slice is not None:
+            return [self.key[:-len(str(self.slice))-1]]
+        return [self.key]
+
+    @property
+    def output_keys(self):
+        """
+        Keys written to the data dictionary when evaluating the Variable: the keys of constants,
+        slices, and intermediate results of its expression tree.
+        """
+        keys = sum([v.output_keys for v in [self.left, self.right] if v is not None], [])
+        if self.value is not None or self.op is not None or self.slice is not None:
+            keys.append(self.key)
+        return _unique(keys)
+
     def forward(self, data):
         """
         The call function is going to hand back a pytorch tensor. In the base case the call function will simply look
@@ -307,10 +382,7 @@ class Variable(nn.Module):
         :param data: (dict: {str: torch.Tensor})
         :return: torch.Tensor
         """
-        data_tensors = [v for v in data.values() if isinstance(v, torch.Tensor)]
         if self.value is not None:
-            if data_tensors:
-                self.value.to(data_tensors[0].device)
             value = self.value
         elif self.op == 'add':
             value = self.left(data) + self.right(data)
@@ -463,3 +535,225 @@ class Variable(nn.Module):
         """
         return nn.Module.__hash__(self)
 
+
+
+class _ConstraintGroup:
+    """
+    Losses of constraints with the same penalty and norm evaluated by a single set of kernels: the broadcast
+    differences of all left and right hand sides are flattened into one vector, penalized, averaged per
+    constraint by a segment sum, and scaled by the vector of constraint weights. Greater than constraints
+    are evaluated as less than constraints with swapped sides.
+    """
+    def __init__(self, constraints, penalty, norm):
+        """
+
+        :param constraints: (list of Constraint) constraints with LT, GT, or Eq comparators of the given norm
+        :param penalty: (str) 'hinge' for LT and GT, 'abs' for Eq
+        :param norm: (int) 1 or 2
+        """
+        self.constraints = constraints
+        self.signs = [-1 if isinstance(c.comparator, GT) else 1 for c in constraints]
+        self.penalty = penalty
+        self.norm = norm
+        self._segments, self._weights = {}, {}
+
+    def weights(self, means):
+        weights = [c.weight for c in self.constraints]
+        if any(isinstance(w, torch.Tensor) for w in weights):
+            return torch.stack([torch.as_tensor(w, device=means.device).reshape(()) for w in weights])
+        key = (tuple(weights), means.dtype, means.device)
+        if key not in self._weights:
+            self._weights[key] = torch.tensor(weights, dtype=means.dtype, device=means.device)
+        return self._weights[key]
+
+    def dtypes(self, *sides):
+        """
+        Constraints of different dtypes are evaluated in their promoted dtype, while their losses are cast back
+        to the dtypes they have when evaluated separately.
+
+        :param sides: (torch.Tensor) left and right hand sides of every constraint in turn
+        :return: (list of torch.dtype) dtype of the loss of every constraint
+        """
+        dtypes = []
+        for constraint, left, right in zip(self.constraints, sides[::2], sides[1::2]):
+            dtype = torch.result_type(*_upcast(left, right))
+            if isinstance(constraint.weight, torch.Tensor):
+                dtype = torch.promote_types(dtype, constraint.weight.dtype)
+            dtypes.append(dtype)
+        return dtypes
+
+    def segments(self, sizes, device):
+        key = (sizes, device)
+        if key not in self._segments:
+            counts = torch.tensor(sizes, device=device)
+            self._segments[key] = torch.repeat_interleave(torch.arange(len(sizes), device=device), counts), counts
+        return self._segments[key]
+
+    def __call__(self, *sides):
+        """
+
+        :param sides: (torch.Tensor) left and right hand sides of every constraint in turn
+        :return: (torch.Tensor) vector of the losses of the constraints
+        """
+        diffs = []
+        for sign, left, right in zip(self.signs, sides[::2], sides[1::2]):
+            left, right = _upcast(left, right)
+            diffs.append((left - right if sign > 0 else right - left).reshape(-1))
+        diff = torch.cat(diffs)
+        violation = F.relu(diff) if self.penalty == 'hinge' else diff.abs()
+        if self.norm == 2:
+            violation = violation ** 2
+        segments, counts = self.segments(tuple(d.numel() for d in diffs), diff.device)
+        means = torch.zeros(len(diffs), dtype=diff.dtype, device=diff.device).index_add(0, segments, violation)
+        means = means / counts
+        return self.weights(means) * means
+
+
+_OPERATORS = {'add': operator.add, 'sub': operator.sub, 'mul': operator.mul, 'pow': operator.pow,
+              'matmul': operator.matmul, 'neg': operator.neg, 'div': operator.truediv, 'grad': gradient}
+
+
+class LossGraph:
+    """
+    Loss terms lowered into one flat program over a DAG of hash-consed nodes. Structurally equal Variable
+    subexpressions of different terms, e.g. x @ A.t() in several constraints, are a single node computed once
+    per call, whereas calling every term recomputes its whole Variable tree.
+
+    Nodes are data keys, constants, operators applied to nodes, slices of nodes, and loss terms. Constants are
+    the same node if they are the same tensor, or if they have the same key and equal values and do not require
+    gradients. Calling the graph returns the intermediate results and the loss of every term under the same keys
+    as calling the terms in order.
+
+    With group_constraints, constraints with LT, GT, or Eq comparators of norm 1 or 2 are not separate nodes but
+    are evaluated in groups of the same penalty and norm, each by one vectorized penalty and reduction, at the
+    end of the program. Their losses are still returned under their names, after the other outputs.
+
+    >>> graph = LossGraph([x @ A.t() <= b, x @ A.t() >= -b, x.minimize()])
+    >>> graph(data)
+    """
+    def __init__(self, terms, group_constraints=False, loss_key=None):
+        """
+
+        :param terms: (list) Loss, Objective, and Constraint objects which do not override forward
+        :param group_constraints: (bool) Evaluate LT, GT, and Eq constraints in groups of the same penalty and norm
+        :param loss_key: (str) If given, the sum of the losses of all terms is returned under this key
+        """
+        self.terms = list(terms)
+        self.group_constraints = group_constraints
+        self.loss_key = loss_key
+        self.inputs = []
+        self.program = []
+        self.nslots = 0
+        self._nodes, self._constants, self._writes, self._written = {}, {}, {}, {}
+        self._groups, self._loss_slots = {}, []
+        for term in self.terms:
+            self._lower_term(term)
+        for (penalty, norm), members in self._groups.items():
+            group = _ConstraintGroup([c for c, _ in members], penalty, norm)
+            slot = self._node(("group", penalty, norm), group, sum([args for _, args in members], ()))
+            self._writes[slot].extend(c.name for c in group.constraints)
+            self._loss_slots.append((slot, True))
+
+    def _new_slot(self):
+        self.nslots += 1
+        return self.nslots - 1
+
+    def _node(self, signature, fn, args):
+        if signature not in self._nodes:
+            slot = self._nodes[signature] = self._new_slot()
+            self._writes[slot] = []
+            self.program.append((fn, args, slot, self._writes[slot]))
+        return self._nodes[signature]
+
+    def _write(self, slot, key):
+        if key not in self._writes[slot]:
+            self._writes[slot].append(key)
+        self._written[key] = slot
+
+    def _input(self, key):
+        # keys written by earlier nodes are read from them, as evaluated Variables write into the data dictionary
+        if key in self._written:
+            return self._written[key]
+        if ("key", key) not in self._nodes:
+            self._nodes[("key", key)] = self._new_slot()
+            self.inputs.append((key, self._nodes[("key", key)]))
+        return self._nodes[("key", key)]
+
+    def _constant(self, var):
+        value = var.value
+        for other, slot in self._constants.get(var.key, []):
+            if other is value or (not other.requires_grad and not value.requires_grad and other.dtype == value.dtype
+                                  and other.device == value.device and other.shape == value.shape
+                                  and torch.equal(other, value)):
+                return slot
+        slot = self._node(("value", id(value)), lambda: var.value, ())
+        self._constants.setdefault(var.key, []).append((value, slot))
+        return slot
+
+    def _lower(self, var):
+        """
+        Lower the expression tree of a Variable, children first as evaluated by Variable.forward.
+
+        :param var: (Variable)
+        :return: (int) slot of the value of var
+        """
+        if var.value is not None:
+            slot = self._constant(var)
+        elif var.op is not None:
+            args = tuple(self._lower(v) for v in [var.left, var.right] if v is not None)
+            slot = self._node((var.op, *args), _OPERATORS[var.op], args)
+        elif var.slice is not None:
+            slot = self._input(var.key[:-len(str(var.slice))-1])
+        else:
+            return self._input(var.key)
+        if var.slice is not None:
+            slot = self._node(("slice", slot, str(var.slice)), lambda x, s=var.slice: x[s], (slot,))
+        self._write(slot, var.key)
+        return slot
+
+    def _lower_term(self, term):
+        assert type(term).forward in (Loss.forward, Objective.forward, Constraint.forward), \
+            f"LossGraph cannot lower {term.name}: only Loss, Objective, and Constraint forward passes are supported"
+        if self.group_constraints and isinstance(term, Constraint) and type(term.comparator) in (LT, GT, Eq) \
+                and term.comparator.norm in (1, 2):
+            args = (self._lower(term.left), self._lower(term.right))
+            penalty = 'abs' if isinstance(term.comparator, Eq) else 'hinge'
+            self._groups.setdefault((penalty, term.comparator.norm), []).append((term, args))
+            return
+        if isinstance(term, Objective):
+            args = (self._lower(term.var),)
+            fn = lambda x: term.weight*term.metric(*_upcast(x))
+        elif isinstance(term, Constraint):
+            args = (self._lower(term.left), self._lower(term.right))
+            fn = lambda left, right: term.weight*term.comparator(left, right)
+        else:
+            args = tuple(self._input(k) for k in term.variable_names)
+            fn = lambda *x: term.weight*term.loss(*_upcast(*x))
+        slot = self._node(("term", id(term)), fn, args)
+        self._write(slot, term.name)
+        self._loss_slots.append((slot, False))
+
+    def __call__(self, data):
+        """
+
+        :param data: (dict, {str: torch.Tensor}) Should contain the input keys of all terms
+        :return: (dict, {str: torch.Tensor}) intermediate results and losses of all terms
+        """
+        values = [None] * self.nslots
+        for key, slot in self.inputs:
+            values[slot] = data[key]
+        output = {}
+        for fn, args, slot, keys in self.program:
+            value = values[slot] = fn(*[values[a] for a in args])
+            if isinstance(fn, _ConstraintGroup):
+                dtypes = fn.dtypes(*[values[a] for a in args])
+                output.update((k, v.to(dtype)) for k, v, dtype in zip(keys, value.unbind(), dtypes))
+                continue
+            for k in keys:
+                output[k] = value
+        if self.loss_key is not None:
+            loss = 0.0
+            for slot, grouped in self._loss_slots:
+                loss += values[slot].sum() if grouped else values[slot]
+            output[self.loss_key] = loss
+        return output
@@ -1,12 +1,21 @@
+import hashlib
+import importlib
+import json
 import math
 import os
+import re
+import shutil
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 import pandas as pd
 from scipy.io import loadmat
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
 from torch.utils.data.dataloader import default_collate
 
 
@@ -23,25 +32,122 @@ def _extract_var(data, regex):
     return filtered if filtered.size != 0 else None
 
 
-SUPPORTED_EXTENSIONS = {".csv", ".mat"}
+SUPPORTED_EXTENSIONS = {".csv", ".mat", ".parquet", ".feather", ".arrow", ".h5", ".hdf5"}
 
+# columnar formats, read through optional dependencies with column projection
+ARROW_TYPES = {"parquet", "feather", "arrow"}
+HDF5_TYPES = {"h5", "hdf5"}
 
-def read_file(file_or_dir):
+# column name patterns identifying each variable group in tabular files
+VAR_PATTERNS = {
+    "Y": "^y[0-9]+$",
+    "X": "^x[0-9]+$",
+    "U": "^u[0-9]+$",
+    "D": "^d[0-9]+$",
+}
+
+
+def _list_files(file_or_dir):
     if os.path.isdir(file_or_dir):
-        files = [
+        return sorted(
             os.path.join(file_or_dir, x)
             for x in os.listdir(file_or_dir)
             if os.path.splitext(x)[1].lower() in SUPPORTED_EXTENSIONS
-        ]
-        return [_read_file(x) for x in sorted(files)]
+        )
+    return [file_or_dir]
+
+
+def read_file(file_or_dir, num_workers=None, shared_memory=False):
+    """Read data from a file, or from every supported file in a directory. Supported formats are
+    MAT, CSV, Parquet and Feather (via pyarrow), and HDF5 (via h5py).
+
+    :param file_or_dir: (str) path to a data file or a directory of data files.
+    :param num_workers: (int) number of processes used to parse the files of a directory in
+        parallel. Default is None, which reads files serially. Results keep sorted file order.
+    :param shared_memory: (bool) if True, parallel workers return parsed arrays in shared memory
+        blocks instead of pickling them back to the parent process. The arrays are mapped without
+        copying and their blocks are released once the arrays and their views are deleted.
+    """
+    if os.path.isdir(file_or_dir):
+        files = _list_files(file_or_dir)
+        if num_workers is None or num_workers <= 1 or len(files) <= 1:
+            return [_read_file(x) for x in files]
+        chunksize = max(1, len(files) // (4 * num_workers))
+        if not shared_memory:
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                return list(pool.map(_read_file, files, chunksize=chunksize))
+        # workers register their blocks with the resource tracker of this process, which forgets
+        # them when they are unlinked here
+        resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [pool.submit(_read_files_shared, files[i:i + chunksize])
+                       for i in range(0, len(files), chunksize)]
+        # blocks of every successful chunk are attached, and so unlinked, even if another chunk failed
+        data = [_from_shared_memory(f.result()) for f in futures if f.exception() is None]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise errors[0]
+        return [d for chunk in data for d in chunk]
 
     return _read_file(file_or_dir)
 
 
+class _SharedArray(np.ndarray):
+    """Array on a shared memory block, which stays mapped while the array or views of it exist."""
+
+
+def _to_shared_memory(data, blocks):
+    """Copy the arrays of a data dictionary, or list of data dictionaries, into new shared memory
+    blocks, which are appended to blocks.
+
+    :return: (dict str: tuple or list) (block name, shape, dtype) descriptors of each array.
+    """
+    if isinstance(data, list):
+        return [_to_shared_memory(d, blocks) for d in data]
+    descriptors = {}
+    for k, v in data.items():
+        shm = SharedMemory(create=True, size=max(v.nbytes, 1))
+        blocks.append(shm)
+        np.ndarray(v.shape, dtype=v.dtype, buffer=shm.buf)[...] = v
+        descriptors[k] = (shm.name, v.shape, v.dtype.str)
+    return descriptors
+
+
+def _from_shared_memory(descriptors):
+    """Map the arrays of the shared memory blocks created by `_to_shared_memory` and unlink the blocks,
+    which are released once the arrays are deleted."""
+    if isinstance(descriptors, list):
+        return [_from_shared_memory(d) for d in descriptors]
+    data = {}
+    for k, (name, shape, dtype) in descriptors.items():
+        shm = SharedMemory(name=name)
+        shm.unlink()
+        data[k] = _SharedArray(shape, dtype=dtype, buffer=shm.buf)
+        # closing the block unmaps the array, so the block lives as long as the array
+        data[k].shared_memory = shm
+    return data
+
+
+def _read_files_shared(files):
+    """Read files into shared memory blocks, unlinking the blocks of all files if one fails."""
+    blocks = []
+    try:
+        return [_to_shared_memory(_read_file(x), blocks) for x in files]
+    except BaseException:
+        for shm in blocks:
+            shm.unlink()
+        raise
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
 def _read_file(file_path):
-    """Read data from MAT or CSV file into data dictionary.
+    """Read data from MAT, CSV, Parquet, Feather, or HDF5 file into data dictionary. Parquet and
+    Feather files hold variables in columns named as in CSV files; HDF5 files hold variables in
+    datasets named as in MAT files.
 
-    :param file_path: (str) path to a MAT or CSV file to load.
+    :param file_path: (str) path to a data file to load.
     """
     file_type = file_path.split(".")[-1].lower()
     if file_type == "mat":
@@ -53,11 +159,11 @@ def _read_file(file_path):
         id_ = f.get("exp_id", None)  # experiment run id
     elif file_type == "csv":
         data = pd.read_csv(file_path)
-        Y = _extract_var(data, "^y[0-9]+$")
-        X = _extract_var(data, "^x[0-9]+$")
-        U = _extract_var(data, "^u[0-9]+$")
-        D = _extract_var(data, "^d[0-9]+$")
+        Y, X, U, D = [_extract_var(data, VAR_PATTERNS[k]) for k in ["Y", "X", "U", "D"]]
         id_ = _extract_var(data, "^exp_id")
+    elif file_type in ARROW_TYPES or file_type in HDF5_TYPES:
+        data, id_ = _read_columnar(file_path, file_type)
+        Y, X, U, D = [data.get(k, None) for k in ["Y", "X", "U", "D"]]
     else:
         print(f"error: unsupported file type: {file_type}")
 
@@ -68,10 +174,171 @@ def _read_file(file_path):
             k: v for k, v in zip(["Y", "X", "U", "D"], [Y, X, U, D]) if v is not None
         }
     else:
-        return [
-            {k: v[id_.flatten() == i, ...] for k, v in zip(["Y", "X", "U", "D"], [Y, X, U, D]) if v is not None}
-            for i in sorted(set(id_.flatten()))
-        ]
+        return _group_by_exp_id(
+            id_, {k: v for k, v in zip(["Y", "X", "U", "D"], [Y, X, U, D]) if v is not None}
+        )
+
+
+def _group_by_exp_id(id_, data):
+    """Split a data dictionary into one dictionary per experiment run id, ordered by id, in a
+    single pass over the ids. Rows within each experiment keep their original order. When every
+    experiment occupies a contiguous block of rows, as is usual, the results are views of `data`;
+    otherwise rows are reordered once with a stable argsort.
+
+    :param id_: (np.array) experiment run id of each row.
+    :param data: (dict str: np.array) data dictionary with arrays of shape (T, Dk).
+    :return: (list dict str: np.array) data dictionary of each experiment.
+    """
+    ids = id_.reshape(-1)
+    run_starts = np.concatenate([[0], np.flatnonzero(ids[1:] != ids[:-1]) + 1])
+    run_ids = ids[run_starts]
+    order = np.argsort(run_ids, kind="stable")
+    if len(np.unique(run_ids)) == len(run_ids):
+        run_stops = np.append(run_starts[1:], len(ids))
+        return [{k: v[run_starts[i] : run_stops[i]] for k, v in data.items()} for i in order]
+
+    order = np.argsort(ids, kind="stable")
+    _, starts = np.unique(ids[order], return_index=True)
+    stops = np.append(starts[1:], len(ids))
+    data = {k: v[order] for k, v in data.items()}
+    return [{k: v[start:stop] for k, v in data.items()} for start, stop in zip(starts, stops)]
+
+
+def _group_columns(columns):
+    """Group tabular column names into variables using the patterns of `VAR_PATTERNS`."""
+    groups = {k: [c for c in columns if re.search(p, c)] for k, p in VAR_PATTERNS.items()}
+    return {k: v for k, v in groups.items() if len(v) > 0}
+
+
+def _import_optional(module, file_type):
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"reading {file_type} files requires the optional dependency {module.split('.')[0]}"
+        ) from e
+
+
+def _arrow_columns(file_path, file_type):
+    """Column names of a Parquet or Feather file, read from its schema only."""
+    if file_type == "parquet":
+        return _import_optional("pyarrow.parquet", file_type).read_schema(file_path).names
+    pa = _import_optional("pyarrow", file_type)
+    with pa.memory_map(file_path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def _arrow_batches(file_path, file_type, columns, chunksize):
+    """Yield record batches of the selected columns of a Parquet or Feather file. Parquet files are
+    streamed row group by row group and unselected columns are never decoded; Feather files are
+    memory-mapped so unselected columns are never read."""
+    if file_type == "parquet":
+        pq = _import_optional("pyarrow.parquet", file_type)
+        yield from pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=columns)
+        return
+    pa = _import_optional("pyarrow", file_type)
+    with pa.memory_map(file_path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize)
+
+
+def _count_rows(file_path, file_type):
+    """Number of rows of a columnar file, read from its metadata."""
+    if file_type == "parquet":
+        return _import_optional("pyarrow.parquet", file_type).ParquetFile(file_path).metadata.num_rows
+    if file_type in ARROW_TYPES:
+        pa = _import_optional("pyarrow", file_type)
+        with pa.memory_map(file_path) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    with _import_optional("h5py", file_type).File(file_path, "r") as f:
+        return next(f[k.lower()].shape[0] for k in VAR_PATTERNS if k.lower() in f)
+
+
+def _read_columnar(file_path, file_type, chunksize=65536):
+    """Read a Parquet, Feather, or HDF5 file by filling preallocated arrays chunk by chunk, so that
+    peak memory stays close to the size of the selected columns.
+
+    :return: (dict str: np.array, np.array or None) variables and experiment run ids.
+    """
+    nrows = _count_rows(file_path, file_type)
+    data, id_, row = None, None, 0
+    for chunk, ids in _iter_file_chunks(file_path, chunksize):
+        if data is None:
+            data = {k: np.empty((nrows, v.shape[1]), dtype=v.dtype) for k, v in chunk.items()}
+            id_ = np.empty(nrows, dtype=ids.dtype) if ids is not None else None
+        n = next(iter(chunk.values())).shape[0]
+        for k, v in chunk.items():
+            data[k][row : row + n] = v
+        if id_ is not None:
+            id_[row : row + n] = ids
+        row += n
+    return data, id_
+
+
+def _iter_file_chunks(file_path, chunksize):
+    """Read a data file in chunks of at most `chunksize` rows.
+
+    :param file_path: (str) path to a MAT, CSV, Parquet, Feather, or HDF5 file to load.
+    :param chunksize: (int) number of rows per chunk.
+    :return: generator of (dict str: np.array, np.array or None) tuples holding each chunk's
+        variables and experiment run ids.
+    """
+    file_type = file_path.split(".")[-1].lower()
+    if file_type == "csv":
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+        groups = _group_columns(columns)
+        id_cols = [c for c in columns if re.search("^exp_id", c)]
+        assert len(groups) > 0, f"no variable columns found in {file_path}"
+        usecols = [c for v in groups.values() for c in v] + id_cols[:1]
+        for chunk in pd.read_csv(file_path, usecols=usecols, chunksize=chunksize):
+            yield (
+                {k: chunk[v].values for k, v in groups.items()},
+                chunk[id_cols[0]].values if id_cols else None,
+            )
+    elif file_type == "mat":
+        # scipy decodes MAT files whole, so these are only chunked after loading
+        f = loadmat(file_path)
+        data = {k: f[k.lower()] for k in VAR_PATTERNS if f.get(k.lower(), None) is not None}
+        id_ = f.get("exp_id", None)
+        assert len(data) > 0, f"no variables found in {file_path}"
+        nrows = next(iter(data.values())).shape[0]
+        for i in range(0, nrows, chunksize):
+            yield (
+                {k: v[i : i + chunksize] for k, v in data.items()},
+                id_.flatten()[i : i + chunksize] if id_ is not None else None,
+            )
+    elif file_type in ARROW_TYPES:
+        columns = _arrow_columns(file_path, file_type)
+        groups = _group_columns(columns)
+        id_cols = [c for c in columns if re.search("^exp_id", c)]
+        assert len(groups) > 0, f"no variable columns found in {file_path}"
+        usecols = [c for v in groups.values() for c in v] + id_cols[:1]
+        for batch in _arrow_batches(file_path, file_type, usecols, chunksize):
+            yield (
+                {
+                    k: np.column_stack([batch.column(c).to_numpy(zero_copy_only=False) for c in v])
+                    for k, v in groups.items()
+                },
+                batch.column(id_cols[0]).to_numpy(zero_copy_only=False) if id_cols else None,
+            )
+    elif file_type in HDF5_TYPES:
+        h5py = _import_optional("h5py", file_type)
+        with h5py.File(file_path, "r") as f:
+            data = {k: f[k.lower()] for k in VAR_PATTERNS if k.lower() in f}
+            id_ = f["exp_id"] if "exp_id" in f else None
+            assert len(data) > 0, f"no variables found in {file_path}"
+            nrows = next(iter(data.values())).shape[0]
+            for i in range(0, nrows, chunksize):
+                yield (
+                    {k: v[i : i + chunksize].reshape(min(chunksize, nrows - i), -1) for k, v in data.items()},
+                    id_[i : i + chunksize].reshape(-1) if id_ is not None else None,
+                )
+    else:
+        raise ValueError(f"unsupported file type: {file_type}")
 
 
 def batch_tensor(x: torch.Tensor, steps: int, mh: bool = False):
@@ -102,6 +369,76 @@ def _get_sequence_time_slices(data):
     return slices
 
 
+def _stack_variables(data, variables, storage_dtype=torch.float32, scale=None, offset=None, chunksize=65536):
+    """Write the variables of a list of data dictionaries into the column blocks of a single
+    preallocated buffer. Conversion happens in chunks of rows, so peak memory stays close to the
+    size of the result rather than holding converted copies of every variable.
+
+    :param data: (list dict str: np.array) data dictionaries with arrays of shape (T, Dk).
+    :param variables: (list str) variables to stack, in column order.
+    :param storage_dtype: (torch.dtype) element type of the buffer.
+    :param scale: (torch.Tensor) optional per-column scale for quantizing to an integer dtype.
+    :param offset: (torch.Tensor) optional per-column offset for quantizing to an integer dtype.
+    :param chunksize: (int) number of rows converted at a time.
+    :return: (torch.Tensor) tensor of shape (sum T, sum Dk).
+    """
+    nrows = sum(d[variables[0]].shape[0] for d in data)
+    ncols = sum(data[0][k].shape[1] for k in variables)
+    out = torch.empty((nrows, ncols), dtype=storage_dtype)
+    # float32 chunks are cast directly into the buffer by numpy without intermediate copies
+    out_np = out.numpy() if storage_dtype == torch.float32 else None
+    row = 0
+    for d in data:
+        nsim = d[variables[0]].shape[0]
+        col = 0
+        for k in variables:
+            v, width = d[k], d[k].shape[1]
+            for i in range(0, nsim, chunksize):
+                stop = min(i + chunksize, nsim)
+                if out_np is not None:
+                    out_np[row + i : row + stop, col : col + width] = v[i:stop]
+                    continue
+                x = torch.from_numpy(np.array(v[i:stop], dtype=np.float32))
+                if scale is not None:
+                    x = ((x - offset[col : col + width]) / scale[col : col + width]).round_()
+                    x = x.clamp_(torch.iinfo(storage_dtype).min + 1, torch.iinfo(storage_dtype).max)
+                out[row + i : row + stop, col : col + width] = x
+            col += width
+        row += nsim
+    return out
+
+
+def _quantization_params(data, variables, storage_dtype):
+    """Per-column scale and offset mapping the range of each column onto the range of an integer
+    storage dtype, or None for floating point storage."""
+    if storage_dtype.is_floating_point:
+        return None, None
+    lo = np.concatenate([np.min([d[k].min(axis=0) for d in data], axis=0) for k in variables])
+    hi = np.concatenate([np.max([d[k].max(axis=0) for d in data], axis=0) for k in variables])
+    scale = (hi - lo) / (2 * torch.iinfo(storage_dtype).max)
+    scale[scale == 0] = 1.0
+    return torch.tensor(scale, dtype=torch.float32), torch.tensor((hi + lo) / 2, dtype=torch.float32)
+
+
+def _variable_storage(vslices, scale, offset):
+    """Map each variable to the (scale, offset) of its columns, as consumed by `_decode`."""
+    return {
+        k: (None, None) if scale is None else (scale[sl], offset[sl])
+        for k, sl in vslices.items()
+    }
+
+
+def _decode(x, storage, dtype=torch.float32):
+    """Upcast stored values to the compute dtype, dequantizing integer storage.
+
+    :param x: (torch.Tensor) stored values of a single variable.
+    :param storage: (tuple) (scale, offset) of the variable's columns, or (None, None).
+    """
+    scale, offset = storage
+    x = x.to(dtype)
+    return x if scale is None else x * scale + offset
+
+
 def _validate_keys(data):
     keys = set(data[0].keys())
     for d in data[1:]:
@@ -119,6 +456,7 @@ class SequenceDataset(Dataset):
         nsteps=1,
         moving_horizon=False,
         name="data",
+        storage_dtype=torch.float32,
     ):
         """Dataset for handling sequential data and transforming it into the dictionary structure
         used by NeuroMANCER models.
@@ -129,6 +467,10 @@ class SequenceDataset(Dataset):
         :param moving_horizon: (bool) if True, generate batches using sliding window with stride 1;
             else use stride N.
         :param name: (str) name of dataset split.
+        :param storage_dtype: (torch.dtype) element type of `full_data`. Reduced precision types
+            (torch.float16, torch.bfloat16) or torch.int16, which quantizes each column linearly over
+            its range, shrink the dataset in memory; batches are upcast to float32 when materialized
+            by `collate_fn`, `get_full_batch`, and `get_full_sequence`.
 
         .. note:: To generate train/dev/test datasets and DataLoaders for each, see the
             `get_sequence_dataloaders` function.
@@ -136,8 +478,10 @@ class SequenceDataset(Dataset):
         .. warning:: This dataset class requires the use of a special collate function that must be
             provided to PyTorch's DataLoader class; see the `collate_fn` method of this class.
 
+        .. note:: For datasets too large to fit in memory, see `MemmapSequenceDataset` and
+            `StreamingSequenceDataset`.
+
         .. todo:: Add support for categorical features.
-        .. todo:: Add support for memory-mapped and/or streaming data.
         .. todo:: Add support for data augmentation?
         .. todo:: Clean up data validation code.
         """
@@ -162,10 +506,9 @@ class SequenceDataset(Dataset):
         self.nsteps = nsteps
 
         self.variables = list(keys)
-        self.full_data = torch.cat(
-            [torch.cat([torch.tensor(d[k], dtype=torch.float) for k in self.variables], dim=1) for d in data],
-            dim=0,
-        )
+        self.storage_dtype = storage_dtype
+        self.scale, self.offset = _quantization_params(data, self.variables, storage_dtype)
+        self.full_data = _stack_variables(data, self.variables, storage_dtype, self.scale, self.offset)
         self.nsim = self.full_data.shape[0]
         self.dims = {k: (self.nsim, *data[0][k].shape[1:],) for k in self.variables}
 
@@ -175,6 +518,7 @@ class SequenceDataset(Dataset):
         for k, v in self.dims.items():
             self._vslices[k] = slice(i, i + v[1], 1)
             i += v[1]
+        self._storage = _variable_storage(self._vslices, self.scale, self.offset)
 
         self.dims = {
             **self.dims,
@@ -184,18 +528,57 @@ class SequenceDataset(Dataset):
             "nsteps": nsteps,
         }
 
-        self.batched_data = torch.cat(
-            [batch_tensor(self.full_data[s, ...] , nsteps, mh=moving_horizon) for s in self._sslices],
-            dim=0,
-        )
+        # a single sequence is windowed as a view of full_data; only multiple sequences are copied
+        batched_data = [batch_tensor(self.full_data[s, ...], nsteps, mh=moving_horizon) for s in self._sslices]
+        self.batched_data = batched_data[0] if len(batched_data) == 1 else torch.cat(batched_data, dim=0)
         self.batched_data = self.batched_data.permute(0, 2, 1)
 
+    def _decode(self, x, k):
+        """Upcast stored values of variable k to float32."""
+        return _decode(x, self._storage[k])
+
+    @classmethod
+    def _restore(
+        cls, full_data, batched_data, variables, dims, sslices, multisequence, moving_horizon, name,
+        storage_dtype=torch.float32, scale=None, offset=None,
+    ):
+        """Rebuild a dataset from arrays previously produced by the constructor, e.g. by
+        `DatasetCache`, without re-validating or re-windowing the data.
+
+        :param full_data: (torch.Tensor) tensor of shape (T, D) holding all variables.
+        :param batched_data: (torch.Tensor or None) tensor of shape (nbatches, nsteps, D); if None,
+            windows are taken as a view of single-sequence `full_data`.
+        """
+        self = cls.__new__(cls)
+        self.name = name
+        self.storage_dtype = storage_dtype
+        self.scale, self.offset = scale, offset
+        self.multisequence = multisequence
+        self._sslices = [slice(start, stop, 1) for start, stop in sslices]
+        self.nsteps = dims["nsteps"]
+        self.variables = list(variables)
+        self.full_data = full_data
+        self.nsim = dims["nsim"]
+        self.dims = {k: v if isinstance(v, int) else tuple(v) for k, v in dims.items()}
+
+        i = 0
+        self._vslices = {}
+        for k in self.variables:
+            self._vslices[k] = slice(i, i + self.dims[k][1], 1)
+            i += self.dims[k][1]
+        self._storage = _variable_storage(self._vslices, self.scale, self.offset)
+
+        if batched_data is None:
+            batched_data = batch_tensor(full_data, self.nsteps, mh=moving_horizon).permute(0, 2, 1)
+        self.batched_data = batched_data
+        return self
+
     def __len__(self):
         """Gives the number of N-step batches in the dataset."""
         return len(self.batched_data) - 1
 
     def __getitem__(self, i):
-        """Fetch a single N-step sequence from the dataset."""
+        """Fetch a single N-step sequence from the dataset, in the storage dtype."""
         return {
             **{
                 k + "p": self.batched_data[i, :, self._vslices[k]]
@@ -207,6 +590,21 @@ class SequenceDataset(Dataset):
             },
         }
 
+    def __getitems__(self, indices):
+        """Fetch a minibatch of N-step sequences with a single gather on `batched_data`. Called by
+        PyTorch's DataLoader in place of per-sample `__getitem__` calls. The gather copies the
+        minibatch once; the returned tensors are views of that copy, already in (nsteps, batch, dim)
+        layout, which `collate_fn` only upcasts.
+
+        :param indices: (list int) indices of the sequences in the minibatch.
+        """
+        idx = torch.as_tensor(indices)
+        batch = self.batched_data[torch.stack([idx, idx + 1])].transpose(1, 2)
+        return {
+            **{k + "p": batch[0, ..., self._vslices[k]] for k in self.variables},
+            **{k + "f": batch[1, ..., self._vslices[k]] for k in self.variables},
+        }
+
     def _get_full_sequence_impl(self, start=0, end=None):
         """Returns the full sequence of data as a dictionary. Useful for open-loop evaluation.
         """
@@ -217,11 +615,11 @@ class SequenceDataset(Dataset):
 
         return {
             **{
-                k + "p": self.full_data[start : end - self.nsteps, self._vslices[k]].unsqueeze(1)
+                k + "p": self._decode(self.full_data[start : end - self.nsteps, self._vslices[k]], k).unsqueeze(1)
                 for k in self.variables
             },
             **{
-                k + "f": self.full_data[start + self.nsteps : end, self._vslices[k]].unsqueeze(1)
+                k + "f": self._decode(self.full_data[start + self.nsteps : end, self._vslices[k]], k).unsqueeze(1)
                 for k in self.variables
             },
             "name": "loop_" + self.name,
@@ -237,11 +635,11 @@ class SequenceDataset(Dataset):
     def get_full_batch(self):
         return {
             **{
-                k + "p": self.batched_data[:-1, :, self._vslices[k]].transpose(0, 1)
+                k + "p": self._decode(self.batched_data[:-1, :, self._vslices[k]], k).transpose(0, 1)
                 for k in self.variables
             },
             **{
-                k + "f": self.batched_data[1:, :, self._vslices[k]].transpose(0, 1)
+                k + "f": self._decode(self.batched_data[1:, :, self._vslices[k]], k).transpose(0, 1)
                 for k in self.variables
             },
             "name": "nstep_" + self.name,
@@ -250,13 +648,15 @@ class SequenceDataset(Dataset):
     def collate_fn(self, batch):
         """Batch collation for dictionaries of samples generated by this dataset. This wraps the
         default PyTorch batch collation function and does some light post-processing to transpose
-        the data for NeuroMANCER models and add a "name" field.
+        the data for NeuroMANCER models, upcast it from the storage dtype, and add a "name" field.
+        Minibatches already gathered by `__getitems__` are not transposed.
 
         :param batch: (dict str: torch.Tensor) dataset sample.
         """
-        batch = default_collate(batch)
+        if not isinstance(batch, dict):
+            batch = {k: v.transpose(0, 1) for k, v in default_collate(batch).items()}
         return {
-            **{k: v.transpose(0, 1) for k, v in batch.items()},
+            **{k: self._decode(v, k[:-1]) for k, v in batch.items()},
             "name": "nstep_" + self.name,
         }
 
@@ -275,11 +675,327 @@ class SequenceDataset(Dataset):
         )
 
 
+def write_memmap(data, path):
+    """Write a data dictionary to a float32 `.npy` file laid out for `MemmapSequenceDataset`, with
+    variables stored as contiguous column blocks of a single (T, D) array.
+
+    :param data: (dict str: np.array) dictionary mapping variable names to arrays of shape (T, Dk).
+    :param path: (str) path of the `.npy` file to write.
+    :return: (dict str: int) variable names mapped to their dimensionality, in column order.
+    """
+    assert _is_sequence_data(data), "data must be provided as a dictionary of equal-length arrays"
+    variables = {k: v.shape[1] for k, v in data.items()}
+    nsim = next(iter(data.values())).shape[0]
+
+    out = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(nsim, sum(variables.values())),
+    )
+    i = 0
+    for k, v in data.items():
+        out[:, i : i + variables[k]] = v
+        i += variables[k]
+    out.flush()
+    del out
+    return variables
+
+
+class MemmapSequenceDataset(Dataset):
+    def __init__(
+        self,
+        path,
+        variables,
+        nsteps=1,
+        moving_horizon=False,
+        dtype=np.float32,
+        page_size=4096,
+        cache_size=16,
+        name="data",
+    ):
+        """Out-of-core counterpart of `SequenceDataset` which builds N-step windows lazily from a
+        memory-mapped file instead of holding the full dataset in memory. Rows are read from disk in
+        fixed-size pages and kept in a small least-recently-used cache, so resident memory is bounded
+        by `page_size * cache_size` time steps no matter how large the file is.
+
+        :param path: (str) path to a `.npy` file or a raw binary file holding a row-major array of
+            shape (T, D), where D is the sum of the dimensionalities of all variables.
+        :param variables: (dict str: int) dictionary mapping variable names to their dimensionality,
+            in the order their columns appear in the file; see `write_memmap`.
+        :param nsteps: (int) N-step prediction horizon for batching data.
+        :param moving_horizon: (bool) if True, generate batches using sliding window with stride 1;
+            else use stride N.
+        :param dtype: (np.dtype) element type of raw binary files; ignored for `.npy` files.
+        :param page_size: (int) number of time steps read from disk per cache page.
+        :param cache_size: (int) maximum number of pages kept in memory.
+        :param name: (str) name of dataset split.
+
+        .. warning:: Like `SequenceDataset`, this class requires its `collate_fn` method to be
+            provided to PyTorch's DataLoader class.
+
+        .. todo:: Add support for multi-sequence data.
+        """
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.variables = list(variables.keys())
+        self.nsteps = nsteps
+        self.stride = 1 if moving_horizon else nsteps
+        self.dtype = np.dtype(dtype)
+        self.page_size = page_size
+        self.cache_size = cache_size
+
+        # _vslices used to slice out sequences of individual variables from pages of data
+        i = 0
+        self._vslices = {}
+        for k, v in variables.items():
+            self._vslices[k] = slice(i, i + v, 1)
+            i += v
+        self.nfeatures = i
+
+        self._data = None
+        self._pages = OrderedDict()
+        self.nsim = self._open().shape[0]
+        assert nsteps < self.nsim, "length of time series data must be greater than nsteps"
+        self.nbatches = (self.nsim - nsteps) // self.stride + 1
+
+        self.dims = {
+            **{k: (self.nsim, v) for k, v in variables.items()},
+            **{k + "p": (self.nsim - 1, v) for k, v in variables.items()},
+            **{k + "f": (self.nsim - 1, v) for k, v in variables.items()},
+            "nsim": self.nsim,
+            "nsteps": nsteps,
+        }
+
+    def _open(self):
+        """Memory-map the backing file on first access; done lazily so that DataLoader workers each
+        open their own handle rather than receiving a pickled copy of the data."""
+        if self._data is None:
+            if os.path.splitext(self.path)[1].lower() == ".npy":
+                self._data = np.load(self.path, mmap_mode="r")
+            else:
+                nrows = os.path.getsize(self.path) // (self.dtype.itemsize * self.nfeatures)
+                self._data = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(nrows, self.nfeatures))
+            assert self._data.ndim == 2 and self._data.shape[1] == self.nfeatures, \
+                f"expected data of shape (T, {self.nfeatures}), got {self._data.shape}"
+        return self._data
+
+    def _page(self, p):
+        page = self._pages.get(p)
+        if page is None:
+            data = self._open()
+            page = torch.from_numpy(
+                np.array(data[p * self.page_size : (p + 1) * self.page_size], dtype=np.float32)
+            )
+            self._pages[p] = page
+            if len(self._pages) > self.cache_size:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(p)
+        return page
+
+    def _rows(self, start, stop):
+        """Fetch time steps [start, stop) as a float tensor, reading through the page cache."""
+        first, last = start // self.page_size, (stop - 1) // self.page_size
+        offset = first * self.page_size
+        if first == last:
+            return self._page(first)[start - offset : stop - offset]
+        pages = torch.cat([self._page(p) for p in range(first, last + 1)], dim=0)
+        return pages[start - offset : stop - offset]
+
+    def __len__(self):
+        """Gives the number of N-step batches in the dataset."""
+        return self.nbatches - 1
+
+    def __getitem__(self, i):
+        """Fetch a single N-step sequence from the dataset."""
+        start = i * self.stride
+        rows = self._rows(start, start + self.stride + self.nsteps)
+        past, future = rows[: self.nsteps], rows[self.stride :]
+        return {
+            **{k + "p": past[:, self._vslices[k]] for k in self.variables},
+            **{k + "f": future[:, self._vslices[k]] for k in self.variables},
+        }
+
+    def get_full_sequence(self):
+        """Returns the full sequence of data as a dictionary. Useful for open-loop evaluation.
+
+        .. warning:: This reads the entire file into memory.
+        """
+        data = torch.from_numpy(np.array(self._open(), dtype=np.float32))
+        return {
+            **{k + "p": data[: -self.nsteps, self._vslices[k]].unsqueeze(1) for k in self.variables},
+            **{k + "f": data[self.nsteps :, self._vslices[k]].unsqueeze(1) for k in self.variables},
+            "name": "loop_" + self.name,
+        }
+
+    def collate_fn(self, batch):
+        """Batch collation for dictionaries of samples generated by this dataset; see
+        `SequenceDataset.collate_fn`.
+
+        :param batch: (dict str: torch.Tensor) dataset sample.
+        """
+        batch = default_collate(batch)
+        return {
+            **{k: v.transpose(0, 1) for k, v in batch.items()},
+            "name": "nstep_" + self.name,
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        state["_pages"] = OrderedDict()
+        return state
+
+    def __repr__(self):
+        varinfo = "\n    ".join([f"{x}: {d}" for x, d in self.dims.items() if x not in {"nsteps", "nsim"}])
+        return (
+            f"{type(self).__name__}:\n"
+            f"  path: {self.path}\n"
+            f"  variables (shapes):\n"
+            f"    {varinfo}\n"
+            f"  nsim: {self.nsim}\n"
+            f"  nsteps: {self.nsteps}\n"
+            f"  batches: {len(self)}\n"
+        )
+
+
+class StreamingSequenceDataset(IterableDataset):
+    def __init__(
+        self,
+        file_or_dir,
+        nsteps=1,
+        moving_horizon=False,
+        chunksize=100000,
+        norm_type=None,
+        stats=None,
+        name="data",
+    ):
+        """Iterable dataset which streams N-step sequences from data files without loading them
+        into memory in full. Files are read in chunks and windows are emitted as soon as they are
+        complete; rows left over at the end of a chunk are carried into the next one so that the
+        sequence pairs produced are identical to those of `SequenceDataset`. Windows never span two
+        files or two experiment runs (`exp_id` column).
+
+        :param file_or_dir: (str) path to a data file or directory of files; see `read_file` for
+            supported formats.
+        :param nsteps: (int) N-step prediction horizon for batching data.
+        :param moving_horizon: (bool) if True, generate batches using sliding window with stride 1;
+            else use stride N.
+        :param chunksize: (int) number of rows read from disk at a time.
+        :param norm_type: (str) optional type of normalization applied to each chunk; see
+            `normalize_data`. Requires `stats` since statistics cannot be inferred from a stream.
+        :param stats: (dict str: np.array) statistics to use for normalization, as returned by
+            `normalize_data` or `stream_stats`.
+        :param name: (str) name of dataset split.
+
+        .. note:: With multiple DataLoader workers, every worker reads all files and keeps an
+            interleaved share of the windows.
+
+        .. warning:: Like `SequenceDataset`, this class requires its `collate_fn` method to be
+            provided to PyTorch's DataLoader class.
+        """
+        super().__init__()
+        assert norm_type is None or stats is not None, \
+            "stats must be provided to normalize streamed data"
+        self.name = name
+        self.files = _list_files(file_or_dir)
+        assert len(self.files) > 0, f"no supported files found in {file_or_dir}"
+        self.nsteps = nsteps
+        self.stride = 1 if moving_horizon else nsteps
+        self.chunksize = chunksize
+        self.norm_type = norm_type
+        self.stats = stats
+
+        chunk, _ = next(_iter_file_chunks(self.files[0], 1))
+        self.variables = list(chunk.keys())
+
+        # _vslices used to slice out sequences of individual variables from buffered rows
+        i = 0
+        self._vslices = {}
+        for k in self.variables:
+            self._vslices[k] = slice(i, i + chunk[k].shape[1], 1)
+            i += chunk[k].shape[1]
+
+        self.dims = {
+            **{k: (None, chunk[k].shape[1]) for k in self.variables},
+            **{k + "p": (None, chunk[k].shape[1]) for k in self.variables},
+            **{k + "f": (None, chunk[k].shape[1]) for k in self.variables},
+            "nsteps": nsteps,
+        }
+
+    def _rows(self, chunk):
+        """Normalize a chunk of variables and stack them into a single (rows, features) array."""
+        if self.norm_type is not None:
+            chunk = {k: _normalize_var(v, k, self.norm_type, self.stats) for k, v in chunk.items()}
+        return np.concatenate([chunk[k] for k in self.variables], axis=1).astype(np.float32)
+
+    def _segments(self, path):
+        """Yield (experiment id, rows) pieces of a file in order, splitting chunks at experiment
+        boundaries."""
+        for chunk, id_ in _iter_file_chunks(path, self.chunksize):
+            assert set(chunk.keys()) == set(self.variables), \
+                "all files must contain the same variables"
+            rows = self._rows(chunk)
+            if id_ is None:
+                yield None, rows
+                continue
+            bounds = [0, *(np.flatnonzero(id_[1:] != id_[:-1]) + 1), len(id_)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                yield id_[start], rows[start:stop]
+
+    def __iter__(self):
+        worker = get_worker_info()
+        nworkers, worker_id = (1, 0) if worker is None else (worker.num_workers, worker.id)
+        count = 0
+        for path in self.files:
+            buffer, current_id = None, None
+            for exp_id, rows in self._segments(path):
+                if buffer is None or exp_id != current_id:
+                    buffer, current_id = rows, exp_id
+                else:
+                    buffer = np.concatenate([buffer, rows], axis=0)
+                data = torch.from_numpy(buffer)
+                pos = 0
+                while pos + self.stride + self.nsteps <= len(buffer):
+                    if count % nworkers == worker_id:
+                        past = data[pos : pos + self.nsteps]
+                        future = data[pos + self.stride : pos + self.stride + self.nsteps]
+                        yield {
+                            **{k + "p": past[:, self._vslices[k]] for k in self.variables},
+                            **{k + "f": future[:, self._vslices[k]] for k in self.variables},
+                        }
+                    count += 1
+                    pos += self.stride
+                buffer = buffer[pos:]
+
+    def collate_fn(self, batch):
+        """Batch collation for dictionaries of samples generated by this dataset; see
+        `SequenceDataset.collate_fn`.
+
+        :param batch: (dict str: torch.Tensor) dataset sample.
+        """
+        batch = default_collate(batch)
+        return {
+            **{k: v.transpose(0, 1) for k, v in batch.items()},
+            "name": "nstep_" + self.name,
+        }
+
+    def __repr__(self):
+        varinfo = "\n    ".join([f"{x}: {d}" for x, d in self.dims.items() if x != "nsteps"])
+        return (
+            f"{type(self).__name__}:\n"
+            f"  files: {len(self.files)}\n"
+            f"  variables (shapes):\n"
+            f"    {varinfo}\n"
+            f"  nsteps: {self.nsteps}\n"
+        )
+
+
 class StaticDataset(Dataset):
     def __init__(
         self,
         data,
         name="data",
+        storage_dtype=torch.float32,
     ):
         """Dataset for handling static data and transforming it into the dictionary structure
         used by NeuroMANCER models.
@@ -287,6 +1003,7 @@ class StaticDataset(Dataset):
         :param data: (dict str: np.array) dictionary mapping variable names to tensors of shape
             (N, Dk), where N is the number of samples and Dk is dimensionality of variable k.
         :param name: (str) name of dataset split.
+        :param storage_dtype: (torch.dtype) element type of `full_data`; see `SequenceDataset`.
 
         .. warning:: This dataset class requires the use of a special collate function that must be
             provided to PyTorch's DataLoader class; see the `collate_fn` method of this class.
@@ -301,7 +1018,9 @@ class StaticDataset(Dataset):
         self.name = name
 
         self.variables = list(data.keys())
-        self.full_data = torch.cat([torch.tensor(data[k], dtype=torch.float) for k in self.variables], dim=1)
+        self.storage_dtype = storage_dtype
+        self.scale, self.offset = _quantization_params([data], self.variables, storage_dtype)
+        self.full_data = _stack_variables([data], self.variables, storage_dtype, self.scale, self.offset)
 
         self.nsamples = self.full_data.shape[0]
         self.dims = {k: (self.nsamples, *data[k].shape[1:],) for k in self.variables}
@@ -312,6 +1031,7 @@ class StaticDataset(Dataset):
         for k, v in self.dims.items():
             self._vslices[k] = slice(i, i + v[1], 1)
             i += v[1]
+        self._storage = _variable_storage(self._vslices, self.scale, self.offset)
 
         self.dims = {
             **self.dims,
@@ -323,15 +1043,24 @@ class StaticDataset(Dataset):
         return self.nsamples
 
     def __getitem__(self, i):
-        """Fetch a single sample from the dataset."""
+        """Fetch a single sample from the dataset, in the storage dtype."""
         return {
             k: self.full_data[i, self._vslices[k]]
             for k in self.variables
         }
 
+    def __getitems__(self, indices):
+        """Fetch a minibatch of samples with a single gather on `full_data`; see
+        `SequenceDataset.__getitems__`.
+
+        :param indices: (list int) indices of the samples in the minibatch.
+        """
+        batch = self.full_data[torch.as_tensor(indices)]
+        return {k: batch[:, self._vslices[k]] for k in self.variables}
+
     def get_full_batch(self):
         batch = {
-            k: self.full_data[:, self._vslices[k]]
+            k: _decode(self.full_data[:, self._vslices[k]], self._storage[k])
             for k in self.variables
         }
         batch["name"] = self.name
@@ -339,11 +1068,14 @@ class StaticDataset(Dataset):
 
     def collate_fn(self, batch):
         """Batch collation for dictionaries of samples generated by this dataset. This wraps the
-        default PyTorch batch collation function and simply adds a "name" field to a batch.
+        default PyTorch batch collation function, upcasts the batch from the storage dtype, and
+        adds a "name" field to a batch. Minibatches already gathered by `__getitems__` skip the
+        default collation.
 
         :param batch: (dict str: torch.Tensor) dataset sample.
         """
-        batch = default_collate(batch)
+        batch = batch if isinstance(batch, dict) else default_collate(batch)
+        batch = {k: _decode(v, self._storage[k]) for k, v in batch.items()}
         batch["name"] = self.name
         return batch
 
@@ -363,7 +1095,8 @@ def normalize_data(data, norm_type, stats=None):
     :param data: (dict str: np.array) data dictionary.
     :param norm_type: (str) type of normalization to use; can be "zero-one", "one-one", or "zscore".
     :param stats: (dict str: np.array) statistics to use for normalization. Default is None, in which
-        case stats are inferred by underlying normalization function.
+        case stats are inferred by underlying normalization function. Statistics of data too large
+        to fit in memory can be computed with `stream_stats` or `accumulate_stats`.
     """
     multisequence = _is_multisequence_data(data)
     assert _is_sequence_data(data) or multisequence, \
@@ -372,16 +1105,17 @@ def normalize_data(data, norm_type, stats=None):
     if not multisequence:
         data = [data]
 
-    if stats is None:
-        norm_fn = lambda x, _: norm_fns[norm_type](x)
-    else:
-        norm_fn = lambda x, k: norm_fns[norm_type](
-            x,
-            stats[k + "_min"].reshape(1, -1),
-            stats[k + "_max"].reshape(1, -1),
-        )
-
     keys = data[0].keys()
+    if stats is not None:
+        # with statistics known up front, sequences are normalized separately without concatenation
+        data = [{k: _normalize_var(v, k, norm_type, stats) for k, v in d.items()} for d in data]
+        stats = {
+            **{k + "_min": np.asarray(stats[k + "_min"]).reshape(-1) for k in keys},
+            **{k + "_max": np.asarray(stats[k + "_max"]).reshape(-1) for k in keys},
+        }
+        return data if multisequence else data[0], stats
+
+    norm_fn = lambda x, _: norm_fns[norm_type](x)
     slices = _get_sequence_time_slices(data)
     data = {k: np.concatenate([v[k] for v in data], axis=0) for k in keys}
 
@@ -397,6 +1131,132 @@ def normalize_data(data, norm_type, stats=None):
     return data if multisequence else data[0], stats
 
 
+def _normalize_var(x, k, norm_type, stats):
+    """Normalize the array of variable `k` with statistics in the format returned by `normalize_data`."""
+    return norm_fns[norm_type](
+        x,
+        np.asarray(stats[k + "_min"]).reshape(1, -1),
+        np.asarray(stats[k + "_max"]).reshape(1, -1),
+    )[0]
+
+
+class RunningStats:
+    def __init__(self):
+        """Single-pass accumulator of per-column count, minimum, maximum, mean, and variance of a
+        stream of (N, D) arrays. Chunks are combined with the pairwise update of Chan et al., a
+        batched generalization of Welford's algorithm, so partial statistics computed over separate
+        chunks, files, or processes can be merged exactly with `merge`.
+        """
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        """Accumulate a chunk of data.
+
+        :param x: (np.array) array of shape (N, D).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.shape[0] == 0:
+            return self
+        other = RunningStats()
+        other.count = x.shape[0]
+        other.min = x.min(axis=0)
+        other.max = x.max(axis=0)
+        other.mean = x.mean(axis=0)
+        other.m2 = ((x - other.mean) ** 2).sum(axis=0)
+        return self.merge(other)
+
+    def merge(self, other):
+        """Merge statistics accumulated by another `RunningStats` into this one.
+
+        :param other: (RunningStats) partial statistics over disjoint data.
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.min, self.max, self.mean, self.m2 = \
+                other.count, other.min, other.max, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / count)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.count = count
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def norm_stats(self, norm_type):
+        """Statistics used by the normalization function `norm_fns[norm_type]`, in the order the
+        function returns them: (mean, std) for "zscore", else (min, max)."""
+        return (self.mean, self.std) if norm_type == "zscore" else (self.min, self.max)
+
+
+def accumulate_stats(chunks, accumulators=None):
+    """Accumulate per-variable statistics over an iterable of data dictionaries in a single pass.
+
+    :param chunks: (iterable dict str: np.array) chunks of data, e.g. sequences, files, or row blocks.
+    :param accumulators: (dict str: RunningStats) optional partial statistics to continue from.
+    :return: (dict str: RunningStats) statistics of each variable.
+    """
+    accumulators = {} if accumulators is None else accumulators
+    for chunk in chunks:
+        for k, v in chunk.items():
+            accumulators.setdefault(k, RunningStats()).update(v)
+    return accumulators
+
+
+def merge_stats(*partials):
+    """Merge per-variable partial statistics, e.g. computed by parallel workers over separate files.
+
+    :param partials: (dict str: RunningStats) outputs of `accumulate_stats`.
+    :return: (dict str: RunningStats) combined statistics.
+    """
+    merged = {}
+    for partial in partials:
+        for k, v in partial.items():
+            merged.setdefault(k, RunningStats()).merge(v)
+    return merged
+
+
+def finalize_stats(accumulators, norm_type):
+    """Convert accumulated statistics into the format taken by the `stats` argument of
+    `normalize_data` and `StreamingSequenceDataset`.
+
+    :param accumulators: (dict str: RunningStats) per-variable statistics.
+    :param norm_type: (str) type of normalization; see `normalize_data`.
+    :return: (dict str: np.array) normalization statistics.
+    """
+    stats = {k: v.norm_stats(norm_type) for k, v in accumulators.items()}
+    return {
+        **{k + "_min": v[0] for k, v in stats.items()},
+        **{k + "_max": v[1] for k, v in stats.items()},
+    }
+
+
+def stream_stats(file_or_dir, norm_type, chunksize=100000):
+    """Compute normalization statistics of data files in a single out-of-core pass.
+
+    :param file_or_dir: (str) path to a data file or directory of files.
+    :param norm_type: (str) type of normalization; see `normalize_data`.
+    :param chunksize: (int) number of rows read at a time.
+    :return: (dict str: np.array) normalization statistics; see `finalize_stats`.
+    """
+    chunks = (chunk for path in _list_files(file_or_dir) for chunk, _ in _iter_file_chunks(path, chunksize))
+    return finalize_stats(accumulate_stats(chunks), norm_type)
+
+
 def split_sequence_data(data, nsteps, moving_horizon=False, split_ratio=None):
     """Split a data dictionary into train, development, and test sets. Splits data into thirds by
     default, but arbitrary split ratios for train and development can be provided.
@@ -468,6 +1328,174 @@ def split_static_data(data, split_ratio=None):
     return train_data, dev_data, test_data
 
 
+class DatasetCache:
+    FORMAT_VERSION = 2
+    SPLITS = ("train", "dev", "test")
+
+    def __init__(self, cache_dir, max_bytes=10 * 2 ** 30):
+        """On-disk cache for the `read_file` -> `normalize_data` -> `split_sequence_data` ->
+        `SequenceDataset` pipeline. Entries are keyed by a hash of the source file contents together
+        with the preprocessing parameters, and store the normalized, split, and windowed arrays as
+        `.npy` files which are memory-mapped on load, so warm starts skip preprocessing entirely.
+        Least-recently-used entries are evicted once the cache exceeds its disk budget. Arrays are
+        stored in the `storage_dtype` of the datasets, so reduced precision storage also shrinks
+        the cache on disk.
+
+        :param cache_dir: (str) directory in which cache entries are stored.
+        :param max_bytes: (int) disk budget for all cache entries combined.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _hash_files(file_or_dir, blocksize=2 ** 20):
+        digest = hashlib.sha256()
+        for path in _list_files(file_or_dir):
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(blocksize), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def key(
+        self, file_or_dir, nsteps, moving_horizon=False, norm_type=None, split_ratio=None,
+        storage_dtype=torch.float32,
+    ):
+        """Cache key of a source file or directory and set of preprocessing parameters.
+
+        :return: (str) hexadecimal digest identifying the cache entry.
+        """
+        params = json.dumps({
+            "version": self.FORMAT_VERSION,
+            "files": self._hash_files(file_or_dir),
+            "nsteps": nsteps,
+            "moving_horizon": moving_horizon,
+            "norm_type": norm_type,
+            "split_ratio": split_ratio,
+            "storage_dtype": str(storage_dtype),
+        }, sort_keys=True)
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    def get_sequence_datasets(
+        self, file_or_dir, nsteps, moving_horizon=False, norm_type=None, split_ratio=None,
+        storage_dtype=torch.float32,
+    ):
+        """Load train, development, and test `SequenceDataset`s from the cache, running and caching
+        the preprocessing pipeline on a miss.
+
+        :param file_or_dir: (str) path to a data file or directory; see `read_file`.
+        :param nsteps: (int) N-step prediction horizon for batching data.
+        :param moving_horizon: (bool) if True, generate batches using sliding window with stride 1.
+        :param norm_type: (str) type of normalization; see `normalize_data`. None skips normalization.
+        :param split_ratio: (list float) percentage of data in train and development splits; see
+            `split_sequence_data`.
+        :param storage_dtype: (torch.dtype) element type of the dataset arrays; see `SequenceDataset`.
+        :return: ((SequenceDataset, SequenceDataset, SequenceDataset), dict str: np.array) datasets and
+            normalization statistics.
+        """
+        key = self.key(file_or_dir, nsteps, moving_horizon, norm_type, split_ratio, storage_dtype)
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            data = read_file(file_or_dir)
+            stats = {}
+            if norm_type is not None:
+                data, stats = normalize_data(data, norm_type)
+            splits = split_sequence_data(data, nsteps, moving_horizon, split_ratio)
+            datasets = [
+                SequenceDataset(
+                    split, nsteps=nsteps, moving_horizon=moving_horizon, name=name, storage_dtype=storage_dtype,
+                )
+                for split, name in zip(splits, self.SPLITS)
+            ]
+            self._write(entry, datasets, stats, moving_horizon)
+            self._evict(keep=key)
+        return self._read(entry)
+
+    def _write(self, entry, datasets, stats, moving_horizon):
+        tmp = f"{entry}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        meta = {"moving_horizon": moving_horizon, "storage_dtype": str(datasets[0].storage_dtype)}
+        for dataset in datasets:
+            np.save(os.path.join(tmp, f"{dataset.name}_full_data.npy"), self._to_numpy(dataset.full_data))
+            if dataset.multisequence:
+                np.save(os.path.join(tmp, f"{dataset.name}_batched_data.npy"), self._to_numpy(dataset.batched_data))
+            if dataset.scale is not None:
+                np.savez(os.path.join(tmp, f"{dataset.name}_quantization.npz"),
+                         scale=dataset.scale.numpy(), offset=dataset.offset.numpy())
+            meta[dataset.name] = {
+                "variables": dataset.variables,
+                "dims": dataset.dims,
+                "sslices": [(sl.start, sl.stop) for sl in dataset._sslices],
+                "multisequence": dataset.multisequence,
+            }
+        np.savez(os.path.join(tmp, "stats.npz"), **stats)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another process populated the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def _to_numpy(x):
+        # numpy has no bfloat16, so its bits are stored as int16 and reinterpreted on load
+        return (x.view(torch.int16) if x.dtype == torch.bfloat16 else x).numpy()
+
+    @staticmethod
+    def _from_numpy(x, dtype):
+        x = torch.from_numpy(x)
+        return x.view(torch.bfloat16) if dtype == torch.bfloat16 else x
+
+    def _read(self, entry):
+        meta_path = os.path.join(entry, "meta.json")
+        os.utime(meta_path)  # mark as recently used
+        with open(meta_path) as f:
+            meta = json.load(f)
+        storage_dtype = getattr(torch, meta["storage_dtype"].split(".")[-1])
+        datasets = []
+        for name in self.SPLITS:
+            batched_path = os.path.join(entry, f"{name}_batched_data.npy")
+            quantization_path = os.path.join(entry, f"{name}_quantization.npz")
+            full_data = self._from_numpy(
+                np.load(os.path.join(entry, f"{name}_full_data.npy"), mmap_mode="c"), storage_dtype,
+            )
+            batched_data = (
+                self._from_numpy(np.load(batched_path, mmap_mode="c"), storage_dtype)
+                if os.path.exists(batched_path) else None
+            )
+            scale = offset = None
+            if os.path.exists(quantization_path):
+                with np.load(quantization_path) as f:
+                    scale, offset = torch.from_numpy(f["scale"]), torch.from_numpy(f["offset"])
+            datasets.append(SequenceDataset._restore(
+                full_data, batched_data, moving_horizon=meta["moving_horizon"], name=name,
+                storage_dtype=storage_dtype, scale=scale, offset=offset, **meta[name],
+            ))
+        with np.load(os.path.join(entry, "stats.npz")) as f:
+            stats = dict(f)
+        return tuple(datasets), stats
+
+    def _evict(self, keep=None):
+        """Remove least-recently-used entries until the cache fits within its disk budget."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            meta_path = os.path.join(path, "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(meta_path), size, key, path))
+        total = sum(e[1] for e in entries)
+        for _, size, key, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
 def standardize(M, mean=None, std=None):
     mean = M.mean(axis=0).reshape(1, -1) if mean is None else mean
     std = M.std(axis=0).reshape(1, -1) if std is None else std
@@ -0,0 +1,245 @@
+"""
+Vectorized training of ensembles of structurally identical Problems.
+
+The parameters of K copies of a Problem are stacked along a new leading dimension and the Problem
+is evaluated for all members at once with torch.func.vmap, so a single forward and backward pass
+updates every member on the same batch.
+"""
+from copy import deepcopy
+
+import torch
+from torch.func import functional_call, stack_module_state, vmap
+
+from neuromancer.callbacks import Callback
+from neuromancer.loggers import BasicLogger
+from neuromancer.metrics import MetricAccumulator, batch_size
+from neuromancer.trainer import move_batch_to_device
+
+
+class EnsembleTrainer:
+    """
+    Trains K members of an ensemble of Problems with identical structure (e.g. different random
+    initializations or an uncertainty ensemble) in lockstep. Each member keeps its own early stopping
+    counter and best model; members whose patience is exhausted stop being tracked, and training ends
+    once every member has stopped or the epoch budget is reached.
+
+    Metrics in the output dictionaries passed to callbacks are tensors with a leading dimension of
+    size K; the logger receives their mean over members along with the number of active members.
+    """
+    def __init__(
+        self,
+        problems,
+        train_data: torch.utils.data.DataLoader,
+        dev_data: torch.utils.data.DataLoader,
+        test_data: torch.utils.data.DataLoader,
+        optimizer=torch.optim.Adam,
+        logger: BasicLogger = None,
+        callback=Callback(),
+        epochs=1000,
+        patience=5,
+        warmup=0,
+        train_metric="nstep_train_loss",
+        dev_metric="nstep_dev_loss",
+        test_metric="nstep_test_loss",
+        eval_metric="loop_dev_loss",
+        eval_mode="min",
+        clip=100.0,
+        device="cpu"
+    ):
+        """
+
+        :param problems: (list of nm.problem.Problem) Ensemble members with identical structure
+        :param train_data: (torch DataLoader)
+        :param dev_data: (torch DataLoader)
+        :param test_data: (torch DataLoader)
+        :param optimizer: (callable) Takes the list of stacked parameter tensors and returns a torch
+                                     Optimizer, e.g. functools.partial(torch.optim.Adam, lr=0.001).
+                                     Element-wise optimizers such as SGD or Adam update members independently.
+        :param logger: (nm.Logger)
+        :param callback: (nm.CallBack)
+        :param epochs: (int) Number of epochs to train
+        :param patience: (int) Number of epochs to allow no improvement of a member before it stops
+        :param warmup: (int) How many epochs to wait before enacting early stopping policy
+        :param train_metric: (str) Performance metric (calculated by problem) for gradient based optimization
+        :param dev_metric: (str) Performance metric for ad hoc evaluation on development data set
+        :param test_metric: (str) Performance metric for ad hoc evaluation on test data set
+        :param eval_metric: (str) Performance metric (calculated by problem) for model selection and early stopping
+        :param eval_mode: (str) 'min' to minimize eval_metric; any other string to maximize it
+        :param clip: (float) Limit for gradient clipping, applied to the gradient norm of each member
+        :param device: (str) String denoting device to place computations on
+        """
+        assert len(problems) > 0, "ensemble must have at least one member"
+        self.nmembers = len(problems)
+        self.params, self.buffers = stack_module_state([p.to(device) for p in problems])
+        # stateless copy of the problem structure, called with the parameters of each member
+        self.model = deepcopy(problems[0]).to("meta")
+        self.optimizer = optimizer(list(self.params.values()))
+        self.train_data = train_data
+        self.dev_data = dev_data
+        self.test_data = test_data
+        self.callback = callback
+        self.logger = logger
+        self.epochs = epochs
+        self.current_epoch = 0
+        self.logger.log_weights(problems[0])
+        self.train_metric = train_metric
+        self.dev_metric = dev_metric
+        self.test_metric = test_metric
+        self.eval_metric = eval_metric
+        self._eval_min = eval_mode == "min"
+        self.patience = patience
+        self.warmup = warmup
+        self.clip = clip
+        self.device = device
+        self.badcount = torch.zeros(self.nmembers, dtype=torch.long)
+        self.active = torch.ones(self.nmembers, dtype=torch.bool)
+        self.best_devloss = torch.full((self.nmembers,), float("inf") if self._eval_min else -float("inf"))
+        self.best_model = {k: v.detach().clone() for k, v in {**self.params, **self.buffers}.items()}
+        self._forward = vmap(self._call, in_dims=(0, 0, None), randomness="different")
+
+    def _call(self, params, buffers, batch):
+        output = functional_call(self.model, (params, buffers), (batch,))
+        return {k: v for k, v in output.items() if isinstance(v, torch.Tensor)}
+
+    def forward(self, batch, params=None):
+        """
+        Evaluate every member of the ensemble on the same batch.
+
+        :param batch: (dict str: torch.Tensor) batch of data
+        :param params: (dict str: torch.Tensor) stacked parameters and buffers; defaults to the current ones
+        :return: (dict str: torch.Tensor) output of the problem with a leading member dimension
+        """
+        if params is None:
+            return self._forward(self.params, self.buffers, batch)
+        return self._forward({k: params[k] for k in self.params}, {k: params[k] for k in self.buffers}, batch)
+
+    def train(self):
+        """
+        Optimize all members according to train_metric and validate per-epoch according to eval_metric.
+
+        :return: (list of dict str: torch.Tensor) state dictionaries of the best model of each member
+        """
+        self.callback.begin_train(self)
+
+        for i in range(self.epochs):
+            self.current_epoch = i
+            output = self.train_epoch()
+            self.callback.begin_epoch(self, output)
+
+            with torch.no_grad():
+                output = {**output, **self.evaluate_data(self.dev_data, self.dev_metric)}
+                self.callback.begin_eval(self, output)
+
+                value = output[self.eval_metric].detach().cpu()
+                improved = self.active & (value < self.best_devloss if self._eval_min else value > self.best_devloss)
+                if improved.any():
+                    for k, v in {**self.params, **self.buffers}.items():
+                        self.best_model[k][improved] = v.detach()[improved.to(v.device)]
+                    self.best_devloss[improved] = value[improved]
+                self.badcount[improved] = 0
+                if i > self.warmup:
+                    self.badcount[self.active & ~improved] += 1
+                self.active &= self.badcount <= self.patience
+                self.logger.log_metrics(self._summarize(output), step=i)
+
+                self.callback.end_eval(self, output)
+
+                self.callback.end_epoch(self, output)
+
+                if not self.active.any():
+                    break
+
+        self.callback.end_train(self, output)
+
+        best_models = self.member_state_dicts()
+        self.logger.log_artifacts({"best_model_state_dicts.pth": best_models})
+        return best_models
+
+    def train_epoch(self):
+        """
+        Run one pass of gradient based optimization of all members over the training data.
+
+        :return: (dict str: torch.Tensor) output of the last batch with the epoch mean of train_metric
+        """
+        self.model.train()
+        metrics = MetricAccumulator([self.train_metric])
+        for t_batch in self.train_data:
+            t_batch = move_batch_to_device(t_batch, self.device)
+            output = self.forward(t_batch)
+            self.optimizer.zero_grad()
+            # members are independent, so the gradient of the sum is the gradient of each member's loss
+            output[self.train_metric].sum().backward()
+            self.clip_grad_norm()
+            self.optimizer.step()
+            metrics.update(output, weight=batch_size(t_batch))
+            self.callback.end_batch(self, output)
+        output.update(metrics.means())
+        return output
+
+    def clip_grad_norm(self):
+        """
+        Scale the gradients of each member so that their total norm does not exceed self.clip.
+        """
+        grads = [p.grad for p in self.params.values() if p.grad is not None]
+        if not grads:
+            return
+        norms = torch.stack([g.flatten(1).pow(2).sum(1) for g in grads]).sum(0).sqrt()
+        scale = (self.clip / (norms + 1e-6)).clamp(max=1.0)
+        for g in grads:
+            g.mul_(scale.view(-1, *[1] * (g.ndim - 1)))
+
+    def evaluate_data(self, data, metric, params=None):
+        """
+        Evaluate all members on every batch of a data split.
+
+        :param data: (torch DataLoader) data split to evaluate
+        :param metric: (str) metric whose mean over batches is recorded as mean_{metric}
+        :param params: (dict str: torch.Tensor) stacked parameters and buffers; defaults to the current ones
+        :return: (dict str: torch.Tensor) output of the last batch with the mean of metric per member
+        """
+        self.model.eval()
+        metrics = MetricAccumulator([metric])
+        for batch in data:
+            batch = move_batch_to_device(batch, self.device)
+            output = self.forward(batch, params)
+            metrics.update(output, weight=batch_size(batch))
+        output.update(metrics.means())
+        return output
+
+    def test(self, best_model=None):
+        """
+        Evaluate the best model of every member on all data splits.
+
+        :param best_model: (dict str: torch.Tensor) stacked parameters and buffers; defaults to self.best_model
+        :return: (dict str: torch.Tensor) outputs with a leading member dimension
+        """
+        best_model = self.best_model if best_model is None else best_model
+        with torch.no_grad():
+            self.callback.begin_test(self)
+            output = {}
+            for dset, metric in zip([self.train_data, self.dev_data, self.test_data],
+                                    [self.train_metric, self.dev_metric, self.test_metric]):
+                output = {**output, **self.evaluate_data(dset, metric, best_model)}
+
+        self.callback.end_test(self, output)
+        self.logger.log_metrics({f"best_{k}": v for k, v in self._summarize(output).items()})
+
+        return output
+
+    def member_state_dicts(self, params=None):
+        """
+        Unstack parameters and buffers into a state dictionary for each member.
+
+        :param params: (dict str: torch.Tensor) stacked parameters and buffers; defaults to self.best_model
+        :return: (list of dict str: torch.Tensor) state dictionaries loadable into the member problems
+        """
+        params = self.best_model if params is None else params
+        return [{k: v[i].clone() for k, v in params.items()} for i in range(self.nmembers)]
+
+    def _summarize(self, output):
+        summary = {
+            k: v.float().mean() for k, v in output.items()
+            if isinstance(v, torch.Tensor) and v.ndim == 1 and v.shape[0] == self.nmembers
+        }
+        summary["active_members"] = self.active.sum()
+        return summary
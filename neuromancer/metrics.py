@@ -0,0 +1,108 @@
+"""
+Accumulation of metrics over the batches of a data split.
+
+>>> metrics = MetricAccumulator(["train_loss"])
+>>> for batch in data:
+>>>     output = problem(batch)
+>>>     metrics.update(output, weight=batch_size(batch))
+>>> metrics.means()
+{'mean_train_loss': tensor(0.1)}
+"""
+import torch
+
+
+def batch_dim(x):
+    """
+    Batch dimension of a tensor: dimension 1 of tensors with three or more dimensions (sequence data
+    stored as (nsteps, batch, dim)) and dimension 0 otherwise.
+
+    :param x: (torch.Tensor)
+    :return: (int)
+    """
+    return 1 if x.ndim >= 3 else 0
+
+
+def batch_size(batch):
+    """
+    Number of samples in a batch: the size of the batch dimension (see batch_dim) of its tensors.
+
+    :param batch: (dict str: torch.Tensor) batch of data
+    :return: (int) size of the batch dimension of the first tensor in batch, or 1 if it has none
+    """
+    for v in batch.values():
+        if isinstance(v, torch.Tensor) and v.ndim > 0:
+            return v.shape[batch_dim(v)]
+    return 1
+
+
+class MetricAccumulator:
+    """
+    Keeps running weighted sums, total weights, minima, and maxima of output values over batches.
+
+    Values are detached when accumulated so that the autograd graph of each batch is freed with
+    its output, and the statistics stay tensors on the device of the values, so that reading them
+    does not synchronize with the device.
+    """
+    def __init__(self, keys):
+        """
+
+        :param keys: (list of str) keys of the output dictionary to accumulate
+        """
+        self.keys = list(keys)
+        self.reset()
+
+    def register(self, key):
+        """
+        Accumulate an additional key from the next update on.
+
+        :param key: (str) key of the output dictionary
+        """
+        if key not in self.keys:
+            self.keys.append(key)
+
+    def reset(self):
+        self.sums, self.counts, self.mins, self.maxs = {}, {}, {}, {}
+
+    def update(self, output, weight=1):
+        """
+        Accumulate the values of the registered keys which are present in output.
+
+        :param output: (dict str: torch.Tensor) output of a batch
+        :param weight: (int or float) weight of the batch, e.g. its number of samples
+        """
+        for k in self.keys:
+            if k not in output:
+                continue
+            value = output[k].detach()
+            if k not in self.sums:
+                self.sums[k], self.counts[k] = value * weight, weight
+                self.mins[k], self.maxs[k] = value, value
+            else:
+                self.sums[k] = self.sums[k] + value * weight
+                self.counts[k] += weight
+                self.mins[k] = torch.minimum(self.mins[k], value)
+                self.maxs[k] = torch.maximum(self.maxs[k], value)
+
+    def mean(self, key):
+        """
+        :param key: (str) accumulated key
+        :return: (torch.Tensor) weighted mean of the values of key
+        """
+        return self.sums[key] / self.counts[key]
+
+    def means(self):
+        """
+        :return: (dict str: torch.Tensor) weighted mean of every accumulated key as mean_{key}
+        """
+        return {f"mean_{k}": self.mean(k) for k in self.sums}
+
+    def summary(self):
+        """
+        :return: (dict str: torch.Tensor) weighted mean, minimum, and maximum of every accumulated
+                 key as mean_{key}, min_{key}, and max_{key}
+        """
+        return {
+            **self.means(),
+            **{f"min_{k}": v for k, v in self.mins.items()},
+            **{f"max_{k}": v for k, v in self.maxs.items()},
+        }
@@ -2,20 +2,72 @@
 
 """
 # python base imports
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
 from typing import Dict, List, Callable
+import os
+import warnings
+import weakref
 
 # machine learning/data science imports
 import torch
 import torch.nn as nn
 
-from neuromancer.constraint import Variable, Loss
+from neuromancer.constraint import Variable, Loss, LossGraph
+from neuromancer.component import Component
+
+
+def _runs_only_hooks(module, pre_hooks=(), hooks=()):
+    """
+    Whether calling module runs no hooks besides the given forward pre-hooks and forward hooks,
+    so that module.forward can be called in its place.
+    """
+    global_hooks = [getattr(nn.modules.module, h, {}) for h in
+                    ["_global_forward_pre_hooks", "_global_forward_hooks", "_global_backward_hooks",
+                     "_global_backward_pre_hooks"]]
+    return not any(global_hooks) and not module._backward_hooks and not module._backward_pre_hooks \
+        and list(module._forward_pre_hooks.values()) == list(pre_hooks) \
+        and list(module._forward_hooks.values()) == list(hooks)
+
+
+def _compile_errors():
+    """
+    Exceptions raised by torch.compile when it cannot compile a function, as opposed to errors of the
+    compiled code itself. Imported on demand, as torch._dynamo is slow to import.
+    """
+    from torch._dynamo.exc import BackendCompilerFailed, Unsupported
+    return BackendCompilerFailed, Unsupported
+
+
+def _thread_state():
+    """
+    Thread-local state of the calling thread which forward passes depend on: grad mode, inference mode,
+    and the enabled autocast device types with their dtypes.
+    """
+    autocast = [(device, torch.get_autocast_dtype(device)) for device in ["cpu", "cuda"]
+                if torch.is_autocast_enabled(device)]
+    return torch.is_grad_enabled(), torch.is_inference_mode_enabled(), autocast
+
+
+def _call_with_state(component, data, state):
+    """
+    Call component on data on a worker thread under the thread-local state of the submitting thread.
+    """
+    grad, inference, autocast = state
+    with ExitStack() as stack:
+        stack.enter_context(torch.inference_mode(inference))
+        stack.enter_context(torch.set_grad_enabled(grad))
+        for device, dtype in autocast:
+            stack.enter_context(torch.autocast(device, dtype=dtype))
+        return component(data)
 
 
 class Problem(nn.Module):
 
     def __init__(self, objectives: List[Loss], constraints: List[Loss],
                  components: List[Callable[[Dict[str, torch.Tensor]], Dict[str, torch.Tensor]]],
-                 grad_inference=False):
+                 grad_inference=False, torch_compile=False, plan=False, concurrent=False,
+                 loss_graph=False):
         """
         This is similar in spirit to a nn.Sequential module. However,
         by concatenating input and output dictionaries for each component
@@ -27,6 +79,27 @@ class Problem(nn.Module):
         :param objectives: list of objects which implement the Loss interface (e.g. Objective, Loss, or Constraint)
         :param constraints: list of objects which implement the Loss interface (e.g. Objective, Loss, or Constraint)
         :param components: list of objects which implement the component interface (e.g. Function, Policy, Estimator)
+        :param grad_inference: (bool) Whether gradients are enabled during evaluation of the Trainer
+        :param torch_compile: (bool or dict) If truthy, forward passes run through torch.compile, given the dict as
+                              keyword arguments (by default dynamic=False, so that every nsteps and batch shape is
+                              specialized). The first call with each signature of input names, shapes, and dtypes
+                              runs eagerly with all checks, and compilation failures fall back to eager execution
+                              with a warning. Other errors are raised.
+        :param plan: (bool) If True, the first call with each set of input keys and data name runs eagerly with all
+                     checks and records a flat execution plan, which later calls with the same keys execute into
+                     a single dict, bypassing the input and output checks of components and per-call dict merges.
+                     Input keys and output keys of every component must not depend on the values of the data.
+        :param concurrent: (bool or int) If truthy, components are grouped into levels of the computation graph given
+                           by their input_keys and output_keys (see levels), and the components of a level run
+                           concurrently on a pool of this many worker threads (os.cpu_count() if True) besides
+                           the calling thread. Outputs are merged in the order of components, so that results are
+                           the same as in sequential execution. Components must not read keys of the data besides
+                           their input_keys. Cannot be combined with torch_compile or plan. The threads are
+                           stopped by close() or when the problem is garbage collected.
+        :param loss_graph: (bool or dict) If truthy, objectives and constraints which are not components are evaluated
+                           by a LossGraph, which computes subexpressions shared by their Variable trees once per
+                           call, given the dict as keyword arguments, e.g. {"group_constraints": True} to evaluate
+                           LT, GT, and Eq constraints in vectorized groups.
         """
         super().__init__()
         self.objectives = nn.ModuleList(objectives)
@@ -34,6 +107,19 @@ class Problem(nn.Module):
         self.components = nn.ModuleList(components)
         self._check_unique_names()
         self.grad_inference = grad_inference
+        self.torch_compile = torch_compile
+        self._compiled = None
+        self._validated = set()
+        self.plan = plan
+        self._plans = {}
+        self._dependencies = {}
+        assert not (concurrent and (torch_compile or plan)), \
+            "Concurrent execution cannot be combined with torch_compile or plan."
+        self.concurrent = concurrent
+        self._executor = None
+        self._levels = {}
+        self.loss_graph = loss_graph
+        self._loss_graphs = {}
 
     def _check_unique_names(self):
         num_unique = len(set([o.name for o in self.objectives] + [c.name for c in self.constraints]))
@@ -46,51 +132,291 @@ class Problem(nn.Module):
             f'Name collision in input and output dictionaries, Input_keys: {input_dict.keys()},' \
             f'Output_keys: {output_dict.keys()}'
 
-    def calculate_loss(self, input_dict: Dict[str, torch.Tensor]) -> torch.Tensor:
+    def calculate_loss(self, input_dict: Dict[str, torch.Tensor], validate=True, terms=None) -> torch.Tensor:
         """
 
         :param input_dict:
+        :param validate: (bool) Check for name collisions of loss terms with the inputs
+        :param terms: (list) Subset of objectives and constraints to evaluate, in which case the total loss is omitted
         :return:
         """
+        selected = self._loss_terms() if terms is None else terms
+        if self.loss_graph:
+            graph = self._get_loss_graph(selected, total=terms is None)
+            if validate:
+                self._check_name_collision_dicts(input_dict, {t.name: None for t in graph.terms})
+            input_dict = {**input_dict, **graph(input_dict)}
+            if graph.loss_key is not None:
+                return input_dict
         loss = 0.0
-        for objective in self.objectives:
-            if objective not in self.components:
-                output_dict = objective(input_dict)
-                if isinstance(output_dict, torch.Tensor):
-                    output_dict = {objective.name: output_dict}
-                self._check_name_collision_dicts(input_dict, output_dict)
-                input_dict = {**input_dict, **output_dict}
-            loss += input_dict[objective.name]
-        for constraint in self.constraints:
-            if constraint not in self.components:
-                output_dict = constraint(input_dict)
+        for term in selected:
+            if not self.loss_graph and term not in self.components:
+                output_dict = term(input_dict)
                 if isinstance(output_dict, torch.Tensor):
-                    output_dict = {constraint.name: output_dict}
-                self._check_name_collision_dicts(input_dict, output_dict)
+                    output_dict = {term.name: output_dict}
+                if validate:
+                    self._check_name_collision_dicts(input_dict, output_dict)
                 input_dict = {**input_dict, **output_dict}
-            loss += input_dict[constraint.name]
-        input_dict['loss'] = loss
+            loss += input_dict[term.name]
+        if terms is None:
+            input_dict['loss'] = loss
         return input_dict
 
-    def forward(self, data: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        output_dict = self.step(data)
+    def _loss_terms(self):
+        return list(self.objectives) + list(self.constraints)
+
+    def _get_loss_graph(self, terms, total):
+        """
+        Cached LossGraph of the terms which are not components, which also sums the total loss if total is
+        True and every term is in the graph.
+        """
+        key = (tuple(terms), total)
+        if key not in self._loss_graphs:
+            graph_terms = [t for t in terms if t not in self.components]
+            loss_key = "loss" if total and len(graph_terms) == len(terms) else None
+            options = self.loss_graph if isinstance(self.loss_graph, dict) else {}
+            self._loss_graphs[key] = LossGraph(graph_terms, loss_key=loss_key, **options)
+        return self._loss_graphs[key]
+
+    def forward(self, data: Dict[str, torch.Tensor], output_keys=None) -> Dict[str, torch.Tensor]:
+        """
+
+        :param data: (dict {str: torch.Tensor}) input data with a "name" entry which prefixes the output keys
+        :param output_keys: (list of str) If given, only the components and loss terms which the output keys
+                            depend on are evaluated, e.g. ["nstep_dev_loss"] or ["dev_Y_pred_dynamics"]. Keys with
+                            the prefix of another data name are ignored. Demand-driven calls are not compiled.
+        :return: (dict {str: torch.Tensor}) inputs and outputs of all evaluated components and loss terms
+        """
+        if output_keys is not None:
+            prefix = f'{data["name"]}_'
+            demand = tuple(k[len(prefix):] for k in output_keys if k.startswith(prefix))
+            subgraph = self.dependencies(demand, data)
+            return self._forward_planned(data, subgraph, demand) if self.plan else self._forward(data, subgraph=subgraph)
+        if not self.torch_compile:
+            return self._forward_planned(data) if self.plan else self._forward(data)
+        signature = self._signature(data)
+        if signature not in self._validated:
+            output_dict = self._forward(data)
+            self._validated.add(signature)
+            return output_dict
+        if self._compiled is None:
+            options = {"dynamic": False, **(self.torch_compile if isinstance(self.torch_compile, dict) else {})}
+            self._compiled = torch.compile(self._forward_unchecked, **options)
+        try:
+            return self._compiled(data)
+        except _compile_errors() as e:
+            warnings.warn(f"torch.compile of Problem failed, falling back to eager execution: {e}")
+            self.torch_compile, self._compiled = False, None
+            return self._forward(data)
+
+    def dependencies(self, output_keys, input_keys):
+        """
+        Components and loss terms needed to compute output keys, traced backwards through the input_keys and
+        output_keys of components and loss terms (for objectives and constraints, of their Variable trees).
+
+        :param output_keys: (list of str) keys of the step and loss outputs without the data name prefix;
+                            "loss" requires every objective and constraint
+        :param input_keys: (iterable of str) keys of the input data
+        :return: (tuple of list or None) components and loss terms to evaluate, in order; loss terms are None if all
+                 of them and the total loss are needed. Both are None if a component does not declare its keys.
+        """
+        input_keys = tuple(input_keys)
+        cache_key = (input_keys, tuple(output_keys))
+        if cache_key in self._dependencies:
+            return self._dependencies[cache_key]
+        terms = self._loss_terms()
+        nodes = list(self.components) + [t for t in terms if t not in self.components]
+        if not all(hasattr(node, "input_keys") and hasattr(node, "output_keys") for node in nodes):
+            self._dependencies[cache_key] = None, None
+            return None, None
+        needed = set(output_keys)
+        if "loss" in needed:
+            needed |= {t.name for t in terms}
+        produced = set(input_keys) | {"loss"}
+        selected = set()
+        for node in reversed(nodes):
+            produced |= set(node.output_keys)
+            if needed & set(node.output_keys):
+                selected.add(node)
+                needed |= set(node.input_keys)
+        unknown = set(output_keys) - produced
+        assert not unknown, f'Output keys {unknown} are not computed by the problem'
+        components = [c for c in self.components if c in selected]
+        terms = None if "loss" in output_keys else [t for t in terms if t in selected]
+        self._dependencies[cache_key] = components, terms
+        return components, terms
+
+    def _forward(self, data: Dict[str, torch.Tensor], validate=True, subgraph=None) -> Dict[str, torch.Tensor]:
+        components, terms = subgraph if subgraph is not None else (None, None)
+        output_dict = self.step(data, validate=validate, components=components)
 
-        output_dict = self.calculate_loss(output_dict)
+        output_dict = self.calculate_loss(output_dict, validate=validate, terms=terms)
         return {f'{data["name"]}_{k}': v for k, v in output_dict.items()}
 
-    def step(self, input_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        for component in self.components:
+    def _forward_unchecked(self, data: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        # name collisions were checked by the eager call with the same signature
+        return self._forward(data, validate=False)
+
+    def _forward_planned(self, data: Dict[str, torch.Tensor], subgraph=None, demand=None) -> Dict[str, torch.Tensor]:
+        key = (tuple(data), data["name"], demand)
+        plan = self._plans.get(key)
+        if plan is None:
+            output_dict = self._forward(data, subgraph=subgraph)
+            self._plans[key] = self._build_plan(data, output_dict, subgraph)
+            return output_dict
+        steps, loss_names, renames = plan
+        values = dict(data)
+        for call, name, output_keys in steps:
+            out = call(values)
+            if output_keys is not None:
+                for k, out_k in output_keys:
+                    values[out_k] = out[k]
+            elif isinstance(out, torch.Tensor):
+                values[name] = out
+            else:
+                values.update(out)
+        if loss_names is not None:
+            loss = 0.0
+            for name in loss_names:
+                loss += values[name]
+            values['loss'] = loss
+        return {out_k: values[k] for k, out_k in renames}
+
+    def _build_plan(self, data, output_dict, subgraph=None):
+        """
+        Flat execution plan of the key flow validated by an eager call: a list of (call, name, output_keys)
+        steps for components and loss terms, the names of loss terms summed into the total loss, and the
+        renaming of values to output keys. Components whose only hooks are the input and output checks of
+        Component are called through forward with their output renaming precomputed as output_keys; other
+        callables are called as they are. With loss_graph, the loss terms are a single step.
+        """
+        components, terms = subgraph if subgraph is not None else (None, None)
+        steps = []
+        for component in self.components if components is None else components:
+            if isinstance(component, Component) and _runs_only_hooks(
+                    component, [component._check_inputs], [component._remap_output]):
+                steps.append((component.forward, component.name,
+                              list(zip(component.DEFAULT_OUTPUT_KEYS, component.output_keys))))
+            else:
+                steps.append((component, getattr(component, "name", None), None))
+        selected = self._loss_terms() if terms is None else terms
+        loss_names = [term.name for term in selected] if terms is None else None
+        if self.loss_graph:
+            graph = self._get_loss_graph(selected, total=terms is None)
+            steps.append((graph, None, None))
+            if graph.loss_key is not None:
+                loss_names = None
+        else:
+            for term in selected:
+                if term not in self.components:
+                    steps.append((term.forward if _runs_only_hooks(term) else term, term.name, None))
+        prefix = f'{data["name"]}_'
+        renames = [(k[len(prefix):], k) for k in output_dict]
+        return steps, loss_names, renames
+
+    @staticmethod
+    def _signature(data):
+        return tuple(
+            (k, tuple(v.shape), v.dtype, v.device) if isinstance(v, torch.Tensor) else (k,)
+            for k, v in data.items()
+        )
+
+    def levels(self, components, input_keys):
+        """
+        Components grouped into levels of the computation graph: every component reads only input keys and outputs
+        of components in earlier levels, so that the components of a level are independent of each other.
+
+        :param components: (list) components in order of execution
+        :param input_keys: (iterable of str) keys of the input data
+        :return: (list of list) levels in order of execution, each with its components in the order of components.
+                 A component which does not declare input_keys and output_keys may read and write any key, so
+                 it is a level of its own after all earlier components and before all later ones.
+        """
+        cache_key = (tuple(input_keys), tuple(components))
+        if cache_key in self._levels:
+            return self._levels[cache_key]
+        levels, producers, floor = [], {}, 0
+        for component in components:
+            if not (hasattr(component, "input_keys") and hasattr(component, "output_keys")):
+                levels.append([component])
+                floor = len(levels)
+                continue
+            depth = max([floor] + [producers.get(k, -1) + 1 for k in component.input_keys])
+            if depth == len(levels):
+                levels.append([])
+            levels[depth].append(component)
+            producers.update({k: depth for k in component.output_keys})
+        self._levels[cache_key] = levels
+        return levels
+
+    def _run_level(self, level, input_dict):
+        """
+        Call the components of a level on input_dict, all but the first on the worker threads.
+
+        :return: (list) outputs of the components in the order of level
+        """
+        if len(level) == 1:
+            return [level[0](input_dict)]
+        if self._executor is None:
+            workers = os.cpu_count() if self.concurrent is True else self.concurrent
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="problem")
+            # stop the worker threads once the problem is garbage collected without close()
+            weakref.finalize(self, self._executor.shutdown, wait=False)
+        state = _thread_state()
+        futures = [self._executor.submit(_call_with_state, c, input_dict, state) for c in level[1:]]
+        try:
+            first = level[0](input_dict)
+        finally:
+            wait(futures)
+        return [first] + [f.result() for f in futures]
+
+    def close(self):
+        """
+        Stop the worker threads of concurrent execution. They are started again by the next concurrent call.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _step_concurrent(self, input_dict, validate, components):
+        outputs = [None] * len(components)
+        index = {id(c): i for i, c in enumerate(components)}
+        values = input_dict
+        for level in self.levels(components, input_dict):
+            for component, output_dict in zip(level, self._run_level(level, values)):
+                if isinstance(output_dict, torch.Tensor):
+                    output_dict = {component.name: output_dict}
+                if validate:
+                    self._check_name_collision_dicts(values, output_dict)
+                values = {**values, **output_dict}
+                outputs[index[id(component)]] = output_dict
+        output_dict = dict(input_dict)
+        for out in outputs:
+            output_dict.update(out)
+        return output_dict
+
+    def step(self, input_dict: Dict[str, torch.Tensor], validate=True, components=None) -> Dict[str, torch.Tensor]:
+        components = self.components if components is None else components
+        if self.concurrent:
+            return self._step_concurrent(input_dict, validate, list(components))
+        for component in components:
             output_dict = component(input_dict)
 
             if isinstance(output_dict, torch.Tensor):
                 output_dict = {component.name: output_dict}
-            self._check_name_collision_dicts(input_dict, output_dict)
-            assert set(output_dict.keys()) - set(input_dict.keys()) == set(output_dict.keys()), \
-                f'Name collision in input and output dictionaries, Input_keys: {input_dict.keys()},' \
-                f'Output_keys: {output_dict.keys()}'
+            if validate:
+                self._check_name_collision_dicts(input_dict, output_dict)
             input_dict = {**input_dict, **output_dict}
         return input_dict
 
+    def __getstate__(self):
+        # compiled functions, plans, dependencies, levels, loss graphs, and the thread pool are rebuilt on demand
+        # rather than pickled or deep copied
+        state = self.__dict__.copy()
+        state["_compiled"], state["_validated"], state["_plans"], state["_dependencies"] = None, set(), {}, {}
+        state["_levels"], state["_executor"], state["_loss_graphs"] = {}, None, {}
+        return state
+
     def __repr__(self):
         s = "### MODEL SUMMARY ###\n\nCOMPONENTS:"
         if len(self.components) > 0:
@@ -0,0 +1,200 @@
+"""
+Hyperparameter sweeps over the argument groups of a neuromancer.arg.ArgParser.
+
+Trials are expanded from a grid or sampled at random, run in a local process pool with a pinned
+number of intra-op threads per worker, and optionally pruned by successive halving on the eval metric.
+
+>>> parser = arg.ArgParser(parents=[arg.log(), arg.opt(), arg.ssm()])
+>>> sweep = Sweep(train_fn, parser, {"OPTIMIZATION": {"lr": [1e-3, 1e-2]}, "SSM": {"nx_hidden": [20, 40]}})
+>>> results = sweep.run()
+"""
+import argparse
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from neuromancer.loggers import BasicLogger
+
+
+def grid_search(space):
+    """
+    Expand a search space into the cartesian product of its values.
+
+    :param space: (dict {str: list}) candidate values of each argument
+    :return: (list of dict {str: value}) argument overrides of each trial
+    """
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[k] for k in keys])]
+
+
+def random_search(space, ntrials, seed=0):
+    """
+    Draw trials at random from a search space. Lists are sampled uniformly, (low, high) tuples are
+    sampled uniformly from the integers or reals between low and high, and callables are called
+    with a numpy Generator.
+
+    :param space: (dict {str: list, tuple, or callable}) distribution of each argument
+    :param ntrials: (int) Number of trials to draw
+    :param seed: (int) Seed of the random number generator
+    :return: (list of dict {str: value}) argument overrides of each trial
+    """
+    rng = np.random.default_rng(seed)
+
+    def sample(values):
+        if callable(values):
+            return values(rng)
+        if isinstance(values, tuple):
+            low, high = values
+            if isinstance(low, int) and isinstance(high, int):
+                return int(rng.integers(low, high, endpoint=True))
+            return float(rng.uniform(low, high))
+        return values[rng.integers(len(values))]
+
+    return [{k: sample(v) for k, v in space.items()} for _ in range(ntrials)]
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _run_trial(train_fn, args, state):
+    metric, state = train_fn(args, state)
+    return float(metric), state
+
+
+class Sweep:
+    """
+    Runs a hyperparameter sweep over the argument groups of an ArgParser in a local process pool.
+
+    Each trial calls train_fn(args, state) in a worker process, where args is the parser's default
+    Namespace updated with the trial's values, and train_fn returns a tuple (metric, state) of the
+    eval metric of the trained model and an optional picklable state (e.g. model and optimizer
+    state dicts).
+
+    With successive halving, trials are first trained for min_epochs (set as args.epochs). Only the
+    best 1/eta of them continue to the next rung, with eta times the budget, until max_epochs. The
+    state returned at the previous rung is passed back to train_fn so that training may resume
+    rather than restart.
+    """
+    def __init__(
+        self,
+        train_fn,
+        parser,
+        space,
+        search="grid",
+        ntrials=None,
+        eval_mode="min",
+        workers=None,
+        threads_per_worker=None,
+        min_epochs=None,
+        max_epochs=None,
+        eta=3,
+        logger: BasicLogger = None,
+        seed=0,
+    ):
+        """
+
+        :param train_fn: (callable) Module level function train_fn(args, state) -> (metric, state)
+        :param parser: (arg.ArgParser) Parser whose defaults give the base configuration of every trial
+        :param space: (dict {str: dict {str: values}}) Search space per argument group title; values are
+                      lists for grid search or distributions accepted by random_search
+        :param search: (str) 'grid' or 'random'
+        :param ntrials: (int) Number of trials for random search
+        :param eval_mode: (str) 'min' to minimize the metric returned by train_fn; any other string to maximize
+        :param workers: (int) Number of worker processes; defaults to the number of cpus
+        :param threads_per_worker: (int) torch intra-op threads per worker; defaults to cpus // workers
+        :param min_epochs: (int) Budget of the first successive halving rung; None disables pruning
+        :param max_epochs: (int) Budget of the last successive halving rung; defaults to args.epochs
+        :param eta: (int) Fraction 1/eta of trials promoted to the next rung, which gets eta times the budget
+        :param logger: (nm.Logger) Records the metric of every trial at every rung
+        :param seed: (int) Seed for random search
+        """
+        assert search in ("grid", "random"), "search must be 'grid' or 'random'"
+        assert search == "grid" or ntrials is not None, "random search requires ntrials"
+        assert eta > 1, "eta must be greater than 1"
+        self.train_fn = train_fn
+        self.base_args = parser.parse_args([])
+        flat_space = {}
+        for title, group_space in space.items():
+            group = parser.check_for_group(title)
+            assert group is not None, f"No argument group {title}"
+            dests = {a.dest for a in group._group_actions}
+            missing = set(group_space) - dests
+            assert not missing, f"Arguments {missing} not in argument group {title}"
+            flat_space.update(group_space)
+        self.space = flat_space
+        self.trials = grid_search(flat_space) if search == "grid" else random_search(flat_space, ntrials, seed)
+        self._eval_min = eval_mode == "min"
+        self.workers = workers or os.cpu_count()
+        self.threads_per_worker = threads_per_worker or max(1, os.cpu_count() // self.workers)
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs or getattr(self.base_args, "epochs", None)
+        self.eta = eta
+        self.logger = logger
+
+    def budgets(self):
+        """
+        Epoch budget of each successive halving rung.
+
+        :return: (list of int)
+        """
+        if self.min_epochs is None:
+            return [self.max_epochs]
+        assert self.max_epochs is not None, "successive halving requires max_epochs or an epochs argument"
+        nrungs = int(math.floor(math.log(self.max_epochs / self.min_epochs, self.eta) + 1e-9)) + 1
+        budgets = [self.min_epochs * self.eta ** r for r in range(nrungs)]
+        return budgets[:-1] + [self.max_epochs] if budgets[-1] != self.max_epochs else budgets
+
+    def trial_args(self, params, epochs=None):
+        """
+        Namespace of a trial: parser defaults updated with the trial's values and epoch budget.
+        """
+        args = argparse.Namespace(**{**vars(self.base_args), **params})
+        if epochs is not None:
+            args.epochs = epochs
+        return args
+
+    def run(self):
+        """
+        Run all trials, pruning by successive halving if enabled.
+
+        :return: (list of dict) results of every trial, best first, with keys "trial", "params",
+                 "metric", and "epochs" (budget of the last rung the trial reached)
+        """
+        results = [{"trial": i, "params": p, "metric": None, "epochs": None} for i, p in enumerate(self.trials)]
+        states = [None] * len(results)
+        alive = list(range(len(results)))
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.threads_per_worker,),
+        ) as pool:
+            budgets = self.budgets()
+            for rung, epochs in enumerate(budgets):
+                futures = {
+                    i: pool.submit(_run_trial, self.train_fn, self.trial_args(results[i]["params"], epochs), states[i])
+                    for i in alive
+                }
+                for i, future in futures.items():
+                    results[i]["metric"], states[i] = future.result()
+                    results[i]["epochs"] = epochs
+                    if self.logger is not None:
+                        self.logger.log_metrics({
+                            f"trial_{i}_metric": torch.tensor(results[i]["metric"]),
+                        }, step=rung)
+                alive = sorted(alive, key=lambda i: self._sort_key(results[i]))
+                if rung < len(budgets) - 1:
+                    alive = alive[:max(1, len(alive) // self.eta)]
+        results = sorted(results, key=lambda r: (-(r["epochs"] or 0), self._sort_key(r)))
+        if self.logger is not None:
+            self.logger.log_metrics({"best_metric": torch.tensor(results[0]["metric"])}, step=len(budgets))
+            self.logger.log_artifacts({"sweep_results.pth": results})
+        return results
+
+    def _sort_key(self, result):
+        metric = result["metric"]
+        if metric is None or math.isnan(metric):
+            return math.inf
+        return metric if self._eval_min else -metric
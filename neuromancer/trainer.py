@@ -3,20 +3,103 @@
 
 """
 from copy import deepcopy
+import time
 
 import torch
+import torch.distributed as dist
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 from torch.optim.lr_scheduler import ReduceLROnPlateau
+from torch.utils.data import DataLoader, Subset
+from torch.utils.data.distributed import DistributedSampler
 import numpy as np
 
 from neuromancer.loggers import BasicLogger
 from neuromancer.problem import Problem
 from neuromancer.callbacks import Callback
+from neuromancer.checkpoint import AsyncCheckpointer, copy_state, get_rng_state, set_rng_state
+from neuromancer.metrics import MetricAccumulator, batch_dim, batch_size
 
 
 def move_batch_to_device(batch, device="cpu"):
     return {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
 
 
+def split_batch(batch, size):
+    """
+    Split a batch into micro-batches along the batch dimension (see neuromancer.metrics.batch_dim).
+    Entries which are not tensors or whose batch dimension differs from that of the batch are shared
+    by all micro-batches.
+
+    :param batch: (dict str: torch.Tensor) batch of data
+    :param size: (int) maximum number of samples per micro-batch
+    :return: (list of (dict str: torch.Tensor, int)) micro-batches and their number of samples
+    """
+    n = batch_size(batch)
+    chunks = []
+    for start in range(0, n, size):
+        length = min(size, n - start)
+        chunk = {
+            k: v.narrow(batch_dim(v), start, length)
+            if isinstance(v, torch.Tensor) and v.ndim > 0 and v.shape[batch_dim(v)] == n else v
+            for k, v in batch.items()
+        }
+        chunks.append((chunk, length))
+    return chunks
+
+
+def merge_outputs(outputs, sizes):
+    """
+    Combine the outputs of the problem on the micro-batches of a batch. Scalars, which are assumed
+    to be means over samples, are averaged weighted by micro-batch size, and tensors batched like
+    their micro-batch are concatenated along the batch dimension. Merged values are detached.
+
+    :param outputs: (list of dict str: torch.Tensor) outputs on each micro-batch
+    :param sizes: (list of int) number of samples in each micro-batch
+    :return: (dict str: torch.Tensor) output on the batch
+    """
+    total = sum(sizes)
+    merged = {}
+    for k, v in outputs[0].items():
+        if not isinstance(v, torch.Tensor):
+            merged[k] = v
+        elif v.ndim == 0:
+            merged[k] = sum(o[k].detach() * (n / total) for o, n in zip(outputs, sizes))
+        elif all(o[k].shape[batch_dim(v)] == n for o, n in zip(outputs, sizes)):
+            merged[k] = torch.cat([o[k].detach() for o in outputs], dim=batch_dim(v))
+        else:
+            merged[k] = v.detach()
+    return merged
+
+
+def subsample_loader(loader, nsamples, seed=0):
+    """
+    DataLoader over a fixed random subset of the dataset of a DataLoader, drawn without touching the
+    global random number generator.
+
+    :param loader: (torch DataLoader) data split to subsample
+    :param nsamples: (int) number of samples in the subset
+    :param seed: (int) seed of the subset
+    :return: (torch DataLoader) loader of the subset, with the batch size and collate_fn of loader
+    """
+    generator = torch.Generator().manual_seed(seed)
+    nsamples = min(nsamples, len(loader.dataset))
+    indices = torch.randperm(len(loader.dataset), generator=generator)[:nsamples].sort().values.tolist()
+    return DataLoader(Subset(loader.dataset, indices), batch_size=min(loader.batch_size or nsamples, nsamples),
+                      collate_fn=loader.collate_fn)
+
+
+def requires_closure(optimizer):
+    """
+    Whether the step of an optimizer needs a closure reevaluating the loss and gradients: the
+    requires_closure attribute of the optimizer if it has one, so that other closure based optimizers
+    can declare it, and otherwise whether it is a torch.optim.LBFGS.
+
+    :param optimizer: (torch Optimizer)
+    :return: (bool)
+    """
+    return getattr(optimizer, "requires_closure", isinstance(optimizer, torch.optim.LBFGS))
+
+
 class Trainer:
     """
     Class encapsulating boilerplate PyTorch training code. Training procedure is somewhat
@@ -42,7 +125,18 @@ class Trainer:
         eval_metric="loop_dev_loss",
         eval_mode="min",
         clip=100.0,
-        device="cpu"
+        device="cpu",
+        autocast_dtype=None,
+        loss_scale=1.0,
+        micro_batch_size=None,
+        checkpoint_path=None,
+        checkpoint_interval=1,
+        track_metrics=(),
+        eval_interval=1,
+        eval_time=None,
+        dev_subsample=None,
+        eval_rtol=0.1,
+        lazy_eval=False,
     ):
         """
 
@@ -65,6 +159,31 @@ class Trainer:
                                 the trainer will maximize the train metric.
         :param clip: (float) Limit for gradient clipping
         :param device: (str) String denoting device to place computations on. Can be 'cpu' or 'gpu:N' for some integer N
+        :param autocast_dtype: (torch.dtype) If given, e.g. torch.bfloat16, forward passes of the problem run under
+                                             torch.autocast with this dtype. Parameters, optimizer state, and the
+                                             losses and constraint penalties of nm.constraint stay in float32.
+        :param loss_scale: (float) Static factor multiplying the training loss before backpropagation, with the
+                                   gradients divided by it before clipping; guards against underflow of
+                                   float16 gradients. A power of two keeps the rescaling exact.
+        :param micro_batch_size: (int) If given, training batches are split into micro-batches of at most this many
+                                       samples whose gradients are accumulated before a single optimizer step.
+                                       This bounds peak activation memory, e.g. of full batch training, while
+                                       giving the full batch gradient for losses which are means over samples.
+        :param checkpoint_path: (str) If given, the training state is saved to this file in the background every
+                                      checkpoint_interval epochs, and can be restored with Trainer.resume.
+                                      Processes of a DistributedTrainer each need their own path.
+        :param checkpoint_interval: (int) Number of epochs between checkpoints
+        :param track_metrics: (list of str) Output keys whose means over each data split are recorded as mean_{key}
+                                            in addition to those of train_metric, dev_metric, and test_metric
+        :param eval_interval: (int) Number of epochs between evaluations on dev_data. The last epoch is always evaluated,
+                                    and epochs without improvement between evaluations all count towards patience.
+        :param eval_time: (float) If given, also evaluate once this many seconds have passed since the last evaluation
+        :param dev_subsample: (int) If given, evaluations first compute eval_metric on a fixed random subset of this many
+                                    dev samples, and dev_data and callback evaluations only run when the subset value
+                                    relaxed by eval_rtol improves on the subset value of the best model
+        :param eval_rtol: (float) Relative tolerance of the subset value of eval_metric for a full evaluation
+        :param lazy_eval: (bool) If True, evaluations only run the components and loss terms of the problem needed for
+                                 the evaluated metric and track_metrics, so that their outputs omit other values
         """
         self.model = problem
         self.optimizer = optimizer
@@ -89,6 +208,20 @@ class Trainer:
         self.best_devloss = np.finfo(np.float32).max if self._eval_min else 0.
         self.best_model = deepcopy(self.model.state_dict())
         self.device = device
+        self.autocast_dtype = autocast_dtype
+        self.loss_scale = loss_scale
+        self.micro_batch_size = micro_batch_size
+        self.checkpointer = AsyncCheckpointer(checkpoint_path) if checkpoint_path is not None else None
+        self.checkpoint_interval = checkpoint_interval
+        self.start_epoch = 0
+        self.track_metrics = list(track_metrics)
+        self.eval_interval = eval_interval
+        self.eval_time = eval_time
+        self.dev_subsample = subsample_loader(dev_data, dev_subsample) if dev_subsample is not None else None
+        self.eval_rtol = eval_rtol
+        self.lazy_eval = lazy_eval
+        self.best_subsample_value = None
+        self.last_eval_epoch = -1
 
     def train(self):
         """
@@ -97,21 +230,12 @@ class Trainer:
         """
         self.callback.begin_train(self)
 
-        for i in range(self.epochs):
+        output = {}
+        self.last_eval_epoch = min(self.last_eval_epoch, self.start_epoch - 1)
+        self._last_eval_time = time.perf_counter()
+        for i in range(self.start_epoch, self.epochs):
             self.current_epoch = i
-            self.model.train()
-            losses = []
-            for t_batch in self.train_data:
-                t_batch = move_batch_to_device(t_batch, self.device)
-                output = self.model(t_batch)
-                self.optimizer.zero_grad()
-                output[self.train_metric].backward()
-                torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
-                self.optimizer.step()
-                losses.append(output[self.train_metric])
-                self.callback.end_batch(self, output)
-
-            output[f'mean_{self.train_metric}'] = torch.mean(torch.stack(losses))
+            output = self.train_epoch()
             self.callback.begin_epoch(self, output)
 
             if self.lr_scheduler is not None:
@@ -119,32 +243,40 @@ class Trainer:
 
             with torch.set_grad_enabled(self.model.grad_inference):
                 self.model.eval()
-                losses = []
-                for d_batch in self.dev_data:
-                    d_batch = move_batch_to_device(d_batch, self.device)
-                    eval_output = self.model(d_batch)
-                    losses.append(eval_output[self.dev_metric])
-                eval_output[f'mean_{self.dev_metric}'] = torch.mean(torch.stack(losses))
-                output = {**output, **eval_output}
-                self.callback.begin_eval(self, output)
-
-                if (self._eval_min and output[self.eval_metric] < self.best_devloss)\
-                        or (not self._eval_min and output[self.eval_metric] > self.best_devloss):
-                    self.best_model = deepcopy(self.model.state_dict())
-                    self.best_devloss = output[self.eval_metric]
-                    self.badcount = 0
-                else:
-                    if i > self.warmup:
-                        self.badcount += 1
-                self.logger.log_metrics(output, step=i)
+                if self.eval_due():
+                    # epochs since the last evaluation without improvement count towards patience
+                    nepochs = sum(j > self.warmup for j in range(self.last_eval_epoch + 1, i + 1))
+                    self.last_eval_epoch, self._last_eval_time = i, time.perf_counter()
+                    eval_output, full = self.evaluate_dev()
+                    output = {**output, **eval_output}
+                    if full:
+                        self.callback.begin_eval(self, output)
+
+                    if full and self.improved(output[self.eval_metric]):
+                        # a fresh copy, as earlier best models may be held by callbacks or callers
+                        self.best_model = copy_state(self.model.state_dict())
+                        self.best_devloss = output[self.eval_metric]
+                        self.best_subsample_value = output.get(f"subsample_{self.eval_metric}")
+                        self.badcount = 0
+                    else:
+                        self.badcount += nepochs
+                    self.logger.log_metrics(output, step=i)
 
-                self.callback.end_eval(self, output)
+                    if full:
+                        self.callback.end_eval(self, output)
+                else:
+                    self.logger.log_metrics(output, step=i)
 
                 self.callback.end_epoch(self, output)
 
+                if self.checkpointer is not None and (i + 1) % self.checkpoint_interval == 0:
+                    self.checkpointer.save(self.state_dict())
+
                 if self.badcount > self.patience:
                     break
 
+        if self.checkpointer is not None:
+            self.checkpointer.close()
         self.callback.end_train(self, output)
 
         self.logger.log_artifacts({
@@ -153,6 +285,214 @@ class Trainer:
         })
         return self.best_model
 
+    def eval_due(self):
+        """
+        Whether the current epoch is evaluated: every eval_interval epochs, after eval_time seconds,
+        and at the last epoch.
+        """
+        return self.current_epoch - self.last_eval_epoch >= self.eval_interval \
+            or self.current_epoch == self.epochs - 1 \
+            or (self.eval_time is not None and time.perf_counter() - self._last_eval_time >= self.eval_time)
+
+    def evaluate_dev(self):
+        """
+        Evaluate the model on dev_data, screened by the dev subsample if there is one.
+
+        :return: (dict str: torch.Tensor, bool) output of the evaluation and whether it was on the full
+                 dev_data; outputs of subsample evaluations are prefixed with subsample_ and are never a new best,
+                 and full evaluations screened by the subsample include its subsample_{eval_metric}
+        """
+        if self.dev_subsample is not None:
+            output = self.evaluate_data(self.dev_subsample, self.dev_metric)
+            if self.eval_metric in output:
+                value, best = output[self.eval_metric], self.best_subsample_value
+                relaxed = value - self.eval_rtol * abs(value) if self._eval_min else value + self.eval_rtol * abs(value)
+                if best is not None and not (relaxed < best if self._eval_min else relaxed > best):
+                    return {f"subsample_{k}": v for k, v in output.items()}, False
+                output = self.evaluate_data(self.dev_data, self.dev_metric)
+                return {**output, f"subsample_{self.eval_metric}": value}, True
+        return self.evaluate_data(self.dev_data, self.dev_metric), True
+
+    def state_dict(self):
+        """
+        Training state at the end of the current epoch: model, optimizer, and lr_scheduler state,
+        early stopping state, callback state, and random number generator states.
+
+        :return: (dict)
+        """
+        return {
+            "epoch": self.current_epoch,
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "optimizer_type": type(self.optimizer).__name__,
+            "lr_scheduler": self.lr_scheduler.state_dict() if self.lr_scheduler is not None else None,
+            "badcount": self.badcount,
+            "last_eval_epoch": self.last_eval_epoch,
+            "best_subsample_value": self.best_subsample_value,
+            "best_devloss": self.best_devloss,
+            "best_model": self.best_model,
+            "callback": self.callback.state_dict(),
+            "rng": get_rng_state(),
+        }
+
+    def resume(self, path):
+        """
+        Restore the training state from a checkpoint written with checkpoint_path so that train()
+        continues from the epoch after the checkpoint as if it had not been interrupted.
+
+        :param path: (str) checkpoint file
+        """
+        state = torch.load(path, map_location="cpu", weights_only=False)
+        # callbacks such as OptimizerSwitch may replace the optimizer whose state is restored
+        self.callback.load_state_dict(self, state["callback"])
+        assert type(self.optimizer).__name__ == state["optimizer_type"], \
+            f"checkpoint holds the state of {state['optimizer_type']}, not of {type(self.optimizer).__name__}"
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        if self.lr_scheduler is not None:
+            self.lr_scheduler.load_state_dict(state["lr_scheduler"])
+        self.badcount = state["badcount"]
+        self.last_eval_epoch = state["last_eval_epoch"]
+        self.best_subsample_value = state["best_subsample_value"]
+        self.best_devloss = state["best_devloss"]
+        self.best_model = copy_state(state["best_model"], device=self.device)
+        self.current_epoch = state["epoch"]
+        self.start_epoch = state["epoch"] + 1
+        set_rng_state(state["rng"])
+
+    def train_epoch(self):
+        """
+        Run one pass of gradient based optimization over the training data.
+
+        :return: (dict str: torch.Tensor) output of the last batch with the epoch mean of train_metric,
+                 weighted by batch size
+        """
+        self.model.train()
+        metrics = MetricAccumulator([self.train_metric, *self.track_metrics])
+        for t_batch in self.train_data:
+            t_batch = move_batch_to_device(t_batch, self.device)
+            output = self.train_step(t_batch)
+            metrics.update(output, weight=batch_size(t_batch))
+            self.callback.end_batch(self, output)
+        output.update(metrics.means())
+        return output
+
+    def train_step(self, batch):
+        """
+        Forward and backward pass followed by a parameter update on a single batch. Optimizers
+        which reevaluate the loss during a step (see requires_closure), such as torch.optim.LBFGS,
+        are passed a closure running the forward and backward pass.
+
+        :param batch: (dict str: torch.Tensor) batch of training data
+        :return: (dict str: torch.Tensor) output of the problem at the parameters before the update
+        """
+        outputs = []
+
+        def closure():
+            self.optimizer.zero_grad()
+            output = self.accumulate_gradients(batch)
+            loss = self.reduce_gradients(output[self.train_metric])
+            if not outputs:
+                outputs.append(output)
+            return loss
+
+        if requires_closure(self.optimizer):
+            self.optimizer.step(closure)
+        else:
+            closure()
+            self.optimizer.step()
+        return outputs[0]
+
+    def accumulate_gradients(self, batch):
+        """
+        Forward pass and backpropagation of train_metric on a batch, or on each of its micro-batches
+        with losses weighted by micro-batch size so that the accumulated gradient is that of the batch.
+        The gradients are divided by loss_scale once after backpropagation.
+
+        :param batch: (dict str: torch.Tensor) batch of training data
+        :return: (dict str: torch.Tensor) output of the problem on the batch
+        """
+        if self.micro_batch_size is None:
+            with self.autocast():
+                output = self.model(batch)
+            self.scaled_backward(output[self.train_metric])
+            self.unscale_gradients()
+            return output
+        chunks = split_batch(batch, self.micro_batch_size)
+        total = sum(n for _, n in chunks)
+        outputs = []
+        for chunk, n in chunks:
+            with self.autocast():
+                output = self.model(chunk)
+            self.scaled_backward(output[self.train_metric] * (n / total))
+            # keep only the values so that the graph of each micro-batch is freed after backward
+            outputs.append({k: v.detach() if isinstance(v, torch.Tensor) else v for k, v in output.items()})
+        self.unscale_gradients()
+        return merge_outputs(outputs, [n for _, n in chunks])
+
+    def reduce_gradients(self, loss):
+        """
+        Clip the accumulated gradients.
+
+        :param loss: (torch.Tensor) value of train_metric
+        :return: (torch.Tensor) loss value reported to closure based optimizers
+        """
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
+        return loss
+
+    def scaled_backward(self, loss):
+        """
+        Backpropagate loss multiplied by loss_scale, accumulating the scaled gradients.
+
+        :param loss: (torch.Tensor) value of train_metric
+        """
+        if self.loss_scale == 1.0:
+            loss.backward()
+            return
+        (loss * self.loss_scale).backward()
+
+    def unscale_gradients(self):
+        """
+        Divide the gradients accumulated by scaled_backward by loss_scale.
+        """
+        if self.loss_scale == 1.0:
+            return
+        for p in self.model.parameters():
+            if p.grad is not None:
+                p.grad.div_(self.loss_scale)
+
+    def autocast(self):
+        """
+        Context for forward passes of the problem: torch.autocast with autocast_dtype if it is set.
+        """
+        return torch.autocast(torch.device(self.device).type, dtype=self.autocast_dtype,
+                              enabled=self.autocast_dtype is not None)
+
+    def evaluate_data(self, data, metric):
+        """
+        Evaluate the model on every batch of a data split.
+
+        :param data: (torch DataLoader) data split to evaluate
+        :param metric: (str) metric whose mean over batches, weighted by batch size, is recorded as mean_{metric}
+        :return: (dict str: torch.Tensor) output of the last batch with the mean of metric
+        """
+        metrics = MetricAccumulator([metric, *self.track_metrics])
+        output_keys = [metric, *self.track_metrics] if self.lazy_eval else None
+        for batch in data:
+            batch = move_batch_to_device(batch, self.device)
+            with self.autocast():
+                output = self.model(batch) if output_keys is None else self.model(batch, output_keys=output_keys)
+            metrics.update(output, weight=batch_size(batch))
+        output.update(metrics.means())
+        return output
+
+    def improved(self, value):
+        """
+        Whether value of eval_metric improves on the best value seen so far.
+        """
+        return (self._eval_min and value < self.best_devloss) \
+            or (not self._eval_min and value > self.best_devloss)
+
     def test(self, best_model):
         """
         Evaluate the model on all data splits.
@@ -165,13 +505,7 @@ class Trainer:
             output = {}
             for dset, metric in zip([self.train_data, self.dev_data, self.test_data],
                                     [self.train_metric, self.dev_metric, self.test_metric]):
-                losses = []
-                for batch in dset:
-                    batch = move_batch_to_device(batch, self.device)
-                    batch_output = self.model(batch)
-                    losses.append(batch_output[metric])
-                output[f'mean_{metric}'] = torch.mean(torch.stack(losses))
-                output = {**output, **batch_output}
+                output = {**output, **self.evaluate_data(dset, metric)}
 
         self.callback.end_test(self, output)
         self.logger.log_metrics({f"best_{k}": v for k, v in output.items()})
@@ -185,6 +519,123 @@ class Trainer:
         return self.test(best_model)
 
 
+def get_distributed_dataloader(dataset, batch_size, shuffle=True, **kwargs):
+    """
+    DataLoader over the shard of a dataset assigned to this process of the default process group.
+    Shards are drawn by a DistributedSampler, reshuffled every epoch by DistributedTrainer.
+
+    :param dataset: (nm.dataset.SequenceDataset or nm.dataset.StaticDataset)
+    :param batch_size: (int) Number of samples per batch on each process
+    :param shuffle: (bool) Whether to shuffle the dataset before sharding
+    :param kwargs: Further keyword arguments to torch.utils.data.DataLoader
+    :return: (torch DataLoader)
+    """
+    sampler = DistributedSampler(dataset, shuffle=shuffle)
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, collate_fn=dataset.collate_fn, **kwargs)
+
+
+class RankZeroLogger:
+    """
+    Forwards logging calls to a logger on rank 0 of the default process group and drops them on
+    every other rank.
+    """
+    def __init__(self, logger, rank):
+        self.logger, self.rank = logger, rank
+
+    def __getattr__(self, name):
+        if name.startswith("__") or "logger" not in self.__dict__:
+            raise AttributeError(name)
+        if self.rank == 0:
+            return getattr(self.logger, name)
+        return lambda *args, **kwargs: None
+
+
+class DistributedTrainer(Trainer):
+    """
+    Data parallel Trainer for multiple processes of an initialized torch.distributed process group,
+    e.g. with the gloo backend on CPU. Each process trains a replica of the problem on its shard of
+    the data (see get_distributed_dataloader); gradients are averaged over processes before every
+    parameter update, so replicas stay identical. Epoch metrics are averaged over processes and the
+    evaluation, best model, and early stopping decisions are taken by rank 0 and broadcast, so every
+    process follows the same schedule. Only rank 0 logs and saves artifacts.
+    """
+    def __init__(self, problem, train_data, dev_data, test_data, optimizer, logger=None, *args, **kwargs):
+        """
+        Arguments are the same as for Trainer. The logger is only used on rank 0 and may be None on
+        other ranks.
+        """
+        assert dist.is_initialized(), "torch.distributed process group must be initialized"
+        self.rank, self.world_size = dist.get_rank(), dist.get_world_size()
+        logger = RankZeroLogger(logger, self.rank)
+        # start all replicas from the parameters of rank 0
+        for tensor in problem.state_dict().values():
+            dist.broadcast(tensor, src=0)
+        super().__init__(problem, train_data, dev_data, test_data, optimizer, logger, *args, **kwargs)
+
+    def train_epoch(self):
+        sampler = getattr(self.train_data, "sampler", None)
+        if isinstance(sampler, DistributedSampler):
+            sampler.set_epoch(self.current_epoch)
+        return self.all_reduce_metrics(super().train_epoch())
+
+    def reduce_gradients(self, loss):
+        loss = self.all_reduce_gradients(loss)
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
+        return loss
+
+    def evaluate_data(self, data, metric):
+        return self.all_reduce_metrics(super().evaluate_data(data, metric))
+
+    def eval_due(self):
+        # eval_time is measured by the clock of each process, so rank 0 decides for all of them
+        flag = torch.tensor([float(super().eval_due())])
+        dist.broadcast(flag, src=0)
+        return bool(flag.item())
+
+    def improved(self, value):
+        flag = torch.tensor([float(super().improved(value))])
+        dist.broadcast(flag, src=0)
+        return bool(flag.item())
+
+    def all_reduce_gradients(self, loss):
+        """
+        Average gradients and the loss over processes with a single all-reduce of a flattened
+        buffer. The averaged loss keeps closure based optimizers such as LBFGS, whose number of
+        iterations depends on the loss, in lockstep across processes.
+
+        :param loss: (torch.Tensor) loss of this process
+        :return: (torch.Tensor) loss averaged over processes
+        """
+        params = [p for p in self.model.parameters() if p.requires_grad]
+        grads = [p.grad if p.grad is not None else torch.zeros_like(p) for p in params]
+        buffer = _flatten_dense_tensors(grads + [loss.detach().reshape(1)])
+        dist.all_reduce(buffer)
+        buffer /= self.world_size
+        *grads_avg, loss_avg = _unflatten_dense_tensors(buffer, grads + [loss.detach().reshape(1)])
+        for p, g in zip(params, grads_avg):
+            if p.grad is None:
+                p.grad = g
+            else:
+                p.grad.copy_(g)
+        return loss_avg.reshape(loss.shape)
+
+    def all_reduce_metrics(self, output):
+        """
+        Average the scalar entries of an output dictionary over processes.
+
+        :param output: (dict str: torch.Tensor) output of the problem on this process
+        :return: (dict str: torch.Tensor) output with scalars replaced by their average
+        """
+        keys = sorted(k for k, v in output.items()
+                      if isinstance(v, torch.Tensor) and v.ndim == 0 and v.is_floating_point())
+        if not keys:
+            return output
+        values = torch.stack([output[k].detach().float().cpu() for k in keys])
+        dist.all_reduce(values)
+        values /= self.world_size
+        return {**output, **{k: v.to(output[k]) for k, v in zip(keys, values)}}
+
+
 def freeze_weight(problem, module_names=['']):
     """
     ['parent->child->child']
@@ -647,3 +647,87 @@ def test_variable_expression_slicing_shape(shape):
     data = {'x': torch.rand(shape)}
     assert (x+x)[1:](data).shape[0] == (x + x)(data).shape[0] - 1
 
+
+
+@given(st.sampled_from([torch.bfloat16, torch.float16]), st.sampled_from([1, 2]))
+@settings(max_examples=10, deadline=None)
+def test_penalties_are_float32(dtype, norm):
+    x = cn.Variable('x')
+    y = cn.Variable('y')
+    data = {'x': torch.randn(10, 3).to(dtype), 'y': torch.randn(10, 3).to(dtype)}
+    for con in [x < y, x > y, x == y]:
+        con = con ^ norm
+        assert con(data)[con.name].dtype == torch.float32
+    obj = cn.Objective(x ** 2 + y ** 2, name='obj')
+    assert obj(data)['obj'].dtype == torch.float32
+    loss = cn.Loss(['x', 'y'], torch.nn.functional.mse_loss, name='loss')
+    assert loss(data)['loss'].dtype == torch.float32
+
+
+def test_variable_keys():
+    x, y = cn.Variable('x'), cn.Variable('y')
+    z = x[:, [0]] + 2 * y
+    data = {'x': torch.randn(3, 2), 'y': torch.randn(3, 1)}
+    for term in [z <= 1.0, cn.Objective(z ** 2, name='obj'), cn.Loss(['x', 'y'], lambda a, b: a.mean() + b.mean())]:
+        values = dict(data)
+        values.update(term(values))  # Variables write intermediate results into the dictionary
+        assert set(term.input_keys) == {'x', 'y'}
+        assert set(term.output_keys) == set(values) - {'x', 'y'}
+
+
+def test_loss_graph_matches_terms():
+    x, y = cn.Variable('x'), cn.Variable('y')
+    A = torch.randn(2, 4)
+    weight = torch.nn.Parameter(torch.tensor(2.0))
+    terms = [x @ A <= 1.0, x @ A >= -1.0, ((x @ A)[:, 1:] == y) ^ 2, weight * (x[:, [0]] < y),
+             cn.Objective((x @ A)[:, 1:] ** 2 + y, name='obj'), cn.Objective((x @ A) * 1.0, name='scaled'),
+             cn.Loss(['x', 'y'], lambda a, b: a.mean() + b.mean())]
+    data = {'x': torch.randn(5, 2, requires_grad=True), 'y': torch.randn(5, 3)}
+    values = dict(data)
+    for term in terms:
+        values.update(term(values))
+    graph = cn.LossGraph(terms)
+    output = graph(data)
+    assert list(output) == [k for k in values if k not in data]
+    assert all(torch.equal(v, values[k]) for k, v in output.items())
+    # x @ A and its slice are computed once, and the constants A, 1.0, -1.0, and 2 are one node each
+    assert sum(fn is cn._OPERATORS['matmul'] for fn, *_ in graph.program) == 1
+    assert sum(not args for _, args, *_ in graph.program) == 4
+    assert graph.nslots == len({k for k in values if k not in data} - {t.name for t in terms}) + len(terms) + 2
+    loss = sum(values[t.name] for t in terms)
+    assert torch.allclose(torch.autograd.grad(sum(output[t.name] for t in terms), [data['x'], weight])[0],
+                          torch.autograd.grad(loss, [data['x'], weight])[0])
+
+
+def test_grouped_constraints_match_terms():
+    x, y = cn.Variable('x'), cn.Variable('y')
+    weight = torch.nn.Parameter(torch.tensor(2.0))
+    terms = [x <= 0.5, x[:, [0]] > y, (x[:, [1]] >= y) ^ 2, weight * (x @ torch.randn(2, 3) == y), (x == torch.zeros(5, 2)) ^ 2,
+             3.0 * ((x[:, 1:] < 0.1) ^ 2), cn.Objective(x ** 2, name='obj')]
+    data = {'x': torch.randn(5, 2, requires_grad=True), 'y': torch.randn(5, 3)}
+    values = dict(data)
+    for term in terms:
+        values.update(term(values))
+    graph = cn.LossGraph(terms, group_constraints=True, loss_key='loss')
+    output = graph(data)
+    assert set(output) == set(values) - set(data) | {'loss'}
+    assert all(torch.allclose(v, output[k]) for k, v in values.items() if k not in data)
+    assert sum(isinstance(fn, cn._ConstraintGroup) for fn, *_ in graph.program) == 4
+    loss = sum(values[t.name] for t in terms)
+    assert torch.allclose(output['loss'], loss)
+    grads = torch.autograd.grad(output['loss'], [data['x'], weight])
+    assert all(torch.allclose(a, b) for a, b in zip(grads, torch.autograd.grad(loss, [data['x'], weight])))
+
+
+def test_grouped_constraints_keep_dtypes_and_weight_shapes():
+    x, z = cn.Variable('x'), cn.Variable('z')
+    terms = [x <= 0.5, z >= 0.0, torch.tensor([2.0]) * (x >= -0.5), torch.tensor(3.0, dtype=torch.float64) * (x <= 1.0)]
+    data = {'x': torch.randn(5, 2), 'z': torch.randn(5, 2, dtype=torch.float64)}
+    values = dict(data)
+    for term in terms:
+        values.update(term(values))
+    output = cn.LossGraph(terms, group_constraints=True, loss_key='loss')(data)
+    for term in terms:
+        assert output[term.name].dtype == values[term.name].dtype
+        assert torch.allclose(output[term.name], values[term.name].reshape(()))
+    assert torch.allclose(output['loss'].double(), sum(values[t.name].double() for t in terms))
@@ -0,0 +1,426 @@
+import os
+import tempfile
+
+from hypothesis import given, settings, strategies as st
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from neuromancer.dataset import (
+    _group_by_exp_id,
+    DatasetCache,
+    SequenceDataset,
+    StaticDataset,
+    MemmapSequenceDataset,
+    StreamingSequenceDataset,
+    accumulate_stats,
+    finalize_stats,
+    merge_stats,
+    normalize_data,
+    read_file,
+    stream_stats,
+    split_sequence_data,
+    write_memmap,
+)
+
+
+def get_sequence_data(nsim, dims, seed=0):
+    rng = np.random.default_rng(seed)
+    return {k: rng.standard_normal((nsim, d)) for k, d in dims.items()}
+
+
+@given(
+    st.integers(20, 300),
+    st.integers(1, 8),
+    st.booleans(),
+    st.integers(1, 64),
+)
+@settings(max_examples=25, deadline=None)
+def test_memmap_dataset_matches_sequence_dataset(nsim, nsteps, moving_horizon, page_size):
+    data = get_sequence_data(nsim, {"Y": 3, "U": 2, "D": 1})
+    reference = SequenceDataset(data, nsteps=nsteps, moving_horizon=moving_horizon)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.npy")
+        variables = write_memmap(data, path)
+        dataset = MemmapSequenceDataset(
+            path, variables, nsteps=nsteps, moving_horizon=moving_horizon,
+            page_size=page_size, cache_size=2,
+        )
+        assert len(dataset) == len(reference)
+        for i in range(len(dataset)):
+            expected, sample = reference[i], dataset[i]
+            assert expected.keys() == sample.keys()
+            for k in expected:
+                assert torch.equal(expected[k], sample[k])
+        assert len(dataset._pages) <= 2
+
+
+def test_memmap_dataset_raw_binary():
+    data = get_sequence_data(100, {"Y": 2, "U": 1})
+    reference = SequenceDataset(data, nsteps=4)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.bin")
+        np.concatenate([data["Y"], data["U"]], axis=1).astype(np.float32).tofile(path)
+        dataset = MemmapSequenceDataset(path, {"Y": 2, "U": 1}, nsteps=4, page_size=16)
+        batch = dataset.collate_fn([dataset[i] for i in range(len(dataset))])
+        expected = reference.collate_fn([reference[i] for i in range(len(reference))])
+        for k in ["Yp", "Yf", "Up", "Uf"]:
+            assert torch.equal(batch[k], expected[k])
+        full, expected = dataset.get_full_sequence(), reference.get_full_sequence()
+        for k in ["Yp", "Yf", "Up", "Uf"]:
+            assert torch.equal(full[k], expected[k])
+
+
+def write_csv(path, data, exp_ids=None):
+    columns = {}
+    for k, v in data.items():
+        columns.update({f"{k.lower()}{i}": v[:, i] for i in range(v.shape[1])})
+    if exp_ids is not None:
+        columns["exp_id"] = exp_ids
+    pd.DataFrame(columns).to_csv(path, index=False)
+
+
+@given(
+    st.integers(1, 6),
+    st.booleans(),
+    st.integers(1, 40),
+)
+@settings(max_examples=25, deadline=None)
+def test_streaming_dataset_matches_sequence_dataset(nsteps, moving_horizon, chunksize):
+    lengths = [57, 43]
+    data = [get_sequence_data(n, {"Y": 2, "U": 1}, seed=i) for i, n in enumerate(lengths)]
+    expected = []
+    for d in data:
+        reference = SequenceDataset(d, nsteps=nsteps, moving_horizon=moving_horizon)
+        expected += [reference[i] for i in range(len(reference))]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(
+            path,
+            {k: np.concatenate([d[k] for d in data]) for k in ["Y", "U"]},
+            exp_ids=np.repeat(np.arange(len(lengths)), lengths),
+        )
+        dataset = StreamingSequenceDataset(
+            path, nsteps=nsteps, moving_horizon=moving_horizon, chunksize=chunksize,
+        )
+        samples = list(dataset)
+    assert len(samples) == len(expected)
+    for sample, reference in zip(samples, expected):
+        assert sample.keys() == reference.keys()
+        for k in sample:
+            assert torch.allclose(sample[k], reference[k])
+
+
+def test_streaming_dataset_normalization():
+    data = get_sequence_data(80, {"Y": 2, "U": 1})
+    norm_data, stats = normalize_data(data, "zero-one")
+    reference = SequenceDataset(norm_data, nsteps=4)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(path, data)
+        dataset = StreamingSequenceDataset(path, nsteps=4, chunksize=7, norm_type="zero-one", stats=stats)
+        batch = dataset.collate_fn(list(dataset))
+    expected = reference.collate_fn([reference[i] for i in range(len(reference))])
+    for k in expected:
+        if k != "name":
+            assert torch.allclose(batch[k], expected[k], atol=1e-6)
+
+
+@given(
+    st.integers(1, 8),
+    st.booleans(),
+    st.integers(1, 32),
+)
+@settings(max_examples=25, deadline=None)
+def test_sequence_dataset_batched_access(nsteps, moving_horizon, batch_size):
+    dataset = SequenceDataset(
+        get_sequence_data(120, {"Y": 3, "U": 2}), nsteps=nsteps, moving_horizon=moving_horizon,
+    )
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, collate_fn=dataset.collate_fn)
+    start = 0
+    for batch in loader:
+        indices = list(range(start, min(start + batch_size, len(dataset))))
+        expected = dataset.collate_fn([dataset[i] for i in indices])
+        assert batch.keys() == expected.keys()
+        for k, v in expected.items():
+            if k == "name":
+                assert batch[k] == v
+            else:
+                assert batch[k].shape == v.shape
+                assert torch.equal(batch[k], v)
+        start += batch_size
+    assert start >= len(dataset)
+
+
+def test_static_dataset_batched_access():
+    dataset = StaticDataset(get_sequence_data(50, {"x": 3, "p": 1}))
+    indices = [4, 0, 17, 3, 49]
+    batch = dataset.collate_fn(dataset.__getitems__(indices))
+    expected = dataset.collate_fn([dataset[i] for i in indices])
+    assert batch.keys() == expected.keys()
+    for k in ["x", "p"]:
+        assert torch.equal(batch[k], expected[k])
+
+
+@given(
+    st.integers(1, 3),
+    st.integers(1, 6),
+    st.booleans(),
+)
+@settings(max_examples=20, deadline=None)
+def test_sequence_dataset_construction(nsequences, nsteps, moving_horizon):
+    data = [get_sequence_data(40 + 7 * i, {"Y": 3, "U": 2, "D": 1}, seed=i) for i in range(nsequences)]
+    dataset = SequenceDataset(data if nsequences > 1 else data[0], nsteps=nsteps, moving_horizon=moving_horizon)
+    full_data = torch.cat(
+        [torch.cat([torch.tensor(d[k], dtype=torch.float) for k in dataset.variables], dim=1) for d in data],
+        dim=0,
+    )
+    assert dataset.full_data.dtype == torch.float32
+    assert torch.equal(dataset.full_data, full_data)
+    if nsequences == 1:
+        assert dataset.batched_data.untyped_storage().data_ptr() == dataset.full_data.untyped_storage().data_ptr()
+
+
+STORAGE_TOLERANCE = {torch.float16: 2e-3, torch.bfloat16: 1e-2, torch.int16: 1e-4}
+
+
+@given(
+    st.sampled_from(list(STORAGE_TOLERANCE)),
+    st.integers(1, 3),
+    st.integers(1, 6),
+    st.booleans(),
+)
+@settings(max_examples=30, deadline=None)
+def test_reduced_precision_storage(storage_dtype, nsequences, nsteps, moving_horizon):
+    data = [get_sequence_data(40 + 7 * i, {"Y": 3, "U": 2, "D": 1}, seed=i) for i in range(nsequences)]
+    data = data if nsequences > 1 else data[0]
+    reference = SequenceDataset(data, nsteps=nsteps, moving_horizon=moving_horizon)
+    dataset = SequenceDataset(data, nsteps=nsteps, moving_horizon=moving_horizon, storage_dtype=storage_dtype)
+    assert dataset.full_data.dtype == storage_dtype
+    assert dataset.full_data.nbytes * 2 == reference.full_data.nbytes
+
+    tol = STORAGE_TOLERANCE[storage_dtype]
+    batch, expected = dataset.get_full_batch(), reference.get_full_batch()
+    for k in reference.variables:
+        for key in [k + "p", k + "f"]:
+            assert batch[key].dtype == torch.float32
+            assert torch.allclose(batch[key], expected[key], rtol=tol, atol=tol)
+    indices = list(range(0, len(dataset), 2))
+    batch = dataset.collate_fn(dataset.__getitems__(indices))
+    expected = reference.collate_fn(reference.__getitems__(indices))
+    for k in reference.variables:
+        assert batch[k + "p"].dtype == torch.float32
+        assert torch.allclose(batch[k + "p"], expected[k + "p"], rtol=tol, atol=tol)
+    sequences, expected = dataset.get_full_sequence(), reference.get_full_sequence()
+    if nsequences == 1:
+        sequences, expected = [sequences], [expected]
+    for s, r in zip(sequences, expected):
+        assert torch.allclose(s["Yf"], r["Yf"], rtol=tol, atol=tol)
+
+    static = StaticDataset(get_sequence_data(50, {"x": 3, "p": 1}), storage_dtype=storage_dtype)
+    batch = static.collate_fn([static[i] for i in [4, 0, 17]])
+    expected = get_sequence_data(50, {"x": 3, "p": 1})
+    assert batch["x"].dtype == torch.float32
+    assert np.allclose(batch["x"].numpy(), expected["x"][[4, 0, 17]], rtol=tol, atol=tol)
+
+
+@given(
+    st.integers(1, 6),
+    st.booleans(),
+    st.sampled_from([None, "zscore", "zero-one"]),
+    st.booleans(),
+)
+@settings(max_examples=10, deadline=None)
+def test_dataset_cache_matches_pipeline(nsteps, moving_horizon, norm_type, multisequence):
+    lengths = [60, 45, 50] if multisequence else [150]
+    data = [get_sequence_data(n, {"Y": 2, "U": 1}, seed=i) for i, n in enumerate(lengths)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(
+            path,
+            {k: np.concatenate([d[k] for d in data]) for k in ["Y", "U"]},
+            exp_ids=np.repeat(np.arange(len(lengths)), lengths) if multisequence else None,
+        )
+        expected = read_file(path)
+        if norm_type is not None:
+            expected, _ = normalize_data(expected, norm_type)
+        expected = split_sequence_data(expected, nsteps, moving_horizon)
+        expected = [SequenceDataset(d, nsteps=nsteps, moving_horizon=moving_horizon) for d in expected]
+
+        cache = DatasetCache(os.path.join(tmp, "cache"))
+        cold, stats = cache.get_sequence_datasets(path, nsteps, moving_horizon, norm_type)
+        warm, warm_stats = cache.get_sequence_datasets(path, nsteps, moving_horizon, norm_type)
+        assert len(os.listdir(cache.cache_dir)) == 1
+        assert stats.keys() == warm_stats.keys()
+        for reference, datasets in zip(expected, zip(cold, warm)):
+            for dataset in datasets:
+                assert len(dataset) == len(reference)
+                batch, reference_batch = dataset.get_full_batch(), reference.get_full_batch()
+                for k in reference.variables:
+                    assert torch.equal(batch[k + "p"], reference_batch[k + "p"])
+                    assert torch.equal(batch[k + "f"], reference_batch[k + "f"])
+                if multisequence:
+                    sequences = dataset.get_full_sequence()
+                    for s, r in zip(sequences, reference.get_full_sequence()):
+                        assert torch.equal(s["Yp"], r["Yp"])
+
+
+@pytest.mark.parametrize("storage_dtype", [torch.bfloat16, torch.int16])
+def test_dataset_cache_reduced_precision(storage_dtype):
+    data = [get_sequence_data(n, {"Y": 2, "U": 1}, seed=i) for i, n in enumerate([60, 45, 50])]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(
+            path,
+            {k: np.concatenate([d[k] for d in data]) for k in ["Y", "U"]},
+            exp_ids=np.repeat(np.arange(3), [60, 45, 50]),
+        )
+        cache = DatasetCache(os.path.join(tmp, "cache"))
+        cold, _ = cache.get_sequence_datasets(path, 3, storage_dtype=storage_dtype)
+        warm, _ = cache.get_sequence_datasets(path, 3, storage_dtype=storage_dtype)
+        cache.get_sequence_datasets(path, 3)
+        assert len(os.listdir(cache.cache_dir)) == 2
+        for c, w in zip(cold, warm):
+            assert w.full_data.dtype == storage_dtype
+            assert torch.equal(c.full_data, w.full_data)
+            for k, v in c.get_full_batch().items():
+                if k != "name":
+                    assert torch.equal(v, w.get_full_batch()[k])
+
+
+def test_dataset_cache_eviction():
+    data = get_sequence_data(300, {"Y": 2, "U": 1})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        write_csv(path, data)
+        cache = DatasetCache(os.path.join(tmp, "cache"), max_bytes=1)
+        cache.get_sequence_datasets(path, nsteps=2)
+        first = cache.key(path, nsteps=2)
+        cache.get_sequence_datasets(path, nsteps=4)
+        assert os.listdir(cache.cache_dir) == [cache.key(path, nsteps=4)]
+        assert first not in os.listdir(cache.cache_dir)
+
+
+@given(
+    st.sampled_from(["zscore", "zero-one", "one-one"]),
+    st.integers(1, 50),
+)
+@settings(max_examples=20, deadline=None)
+def test_streamed_stats_match_normalize_data(norm_type, chunksize):
+    data = [get_sequence_data(n, {"Y": 3, "U": 2}, seed=i) for i, n in enumerate([70, 35, 52])]
+    expected, expected_stats = normalize_data(data, norm_type)
+
+    partials = [accumulate_stats([d]) for d in data]
+    stats = finalize_stats(merge_stats(*partials), norm_type)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, d in enumerate(data):
+            write_csv(os.path.join(tmp, f"data{i}.csv"), d)
+        streamed = stream_stats(tmp, norm_type, chunksize=chunksize)
+
+    for s in [stats, streamed]:
+        assert s.keys() == expected_stats.keys()
+        for k in s:
+            assert np.allclose(s[k], expected_stats[k], rtol=1e-12, atol=1e-12)
+        normalized, _ = normalize_data(data, norm_type, stats=s)
+        for d, e in zip(normalized, expected):
+            for k in e:
+                assert np.allclose(d[k], e[k], rtol=1e-12, atol=1e-12)
+
+
+def test_parallel_read_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(5):
+            data = get_sequence_data(30 + i, {"Y": 2, "U": 1}, seed=i)
+            write_csv(os.path.join(tmp, f"data{i}.csv"), data, exp_ids=np.arange(30 + i) // 10 if i % 2 else None)
+        expected = read_file(tmp)
+        for shared_memory in [False, True]:
+            data = read_file(tmp, num_workers=2, shared_memory=shared_memory)
+            assert len(data) == len(expected)
+            for d, e in zip(data, expected):
+                d, e = (d, e) if isinstance(e, list) else ([d], [e])
+                assert len(d) == len(e)
+                for di, ei in zip(d, e):
+                    assert di.keys() == ei.keys()
+                    for k in ei:
+                        assert np.array_equal(di[k], ei[k])
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="shared memory blocks are listed in /dev/shm")
+def test_shared_memory_blocks_are_released():
+    blocks = set(os.listdir("/dev/shm"))
+    with tempfile.TemporaryDirectory() as tmp:
+        # 16 files give chunks of two, so the empty last file fails after its neighbour is parsed
+        for i in range(15):
+            write_csv(os.path.join(tmp, f"data{i}.csv"), get_sequence_data(20, {"Y": 2, "U": 1}, seed=i))
+        data = read_file(tmp, num_workers=2, shared_memory=True)
+        assert set(os.listdir("/dev/shm")) == blocks
+        view = data[0]["Y"][1:]
+        del data
+        assert np.isfinite(view).all()
+        open(os.path.join(tmp, "data99.csv"), "w").close()
+        with pytest.raises(pd.errors.EmptyDataError):
+            read_file(tmp, num_workers=2, shared_memory=True)
+    assert set(os.listdir("/dev/shm")) == blocks
+
+
+@given(
+    st.lists(st.integers(0, 6), min_size=1, max_size=200),
+    st.booleans(),
+)
+@settings(max_examples=50, deadline=None)
+def test_group_by_exp_id(ids, contiguous):
+    ids = np.array(sorted(ids) if contiguous else ids).reshape(-1, 1)
+    data = get_sequence_data(len(ids), {"Y": 2, "U": 1})
+    groups = _group_by_exp_id(ids, data)
+    expected = [{k: v[ids.flatten() == i, ...] for k, v in data.items()} for i in sorted(set(ids.flatten()))]
+    assert len(groups) == len(expected)
+    for group, reference in zip(groups, expected):
+        for k in reference:
+            assert np.array_equal(group[k], reference[k])
+            if contiguous:
+                assert np.shares_memory(group[k], data[k])
+
+
+def write_columnar(path, data, exp_ids=None):
+    file_type = os.path.splitext(path)[1]
+    if file_type in {".h5", ".hdf5"}:
+        h5py = pytest.importorskip("h5py")
+        with h5py.File(path, "w") as f:
+            for k, v in data.items():
+                f[k.lower()] = v
+            if exp_ids is not None:
+                f["exp_id"] = exp_ids.reshape(-1, 1)
+        return
+    pytest.importorskip("pyarrow")
+    columns = {"notes": ["unused"] * len(next(iter(data.values())))}
+    for k, v in data.items():
+        columns.update({f"{k.lower()}{i}": v[:, i] for i in range(v.shape[1])})
+    if exp_ids is not None:
+        columns["exp_id"] = exp_ids
+    frame = pd.DataFrame(columns)
+    frame.to_parquet(path, row_group_size=17) if file_type == ".parquet" else frame.to_feather(path)
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather", ".h5"])
+def test_columnar_read_file(extension):
+    data = get_sequence_data(90, {"Y": 2, "U": 3, "D": 1})
+    exp_ids = np.arange(90) // 30
+    with tempfile.TemporaryDirectory() as tmp:
+        write_csv(os.path.join(tmp, "data.csv"), data, exp_ids=exp_ids)
+        write_columnar(os.path.join(tmp, "data" + extension), data, exp_ids=exp_ids)
+        expected = read_file(os.path.join(tmp, "data.csv"))
+        result = read_file(os.path.join(tmp, "data" + extension))
+        assert len(result) == len(expected) == 3
+        for r, e in zip(result, expected):
+            assert r.keys() == e.keys()
+            for k in e:
+                assert np.allclose(r[k], e[k], rtol=1e-12, atol=0)
+
+        expected = list(StreamingSequenceDataset(os.path.join(tmp, "data.csv"), nsteps=4, chunksize=11))
+        samples = list(StreamingSequenceDataset(os.path.join(tmp, "data" + extension), nsteps=4, chunksize=11))
+        assert len(samples) == len(expected)
+        for sample, reference in zip(samples, expected):
+            for k in reference:
+                assert torch.allclose(sample[k], reference[k])
@@ -0,0 +1,36 @@
+from hypothesis import given, settings, strategies as st
+import torch
+
+from neuromancer.metrics import MetricAccumulator, batch_size
+
+
+@given(st.lists(st.integers(1, 20), min_size=1, max_size=6))
+@settings(max_examples=20, deadline=None)
+def test_weighted_mean_matches_full_data(sizes):
+    samples = torch.randn(sum(sizes))
+    metrics = MetricAccumulator(["loss"])
+    batch_means = []
+    for x in samples.split(sizes):
+        batch_means.append(x.mean())
+        metrics.update({"loss": x.mean()}, weight=len(x))
+    summary = metrics.summary()
+    assert torch.allclose(summary["mean_loss"], samples.mean(), atol=1e-6)
+    assert summary["min_loss"] == min(batch_means) and summary["max_loss"] == max(batch_means)
+
+
+def test_accumulated_values_are_detached():
+    w = torch.randn(3, requires_grad=True)
+    metrics = MetricAccumulator(["loss"])
+    metrics.register("reg")
+    for _ in range(3):
+        metrics.update({"loss": (w ** 2).sum(), "reg": w.abs().sum(), "other": w.sum()}, weight=2)
+    means = metrics.means()
+    assert set(means) == {"mean_loss", "mean_reg"}
+    assert not any(v.requires_grad for v in metrics.summary().values())
+    assert torch.allclose(means["mean_loss"], (w ** 2).sum())
+
+
+def test_batch_size():
+    assert batch_size({"x": torch.zeros(5, 2), "name": "train"}) == 5
+    assert batch_size({"Yp": torch.zeros(4, 7, 2), "name": "nstep_train"}) == 7
+    assert batch_size({"name": "train"}) == 1
@@ -0,0 +1,248 @@
+from copy import deepcopy
+import pickle
+import threading
+
+import pytest
+import torch
+
+from neuromancer.component import Function
+from neuromancer.constraint import Loss, Objective, Variable
+from neuromancer.problem import Problem
+
+
+def get_problem(**kwargs):
+    torch.manual_seed(0)
+    model = Function(torch.nn.Sequential(torch.nn.Linear(3, 8), torch.nn.Tanh(), torch.nn.Linear(8, 2)),
+                     ["x"], ["yhat"], name="model")
+    yhat = Variable("yhat_model")
+    objectives = [Loss(["yhat_model", "y"], torch.nn.functional.mse_loss, name="fit"),
+                  Objective(yhat ** 2, weight=0.1, name="reg")]
+    constraints = [yhat <= 1.0, yhat >= -1.0]
+    return Problem(objectives, constraints, [model], **kwargs)
+
+
+def get_data(nbatch, name="train"):
+    return {"x": torch.randn(nbatch, 3), "y": torch.randn(nbatch, 2), "name": name}
+
+
+def test_compiled_problem_matches_eager():
+    eager = get_problem()
+    # fullgraph raises on any graph break, e.g. from the input and output checks of components
+    compiled = get_problem(torch_compile={"backend": "eager", "fullgraph": True})
+    for nbatch in [16, 16, 5, 5]:
+        data = get_data(nbatch)
+        out_eager, out_compiled = eager(data), compiled(data)
+        assert out_eager.keys() == out_compiled.keys()
+        for k, v in out_eager.items():
+            if isinstance(v, torch.Tensor):
+                assert torch.allclose(v, out_compiled[k])
+        g_eager = torch.autograd.grad(out_eager["train_loss"], list(eager.parameters()))
+        g_compiled = torch.autograd.grad(out_compiled["train_loss"], list(compiled.parameters()))
+        assert all(torch.allclose(a, b) for a, b in zip(g_eager, g_compiled))
+    assert len(compiled._validated) == 2 and compiled._compiled is not None
+
+
+def test_compile_falls_back_to_eager():
+    def failing_backend(gm, example_inputs):
+        raise RuntimeError("unsupported")
+
+    problem = get_problem(torch_compile={"backend": failing_backend})
+    data = get_data(4)
+    expected = problem(data)["train_loss"]
+    with pytest.warns(UserWarning, match="falling back to eager"):
+        assert torch.equal(problem(data)["train_loss"], expected)
+    assert not problem.torch_compile
+
+
+class Failing(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+
+    def forward(self, x):
+        if self.fail:
+            raise ValueError("runtime error")
+        return x
+
+
+def test_compile_raises_runtime_errors():
+    problem = get_problem(torch_compile={"backend": "eager"})
+    failing = Failing()
+    problem.components.append(Function(failing, ["x"], ["xhat"], name="failing"))
+    data = get_data(4)
+    problem(data)
+    problem(data)
+    failing.fail = True
+    with pytest.raises(ValueError, match="runtime error"):
+        problem(data)
+    assert problem.torch_compile
+
+
+def test_compiled_problem_is_picklable():
+    problem = get_problem(torch_compile={"backend": "eager"})
+    data = get_data(4)
+    problem(data), problem(data)
+    for copied in [deepcopy(problem), pickle.loads(pickle.dumps(problem))]:
+        assert copied._compiled is None and not copied._validated
+        assert torch.equal(copied(data)["train_loss"], problem(data)["train_loss"])
+
+
+def test_plan_matches_eager():
+    eager, planned = get_problem(), get_problem(plan=True)
+    for data in [get_data(8), get_data(8), get_data(3, name="dev"), get_data(3, name="dev")]:
+        out_eager, out_planned = eager(data), planned(data)
+        assert list(out_eager) == list(out_planned)
+        for k, v in out_eager.items():
+            if isinstance(v, torch.Tensor):
+                assert torch.equal(v, out_planned[k])
+        g_eager = torch.autograd.grad(out_eager[f"{data['name']}_loss"], list(eager.parameters()))
+        g_planned = torch.autograd.grad(out_planned[f"{data['name']}_loss"], list(planned.parameters()))
+        assert all(torch.equal(a, b) for a, b in zip(g_eager, g_planned))
+    assert len(planned._plans) == 2
+
+
+def test_plan_validates_once_and_keeps_user_hooks():
+    problem = get_problem(plan=True)
+    model = problem.components[0]
+    checks, calls = [], []
+    model._check_inputs = lambda module, inputs: checks.append(1)
+    model._forward_pre_hooks.clear()
+    model.register_forward_pre_hook(model._check_inputs)
+    data = get_data(4)
+    for _ in range(3):
+        problem(data)
+    assert len(checks) == 1
+
+    problem = get_problem(plan=True)
+    problem.components[0].register_forward_hook(lambda module, inputs, output: calls.append(1))
+    for _ in range(3):
+        problem(data)
+    assert len(calls) == 3
+
+
+def test_plan_is_rebuilt_for_new_keys():
+    problem = get_problem(plan=True)
+    problem(get_data(4))
+    with pytest.raises(AssertionError, match="Missing inputs"):
+        problem({"y": torch.randn(4, 2), "name": "train"})
+    data = {**get_data(4), "extra": torch.randn(4)}
+    assert "train_extra" in problem(data) and "train_extra" in problem(data)
+
+
+class Counter(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def forward(self, z):
+        self.calls += 1
+        return 2 * z
+
+
+def get_two_branch_problem(**kwargs):
+    problem = get_problem(**kwargs)
+    counter = Counter()
+    problem.components.append(Function(counter, ["z"], ["zhat"], name="sim"))
+    problem.objectives.append(Objective(Variable("zhat_sim") ** 2, name="sim_loss"))
+    return problem, counter
+
+
+@pytest.mark.parametrize("plan", [False, True])
+def test_demand_driven_evaluation(plan):
+    problem, counter = get_two_branch_problem(plan=plan)
+    data = {**get_data(4), "z": torch.randn(4, 1)}
+    full = problem(data)
+    assert counter.calls == 1
+    for _ in range(2):
+        output = problem(data, output_keys=["train_fit", "dev_sim_loss"])
+        assert counter.calls == 1
+        assert torch.equal(output["train_fit"], full["train_fit"])
+        assert "train_loss" not in output and "train_zhat_sim" not in output
+    output = problem(data, output_keys=["train_zhat_sim"])
+    assert counter.calls == 2 and "train_fit" not in output and "train_yhat_model" not in output
+    output = problem(data, output_keys=["train_loss"])
+    assert counter.calls == 3 and torch.equal(output["train_loss"], full["train_loss"])
+    with pytest.raises(AssertionError, match="not computed"):
+        problem(data, output_keys=["train_unknown"])
+
+
+def test_dependencies_trace_variable_trees():
+    problem, _ = get_two_branch_problem()
+    components, terms = problem.dependencies(["yhat_model_lt_1.0=1.0"], ["x", "y", "z", "name"])
+    assert [c.name for c in components] == ["model"] and [t.name for t in terms] == ["yhat_model_lt_1.0=1.0"]
+    components, terms = problem.dependencies(["loss"], ["x", "y", "z", "name"])
+    assert len(components) == 2 and terms is None
+
+
+def get_diamond_problem(**kwargs):
+    problem, _ = get_two_branch_problem(**kwargs)
+    problem.components.append(Function(lambda y, z: y.sum(-1, keepdim=True) + z, ["yhat_model", "zhat_sim"],
+                                       ["w"], name="join"))
+    problem.objectives.append(Objective(Variable("w_join") ** 2, name="join_loss"))
+    return problem
+
+
+def test_levels_follow_key_dependencies():
+    problem = get_diamond_problem()
+    levels = problem.levels(list(problem.components), ["x", "y", "z", "name"])
+    assert [[c.name for c in level] for level in levels] == [["model", "sim"], ["join"]]
+    unkeyed = lambda data: {"v": data["w_join"]}
+    levels = problem.levels([*problem.components, unkeyed], ["x", "y", "z", "name"])
+    assert [len(level) for level in levels] == [2, 1, 1]
+    levels = problem.levels([unkeyed, *problem.components], ["x", "y", "z", "name"])
+    assert levels[0] == [unkeyed] and [len(level) for level in levels[1:]] == [2, 1]
+
+
+def test_concurrent_matches_sequential():
+    sequential, concurrent = get_diamond_problem(), get_diamond_problem(concurrent=2)
+    threads = []
+    concurrent.components[1].register_forward_hook(lambda *_: threads.append(threading.current_thread().name))
+    data = {**get_data(4), "z": torch.randn(4, 1)}
+    for grad in [True, False]:
+        with torch.set_grad_enabled(grad):
+            out_sequential, out_concurrent = sequential(data), concurrent(data)
+        assert list(out_sequential) == list(out_concurrent)
+        for k, v in out_sequential.items():
+            if isinstance(v, torch.Tensor):
+                assert torch.equal(v, out_concurrent[k])
+                assert out_concurrent[k].requires_grad == (grad and v.requires_grad)
+    g_sequential = torch.autograd.grad(sequential(data)["train_loss"], list(sequential.parameters()))
+    g_concurrent = torch.autograd.grad(concurrent(data)["train_loss"], list(concurrent.parameters()))
+    assert all(torch.equal(a, b) for a, b in zip(g_sequential, g_concurrent))
+    assert threads and all(name.startswith("problem") for name in threads)
+    assert deepcopy(concurrent)(data).keys() == out_concurrent.keys()
+
+
+def test_close_stops_threads():
+    problem = get_diamond_problem(concurrent=2)
+    data = {**get_data(4), "z": torch.randn(4, 1)}
+    before = set(threading.enumerate())
+    problem(data)
+    started = [t for t in threading.enumerate() if t not in before and t.name.startswith("problem")]
+    assert started
+    problem.close()
+    assert not any(t.is_alive() for t in started)
+    assert problem(data).keys() == get_diamond_problem()(data).keys()
+    problem.close()
+
+
+@pytest.mark.parametrize("plan", [False, True])
+def test_loss_graph_matches_eager(plan):
+    eager, fused = get_diamond_problem(), get_diamond_problem(plan=plan, loss_graph=True)
+    data = {**get_data(4), "z": torch.randn(4, 1)}
+    for _ in range(2):
+        out_eager, out_fused = eager(data), fused(data)
+        assert list(out_eager) == list(out_fused)
+        assert all(torch.equal(v, out_fused[k]) for k, v in out_eager.items() if isinstance(v, torch.Tensor))
+    output = fused(data, output_keys=["train_sim_loss"])
+    assert torch.equal(output["train_sim_loss"], out_eager["train_sim_loss"]) and "train_fit" not in output
+    assert len(fused._loss_graphs) == 2
+
+
+@pytest.mark.parametrize("plan", [False, True])
+def test_grouped_constraints_match_eager(plan):
+    eager, grouped = get_problem(), get_problem(plan=plan, loss_graph={"group_constraints": True})
+    for data in [get_data(4), get_data(3, "dev"), get_data(4)]:
+        out_eager, out_grouped = eager(data), grouped(data)
+        assert set(out_eager) == set(out_grouped)
+        assert all(torch.allclose(v, out_grouped[k]) for k, v in out_eager.items() if isinstance(v, torch.Tensor))
@@ -0,0 +1,66 @@
+from hypothesis import given, settings, strategies as st
+import torch
+
+from neuromancer import arg
+from neuromancer.sweep import Sweep, grid_search, random_search
+
+
+def train_fn(args, state):
+    """Metric is minimized at lr=0.01, improves with training epochs, and records resumed epochs."""
+    resumed = [] if state is None else state["epochs"]
+    metric = (args.lr - 0.01) ** 2 + 1.0 / args.epochs + 0.001 * args.nx_hidden
+    return metric, {"epochs": resumed + [args.epochs], "threads": torch.get_num_threads()}
+
+
+def get_parser():
+    return arg.ArgParser(parents=[arg.opt(), arg.ssm()])
+
+
+@given(st.dictionaries(st.sampled_from("abcd"), st.lists(st.integers(), min_size=1, max_size=3), min_size=1))
+@settings(max_examples=50, deadline=None)
+def test_grid_search(space):
+    trials = grid_search(space)
+    assert len(trials) == torch.tensor([len(v) for v in space.values()]).prod().item()
+    for t in trials:
+        assert all(t[k] in space[k] for k in space)
+
+
+def test_random_search():
+    space = {"lr": (1e-4, 1e-1), "nx_hidden": (4, 8), "act": ["relu", "gelu"]}
+    trials = random_search(space, 20, seed=1)
+    assert trials == random_search(space, 20, seed=1)
+    for t in trials:
+        assert 1e-4 <= t["lr"] <= 1e-1
+        assert isinstance(t["nx_hidden"], int) and 4 <= t["nx_hidden"] <= 8
+        assert t["act"] in space["act"]
+
+
+def test_sweep_successive_halving():
+    lrs = [1e-4, 1e-3, 1e-2, 1e-1, 0.5, 1.0, 2.0, 3.0, 4.0]
+    sweep = Sweep(
+        train_fn, get_parser(), {"OPTIMIZATION": {"lr": lrs}, "SSM": {"nx_hidden": [10]}},
+        workers=2, threads_per_worker=1, min_epochs=1, max_epochs=9, eta=3,
+    )
+    assert sweep.budgets() == [1, 3, 9]
+    results = sweep.run()
+    assert [r["epochs"] for r in results] == [9, 3, 3] + [1] * 6
+    assert results[0]["params"]["lr"] == 1e-2
+    assert {r["params"]["lr"] for r in results[:3]} == {1e-3, 1e-2, 1e-4}
+    assert sorted(r["metric"] for r in results[3:]) == [r["metric"] for r in results[3:]]
+
+
+def _check_state(args, state):
+    # trials resume from the state returned at their previous rung, in workers with pinned threads
+    assert state is None or state["epochs"] == [args.epochs // 2]
+    metric, state = train_fn(args, state)
+    assert state["threads"] == 1
+    return metric, state
+
+
+def test_sweep_resumes_from_state():
+    sweep = Sweep(
+        _check_state, get_parser(), {"OPTIMIZATION": {"lr": [1e-3, 1e-2]}},
+        workers=1, threads_per_worker=1, min_epochs=2, max_epochs=4, eta=2,
+    )
+    results = sweep.run()
+    assert [(r["params"]["lr"], r["epochs"]) for r in results] == [(1e-2, 4), (1e-3, 2)]
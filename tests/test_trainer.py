@@ -0,0 +1,426 @@
+from datetime import timedelta
+import functools
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader
+
+from neuromancer.callbacks import Callback, OptimizerSwitch
+from neuromancer.checkpoint import AsyncCheckpointer, copy_state
+from neuromancer.component import Function
+from neuromancer.constraint import Loss
+from neuromancer.dataset import SequenceDataset, StaticDataset
+from neuromancer.ensemble import EnsembleTrainer
+from neuromancer.loggers import BasicLogger
+from neuromancer.problem import Problem
+from neuromancer.trainer import Trainer, DistributedTrainer, get_distributed_dataloader, merge_outputs, split_batch
+
+
+def get_problem(seed=0):
+    torch.manual_seed(seed)
+    model = Function(torch.nn.Linear(3, 2), ["x"], ["yhat"], name="model")
+    loss = Loss(["yhat_model", "y"], torch.nn.functional.mse_loss, name="fit")
+    return Problem([loss], [], [model])
+
+
+def get_datasets(nsamples=64, seed=0):
+    rng = np.random.default_rng(seed)
+    datasets = []
+    for name in ["train", "dev", "test"]:
+        x = rng.standard_normal((nsamples, 3))
+        y = x @ rng.standard_normal((3, 2))
+        datasets.append(StaticDataset({"x": x, "y": y}, name=name))
+    return datasets
+
+
+def get_noisy_datasets(nsamples=64, seed=0):
+    """
+    Splits of one noisy linear map, so that dev losses plateau and early stopping triggers.
+    """
+    rng = np.random.default_rng(seed)
+    weight = rng.standard_normal((3, 2))
+    datasets = []
+    for name in ["train", "dev", "test"]:
+        x = rng.standard_normal((nsamples, 3))
+        y = x @ weight + 0.1 * rng.standard_normal((nsamples, 2))
+        datasets.append(StaticDataset({"x": x, "y": y}, name=name))
+    return datasets
+
+
+OPTIMIZERS = {
+    "sgd": functools.partial(torch.optim.SGD, lr=0.1),
+    "lbfgs": functools.partial(torch.optim.LBFGS, max_iter=5),
+    "adam": functools.partial(torch.optim.Adam, lr=0.01),
+}
+
+
+def get_trainer(cls, problem, loaders, savedir, epochs, optimizer="sgd", **kwargs):
+    return cls(
+        problem, *loaders, OPTIMIZERS[optimizer](problem.parameters()),
+        logger=BasicLogger(savedir=savedir, verbosity=1000, stdout=[]),
+        epochs=epochs, patience=epochs, train_metric="train_loss", dev_metric="dev_loss",
+        test_metric="test_loss", eval_metric="mean_dev_loss", **kwargs,
+    )
+
+
+def _train_rank(rank, world_size, init_file, savedir, epochs, optimizer):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    datasets = get_datasets()
+    loaders = [
+        get_distributed_dataloader(d, batch_size=len(d) // world_size, shuffle=False) for d in datasets
+    ]
+    problem = get_problem(seed=rank)  # replicas are synchronized to rank 0 on construction
+    trainer = get_trainer(DistributedTrainer, problem, loaders, os.path.join(savedir, str(rank)), epochs, optimizer)
+    best_model = trainer.train()
+    output = trainer.test(best_model)
+    torch.save({"state": problem.state_dict(), "loss": output["mean_test_loss"]},
+               os.path.join(savedir, f"rank{rank}.pth"))
+    dist.destroy_process_group()
+
+
+def _eval_time_rank(rank, world_size, init_file, savedir, epochs):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size,
+                            timeout=timedelta(seconds=60))
+    datasets = get_datasets()
+    loaders = [get_distributed_dataloader(d, batch_size=len(d) // world_size, shuffle=False) for d in datasets]
+    # clocks of the processes disagree: evaluations are always due on rank 0 and never by time on rank 1
+    trainer = get_trainer(DistributedTrainer, get_problem(), loaders, os.path.join(savedir, str(rank)), epochs,
+                          eval_interval=epochs, eval_time=0.0 if rank == 0 else None)
+    evals, evaluate_dev = [], trainer.evaluate_dev
+    trainer.evaluate_dev = lambda: evals.append(trainer.current_epoch) or evaluate_dev()
+    trainer.train()
+    torch.save(evals, os.path.join(savedir, f"evals{rank}.pth"))
+    dist.destroy_process_group()
+
+
+def test_distributed_eval_time_is_decided_by_rank_zero():
+    epochs, world_size = 3, 2
+    with tempfile.TemporaryDirectory() as tmp:
+        mp.spawn(_eval_time_rank, args=(world_size, os.path.join(tmp, "init"), tmp, epochs), nprocs=world_size)
+        evals = [torch.load(os.path.join(tmp, f"evals{r}.pth")) for r in range(world_size)]
+    assert evals == [list(range(epochs))] * world_size
+
+
+@pytest.mark.parametrize("optimizer", ["sgd", "lbfgs"])
+def test_distributed_trainer_matches_full_batch_training(optimizer):
+    epochs, world_size = 5, 2
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=len(d), collate_fn=d.collate_fn) for d in datasets]
+    with tempfile.TemporaryDirectory() as tmp:
+        problem = get_problem(seed=0)
+        trainer = get_trainer(Trainer, problem, loaders, os.path.join(tmp, "serial"), epochs, optimizer)
+        output = trainer.test(trainer.train())
+
+        mp.spawn(_train_rank, args=(world_size, os.path.join(tmp, "init"), tmp, epochs, optimizer), nprocs=world_size)
+        results = [torch.load(os.path.join(tmp, f"rank{r}.pth")) for r in range(world_size)]
+        for result in results:
+            for k, v in problem.state_dict().items():
+                assert torch.allclose(result["state"][k], v, atol=1e-5)
+            assert torch.allclose(result["loss"], output["mean_test_loss"], atol=1e-5)
+        assert os.path.exists(os.path.join(tmp, "0", "best_model.pth"))
+        assert not os.path.exists(os.path.join(tmp, "1", "best_model.pth"))
+
+
+@pytest.mark.parametrize("lr", [0.1, 0.7])
+def test_ensemble_trainer_matches_serial_training(lr):
+    epochs, patience, nmembers = 8, 1, 4
+    datasets = get_noisy_datasets()
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in datasets]
+    kwargs = dict(epochs=epochs, patience=patience, train_metric="train_loss", dev_metric="dev_loss",
+                  test_metric="test_loss", eval_metric="mean_dev_loss")
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = BasicLogger(savedir=tmp, verbosity=1000, stdout=[])
+        ensemble = EnsembleTrainer(
+            [get_problem(seed=i) for i in range(nmembers)], *loaders,
+            optimizer=functools.partial(torch.optim.SGD, lr=lr), logger=logger, **kwargs,
+        )
+        best_models = ensemble.train()
+        output = ensemble.test()
+        for i in range(nmembers):
+            problem = get_problem(seed=i)
+            trainer = Trainer(problem, *loaders, torch.optim.SGD(problem.parameters(), lr=lr), logger=logger, **kwargs)
+            expected = trainer.test(trainer.train())
+            for k, v in trainer.best_model.items():
+                assert torch.allclose(best_models[i][k], v, atol=1e-5)
+            assert torch.allclose(output["mean_test_loss"][i], expected["mean_test_loss"], atol=1e-5)
+
+
+def test_lbfgs_converges_to_least_squares():
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=len(d), collate_fn=d.collate_fn) for d in datasets]
+    x, y = datasets[0].full_data[:, :3].double(), datasets[0].full_data[:, 3:].double()
+    x1 = torch.cat([x, torch.ones(len(x), 1, dtype=x.dtype)], dim=1)
+    residual = y - x1 @ torch.linalg.lstsq(x1, y).solution
+    optimum = residual.pow(2).mean().item()
+    with tempfile.TemporaryDirectory() as tmp:
+        problem = get_problem()
+        trainer = get_trainer(Trainer, problem, loaders, tmp, epochs=4, optimizer="lbfgs")
+        trainer.train()
+        output = trainer.test(trainer.best_model)
+    assert abs(output["mean_train_loss"].item() - optimum) < 1e-4
+
+
+def test_optimizer_switch():
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in datasets]
+    switch = OptimizerSwitch(OPTIMIZERS["lbfgs"], epoch=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        problem = get_problem()
+        trainer = get_trainer(Trainer, problem, loaders, tmp, epochs=5, callback=switch)
+        optimizer = trainer.optimizer
+        trainer.train()
+    assert switch.switched and isinstance(trainer.optimizer, torch.optim.LBFGS)
+    assert trainer.optimizer is not optimizer
+    assert trainer.optimizer.state_dict()["state"][0]["func_evals"] > 0
+
+    switch = OptimizerSwitch(OPTIMIZERS["lbfgs"], tol=1e9)
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=3, callback=switch)
+        trainer.train()
+    assert isinstance(trainer.optimizer, torch.optim.LBFGS)
+
+
+class ClosureSGD(torch.optim.SGD):
+    requires_closure = True
+
+    def step(self, closure=None):
+        assert closure is not None, "ClosureSGD needs a closure"
+        with torch.enable_grad():
+            loss = closure()
+        super().step()
+        return loss
+
+
+def test_closure_optimizer_switch():
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in get_datasets()]
+    switch = OptimizerSwitch(lambda params: ClosureSGD(params, lr=0.1), epoch=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=3, callback=switch)
+        trainer.train()
+    assert isinstance(trainer.optimizer, ClosureSGD)
+
+
+def test_loss_scale_is_exact():
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in datasets]
+    states = []
+    for loss_scale in [1.0, 1024.0]:
+        with tempfile.TemporaryDirectory() as tmp:
+            problem = get_problem()
+            get_trainer(Trainer, problem, loaders, tmp, epochs=3, loss_scale=loss_scale).train()
+            states.append(problem.state_dict())
+    for k in states[0]:
+        assert torch.equal(states[0][k], states[1][k])
+
+
+def test_bfloat16_autocast():
+    datasets = get_datasets(nsamples=256)
+    loaders = [DataLoader(d, batch_size=32, collate_fn=d.collate_fn) for d in datasets]
+    outputs = []
+    for autocast_dtype in [None, torch.bfloat16]:
+        with tempfile.TemporaryDirectory() as tmp:
+            trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=10, autocast_dtype=autocast_dtype)
+            outputs.append(trainer.test(trainer.train()))
+    assert outputs[1]["test_yhat_model"].dtype == torch.bfloat16
+    assert outputs[1]["mean_test_loss"].dtype == torch.float32
+    assert torch.allclose(outputs[1]["mean_test_loss"], outputs[0]["mean_test_loss"], rtol=0.05)
+
+
+@pytest.mark.parametrize("loss_scale", [1.0, 1024.0])
+@pytest.mark.parametrize("micro_batch_size", [7, 16, 64])
+def test_micro_batching_matches_full_batch(micro_batch_size, loss_scale):
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=len(d), collate_fn=d.collate_fn) for d in datasets]
+    states, losses = [], []
+    for size in [None, micro_batch_size]:
+        with tempfile.TemporaryDirectory() as tmp:
+            problem = get_problem()
+            trainer = get_trainer(Trainer, problem, loaders, tmp, epochs=3, micro_batch_size=size,
+                                  loss_scale=1.0 if size is None else loss_scale)
+            trainer.train()
+            states.append(problem.state_dict())
+            losses.append(trainer.train_epoch()["mean_train_loss"])
+    for k in states[0]:
+        assert torch.allclose(states[0][k], states[1][k], atol=1e-6)
+    assert torch.allclose(losses[0], losses[1], atol=1e-6)
+
+
+def test_split_sequence_batch():
+    rng = np.random.default_rng(0)
+    dataset = SequenceDataset({"Y": rng.standard_normal((50, 2))}, nsteps=4, name="train")
+    batch = dataset.get_full_batch()
+    nbatch = batch["Yp"].shape[1]
+    chunks = split_batch(batch, 5)
+    assert [n for _, n in chunks] == [5] * (nbatch // 5) + [nbatch % 5] * (nbatch % 5 > 0)
+    assert all(c["Yp"].shape[:1] == batch["Yp"].shape[:1] and c["name"] == batch["name"] for c, _ in chunks)
+    outputs = [{"Yp": c["Yp"], "loss": c["Yp"].mean()} for c, _ in chunks]
+    merged = merge_outputs(outputs, [n for _, n in chunks])
+    assert torch.equal(merged["Yp"], batch["Yp"])
+    assert torch.allclose(merged["loss"], batch["Yp"].mean())
+
+
+def test_resume_is_exact():
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=8, shuffle=True, collate_fn=d.collate_fn) for d in datasets]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.pth")
+        states = []
+        for epochs, checkpoint_path in [(6, None), (3, path)]:
+            problem = get_problem()
+            trainer = get_trainer(Trainer, problem, loaders, tmp, epochs, "adam", checkpoint_path=checkpoint_path)
+            trainer.lr_scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(trainer.optimizer, patience=1)
+            best_model = trainer.train()
+            states.append((problem.state_dict(), best_model))
+        assert trainer.checkpointer.nsaves == 3 and trainer.checkpointer._executor is None
+
+        problem = get_problem(seed=1)
+        trainer = get_trainer(Trainer, problem, loaders, tmp, 6, "adam")
+        trainer.lr_scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(trainer.optimizer, patience=1)
+        trainer.resume(path)
+        assert all(torch.equal(v, states[1][0][k]) for k, v in problem.state_dict().items())
+        best_model = trainer.train()
+    for k, v in problem.state_dict().items():
+        assert torch.equal(v, states[0][0][k])
+        assert torch.equal(best_model[k], states[0][1][k])
+
+
+def test_resume_after_optimizer_switch():
+    datasets = get_datasets()
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in datasets]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.pth")
+        states = []
+        for epochs, checkpoint_path in [(5, None), (3, path)]:
+            problem = get_problem()
+            switch = OptimizerSwitch(OPTIMIZERS["lbfgs"], epoch=2)
+            get_trainer(Trainer, problem, loaders, tmp, epochs, "adam", callback=switch,
+                        checkpoint_path=checkpoint_path).train()
+            states.append(problem.state_dict())
+
+        with pytest.raises(AssertionError):
+            get_trainer(Trainer, get_problem(), loaders, tmp, 5, "adam").resume(path)
+        problem = get_problem(seed=1)
+        switch = OptimizerSwitch(OPTIMIZERS["lbfgs"], epoch=2)
+        trainer = get_trainer(Trainer, problem, loaders, tmp, 5, "adam", callback=switch)
+        trainer.resume(path)
+        assert switch.switched and isinstance(trainer.optimizer, torch.optim.LBFGS)
+        trainer.train()
+    for k, v in problem.state_dict().items():
+        assert torch.equal(v, states[0][k])
+
+
+def test_copy_state_reuses_buffers():
+    state = {"w": torch.randn(3, 2), "state": {0: {"step": torch.tensor(1.0), "history": [torch.randn(2)]}}}
+    buffers = copy_state(state)
+    w, history = buffers["w"], buffers["state"][0]["history"][0]
+    state["w"].add_(1.0)
+    state["state"][0]["history"].append(torch.randn(2))
+    buffers = copy_state(state, buffers)
+    assert buffers["w"] is w and torch.equal(w, state["w"])
+    assert buffers["state"][0]["history"][0] is not history
+    assert torch.equal(buffers["state"][0]["history"][1], state["state"][0]["history"][1])
+
+
+def test_checkpointer_stops_its_thread():
+    nthreads = threading.active_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.pth")
+        with AsyncCheckpointer(path) as checkpointer:
+            for step in range(2):
+                checkpointer.save({"step": step, "w": torch.randn(3)})
+        assert threading.active_count() == nthreads
+        checkpointer.save({"step": 2, "w": torch.randn(3)})
+        checkpointer.close()
+        assert threading.active_count() == nthreads
+        assert torch.load(path, weights_only=False)["step"] == 2
+
+
+class BestModelRecorder(Callback):
+    def begin_train(self, trainer):
+        self.best_models = []
+
+    def end_eval(self, trainer, output):
+        self.best_models.append((trainer.best_model, copy_state(trainer.best_model)))
+
+
+def test_best_models_are_not_overwritten():
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in get_datasets()]
+    recorder = BestModelRecorder()
+    with tempfile.TemporaryDirectory() as tmp:
+        get_trainer(Trainer, get_problem(), loaders, tmp, 4, "adam", callback=recorder).train()
+    assert len({id(best_model) for best_model, _ in recorder.best_models}) > 1
+    for best_model, snapshot in recorder.best_models:
+        assert all(torch.equal(v, snapshot[k]) for k, v in best_model.items())
+
+
+def test_means_are_weighted_by_batch_size():
+    datasets = get_datasets(nsamples=50)
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = []
+        for batch_size in [50, 16]:
+            loaders = [DataLoader(d, batch_size=batch_size, collate_fn=d.collate_fn) for d in datasets]
+            trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=1, track_metrics=["dev_fit"])
+            outputs.append(trainer.evaluate_data(trainer.dev_data, trainer.dev_metric))
+    assert torch.allclose(outputs[0]["mean_dev_loss"], outputs[1]["mean_dev_loss"], atol=1e-6)
+    assert torch.allclose(outputs[1]["mean_dev_fit"], outputs[0]["mean_dev_fit"], atol=1e-6)
+    assert not outputs[1]["mean_dev_loss"].requires_grad
+
+
+class EvalCounter(Callback):
+    def begin_train(self, trainer):
+        self.epochs = []
+
+    def begin_eval(self, trainer, output):
+        self.epochs.append(trainer.current_epoch)
+
+
+@pytest.mark.parametrize("eval_interval, evals, stop", [(1, [0, 1, 2, 3, 4, 5], 5), (3, [2, 5, 8], 8)])
+def test_patience_is_counted_in_epochs(eval_interval, evals, stop):
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in get_datasets()]
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = EvalCounter()
+        trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=20, callback=counter,
+                              eval_interval=eval_interval)
+        trainer.patience = 4
+        trainer.optimizer.param_groups[0]["lr"] = 0.0  # never improves after the first evaluation
+        trainer.train()
+    assert counter.epochs == evals
+    assert trainer.current_epoch == stop
+
+
+def test_dev_subsample_screens_full_evaluations():
+    datasets = get_noisy_datasets(nsamples=256)
+    loaders = [DataLoader(d, batch_size=32, collate_fn=d.collate_fn) for d in datasets]
+    with tempfile.TemporaryDirectory() as tmp:
+        counter, problem = EvalCounter(), get_problem()
+        rng_state = torch.get_rng_state()
+        trainer = get_trainer(Trainer, problem, loaders, tmp, epochs=10, callback=counter,
+                              dev_subsample=40, eval_rtol=0.0)
+        assert torch.equal(torch.get_rng_state(), rng_state)
+        assert len(trainer.dev_subsample.dataset) == 40
+        trainer.optimizer.param_groups[0]["lr"] = 0.0
+        trainer.train()
+        assert counter.epochs == [0]
+        counter = EvalCounter()
+        trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=10, callback=counter,
+                              dev_subsample=40, eval_rtol=0.0)
+        trainer.train()
+    # training improves the subsample loss, so improvements are confirmed on the full dev data
+    assert len(counter.epochs) > 2 and trainer.badcount < 10
+
+
+def test_lazy_eval():
+    loaders = [DataLoader(d, batch_size=16, collate_fn=d.collate_fn) for d in get_datasets()]
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = []
+        for lazy_eval in [False, True]:
+            trainer = get_trainer(Trainer, get_problem(), loaders, tmp, epochs=1, lazy_eval=lazy_eval)
+            outputs.append(trainer.evaluate_data(trainer.dev_data, "dev_fit"))
+    assert torch.equal(outputs[0]["mean_dev_fit"], outputs[1]["mean_dev_fit"])
+    assert "dev_loss" in outputs[0] and "dev_loss" not in outputs[1]